@@ -7,15 +7,28 @@ import torch
 import torch.nn as nn
 import torch.optim as optim
 
-from src.model.LANLWordModel import LANLWordModel
+import src.tools.misc as miscTool
+from src.model.ModelBundle import ModelBundle, loadCheckpoint
 from src.tools.ModelSave import ModelSave
 from src.tools.Paths import Paths
 from src.tools.ProgramArguments import ProgramArguments
-from src.tools.Timer import Timer
+from src.tools.Instrumentation import Instrumentation
+from src.tools.Profiling import StageProfiler
 from src.tools.line.LinesTools import LinesTools
+from src.tools.metrics.MetricsWriter import MetricsWriter
 
 
-def LANLAnoClassif(corpusName, pathAllData, wordModelFilename, desiredBatchSize, desiredLinesPerBatch, slidingWindowRenewRate, nu, eps):
+def LANLAnoClassif(corpusName, pathAllData, wordModelFilename, desiredBatchSize, desiredLinesPerBatch, slidingWindowRenewRate, nu, eps, dedupWindowSize=None, profilePath=""):
+    """
+    Calibrate hypersphere center c and radius R of each position, starting from trained word models
+    :param dedupWindowSize: If not None, identical lines are collapsed in windows of dedupWindowSize lines (0 = whole train dataset).
+                            c is calculated with sums weighted by line counts, R with weighted loss and weighted quantile. Needs desiredLinesPerBatch = 1
+    :param profilePath: If not empty, directory where the profiling results are written (see StageProfiler)
+    :return: Path of the saved anomaly classifier
+    """
+
+    if dedupWindowSize is not None and desiredLinesPerBatch != 1:
+        raise ValueError("Deduplication of lines needs 1 line per batch unit")
 
     paths = Paths(pathAllData, corpusName)
 
@@ -23,6 +36,24 @@ def LANLAnoClassif(corpusName, pathAllData, wordModelFilename, desiredBatchSize,
     logger = logging.getLogger()
     logger.setLevel(logging.ERROR)
 
+    # Timers and counters of the calibration. If paths are not empty, they are exported every metricsExportInterval seconds
+    metricsJsonLinesPath = "" # Snapshots appended as JSON lines
+    metricsPrometheusPath = "" # Prometheus text file (e.g. for the textfile collector of node_exporter)
+    metricsExportInterval = 60
+    instrumentation = Instrumentation(metricsJsonLinesPath, metricsPrometheusPath, metricsExportInterval)
+
+    # Profiling mode : if profilePath is not empty, a window of batches of the calibration of R (forward and backward passes) is profiled
+    # by torch.profiler and memory is traced at each step
+    profileSkipBatches = 10 # First batches are not profiled
+    profileWarmupBatches = 2
+    profiledBatches = 20
+    profiler = StageProfiler(profilePath, "calibration", profileSkipBatches, profileWarmupBatches, profiledBatches)
+
+    # If not empty, progress, R of each position and timers are written as records in files (see MetricsWriter, read with loadMetrics)
+    # instead of the progress lines printed during the calibration
+    metricsStreamPath = ""
+    metricsStreamFormat = "jsonl" # jsonl or csv
+    metricsWriter = MetricsWriter(metricsStreamPath, metricsStreamFormat)
 
     """ ==========================
              Process the lines 
@@ -45,14 +76,9 @@ def LANLAnoClassif(corpusName, pathAllData, wordModelFilename, desiredBatchSize,
     for i in range(8):
         modelsToSave["word" + str(i)] = {}
 
-    wordModelStateDict = torch.load(paths.modelPath + wordModelFilename, map_location=device)
-    wordModelList = []
-    for i in range(8):
-        wordModel = LANLWordModel(device, dtype, paths.vocabularyCachePath, corpusName, wordModelStateDict["word" + str(i)])
-        wordModel.eval()
-        if cudaOK:
-            wordModel.to(device)
-        wordModelList.append(wordModel)
+    # Encoders are created over the memory-mapped checkpoint (trained parameters are copied on write, the file is not modified)
+    voc = miscTool.loadVocabularyFromCache(paths.vocabularyCachePath, corpusName)
+    wordModelList = list(ModelBundle(loadCheckpoint(paths.modelPath + wordModelFilename), device, dtype, corpusName, voc, trainable=True))
 
     # Special loss function for anomaly detection
     lossFunc = nn.CrossEntropyLoss(reduction="none")
@@ -60,6 +86,7 @@ def LANLAnoClassif(corpusName, pathAllData, wordModelFilename, desiredBatchSize,
 
     # Load lines parameters
     linesParam = LinesTools(corpusName, wordModelList[0].voc, wordModelList[0].lineLength)
+    profiler.boundary("model")
 
     # Hypersphere construction parameters
     cList = []
@@ -72,7 +99,7 @@ def LANLAnoClassif(corpusName, pathAllData, wordModelFilename, desiredBatchSize,
     modelSaving = ModelSave(corpusName, paths.modelPath, "wordAno_" + str(nu), nameFormat="short", fixedTs=True)
 
     # Calibrating hypersphere center c. It's the mean of the dataset (calculated with a forward pass on the train dataset)
-    timerC = Timer()
+    timerC = instrumentation.timer("calibration/c")
 
     if modelsToSave.get("c") is not None:
         print("Start loading c from disk")
@@ -85,14 +112,25 @@ def LANLAnoClassif(corpusName, pathAllData, wordModelFilename, desiredBatchSize,
 
             nbBatch = 0
             nbSamples = 0
-            trainDatasetIterator = linesParam.loadBatch(paths.trainPath, False, desiredBatchSize, desiredLinesPerBatch, slidingWindowRenewRate, True)
+            if dedupWindowSize is not None:
+                trainDatasetIterator = linesParam.loadDedupBatch(paths.trainPath, desiredBatchSize, dedupWindowSize, dtype, device)
+            elif slidingWindowRenewRate > 0:
+                trainDatasetIterator = linesParam.loadWindowBatch(paths.trainPath, desiredBatchSize, desiredLinesPerBatch, slidingWindowRenewRate, dtype, device, True)
+            else:
+                trainDatasetIterator = linesParam.loadBatch(paths.trainPath, False, desiredBatchSize, desiredLinesPerBatch, slidingWindowRenewRate, True)
 
             for batch in trainDatasetIterator:
                 timerC.start()
                 nbBatch += 1
 
-                inputTensor = linesParam.convertBatchIntoTensor(batch, dtype, device)
-                inputTensor = inputTensor.view(-1, wordModelList[0].lineLength)
+                countTensor = None
+                if dedupWindowSize is not None:
+                    inputTensor, countTensor = batch
+                elif slidingWindowRenewRate > 0:
+                    inputTensor = batch.reshape(-1, wordModelList[0].lineLength)
+                else:
+                    inputTensor = linesParam.convertBatchIntoTensor(batch, dtype, device)
+                    inputTensor = inputTensor.view(-1, wordModelList[0].lineLength)
 
                 for i in range(inputTensor.size(1)):
 
@@ -109,15 +147,31 @@ def LANLAnoClassif(corpusName, pathAllData, wordModelFilename, desiredBatchSize,
                     currentLoss = lossFunc(wordModelOutput, targetTensorLoss)
                     repeatLoss = currentLoss.unsqueeze(1).repeat(1, lossRepeat)
                     encOut = torch.cat((wordModelList[i].lastHiddenLayer, repeatLoss), 1)
+                    if countTensor is not None:
+                        # Each unique line counts as many times as it occurs
+                        encOut = encOut * countTensor.unsqueeze(1).to(encOut.dtype)
                     encOutSum = torch.sum(encOut, 0)
                     cList[i] += encOutSum
                 timerC.stop()
-
-                nbSamples += wordModelOutput.size(0)
-
-                if nbBatch % 1000 == 0:
+                instrumentation.count("calibration/c/batches")
+                instrumentation.count("calibration/c/lines", inputTensor.size(0))
+                instrumentation.maybeExport()
+
+                if countTensor is None:
+                    nbSamples += wordModelOutput.size(0)
+                else:
+                    nbSamples += countTensor.sum().item()
+
+                if nbBatch % 1000 == 0 and metricsWriter.enabled:
+                    metricsWriter.write("calibration", phase="c", batch=nbBatch, lines=nbSamples,
+                                        linesPerSecond=nbSamples / max(timerC.totalElapsedTime, 1e-9))
+                elif nbBatch % 1000 == 0:
                     print(str(nbBatch) + " batch processed in " + str(timerC.totalElapsedTime) + " seconds")
 
+            if dedupWindowSize is not None:
+                print("Deduplication : " + str(nbSamples) + " lines in " + str(linesParam.dedupUniqueCount) + " unique lines (ratio " +
+                      str(linesParam.getDedupCompressionRatio()) + "), " + str(round(nbSamples / timerC.totalElapsedTime)) + " effective lines/s")
+
 
             for idx in range(len(cList)):
                 c = cList[idx]
@@ -134,10 +188,11 @@ def LANLAnoClassif(corpusName, pathAllData, wordModelFilename, desiredBatchSize,
 
     for idx, c in enumerate(cList):
         modelsToSave["word" + str(idx)]["c"] = c
+    profiler.boundary("c")
 
     # Calibration hypersphere radius R
     print("Start calibrating R")
-    timerR = Timer()
+    timerR = instrumentation.timer("calibration/R")
     optimizerList = []
     for wordModel in wordModelList:
         wordModel.train()
@@ -149,59 +204,96 @@ def LANLAnoClassif(corpusName, pathAllData, wordModelFilename, desiredBatchSize,
     for epoch in range(1):
         distList = []
         scoresList = []
+        countList = [] # Occurrence count of each line when lines are deduplicated
         for i in range(wordModelList[0].lineLength):
             distList.append([])
             scoresList.append([])
+            countList.append([])
 
         for optimizer in optimizerList:
             optimizer.zero_grad()
 
-        trainDatasetIterator = linesParam.loadBatch(paths.trainPath, False, desiredBatchSize, desiredLinesPerBatch, slidingWindowRenewRate, True)
+        if dedupWindowSize is not None:
+            trainDatasetIterator = linesParam.loadDedupBatch(paths.trainPath, desiredBatchSize, dedupWindowSize, dtype, device)
+        elif slidingWindowRenewRate > 0:
+            trainDatasetIterator = linesParam.loadWindowBatch(paths.trainPath, desiredBatchSize, desiredLinesPerBatch, slidingWindowRenewRate, dtype, device, True)
+        else:
+            trainDatasetIterator = linesParam.loadBatch(paths.trainPath, False, desiredBatchSize, desiredLinesPerBatch, slidingWindowRenewRate, True)
+        dedupLinesCountStart = linesParam.dedupLinesCount
+        profiler.start()
 
         for batch in trainDatasetIterator:
             timerR.start()
             batchNum += 1
 
-            inputTensor = linesParam.convertBatchIntoTensor(batch, dtype, device)
-            inputTensor = inputTensor.view(-1, wordModelList[0].lineLength)
+            countTensor = None
+            if dedupWindowSize is not None:
+                inputTensor, countTensor = batch
+            elif slidingWindowRenewRate > 0:
+                inputTensor = batch.reshape(-1, wordModelList[0].lineLength)
+            else:
+                inputTensor = linesParam.convertBatchIntoTensor(batch, dtype, device)
+                inputTensor = inputTensor.view(-1, wordModelList[0].lineLength)
 
             # Encoder pass
             for i in range(inputTensor.size(1)):
+                with profiler.region("position" + str(i)):
+                    trainInputTensor = torch.cat((inputTensor[:, 0:i], inputTensor[:, i+1:]), 1)
+                    trainTargetTensor = inputTensor[:, i]
 
-                trainInputTensor = torch.cat((inputTensor[:, 0:i], inputTensor[:, i+1:]), 1)
-                trainTargetTensor = inputTensor[:, i]
-
-                wordModelOutput = wordModelList[i](trainInputTensor)
-                targetTensorLoss = trainTargetTensor.view(-1)
+                    wordModelOutput = wordModelList[i](trainInputTensor)
+                    targetTensorLoss = trainTargetTensor.view(-1)
 
-                # Adding loss to the last hidden layer output
-                currentLoss = lossFunc(wordModelOutput, targetTensorLoss)
-                repeatLoss = currentLoss.unsqueeze(1).repeat(1, lossRepeat)
-                catOutLoss = torch.cat((wordModelList[i].lastHiddenLayer, repeatLoss), 1)
+                    # Adding loss to the last hidden layer output
+                    currentLoss = lossFunc(wordModelOutput, targetTensorLoss)
+                    repeatLoss = currentLoss.unsqueeze(1).repeat(1, lossRepeat)
+                    catOutLoss = torch.cat((wordModelList[i].lastHiddenLayer, repeatLoss), 1)
 
-                # Calculate distance
-                dist = torch.sum((catOutLoss - cList[i]) ** 2, dim=1)
+                    # Calculate distance
+                    dist = torch.sum((catOutLoss - cList[i]) ** 2, dim=1)
 
-                distList[i].append(dist)
-                scores = distList[i][-1] - RList[i] ** 2
-                scoresList[i].append(scores)
+                    distList[i].append(dist)
+                    scores = distList[i][-1] - RList[i] ** 2
+                    scoresList[i].append(scores)
+                    if countTensor is not None:
+                        countList[i].append(countTensor)
 
             # Backpropagation and calculation of R
             if len(distList[0]) == backprogCalculationStep:
                 for idx, wordModel in enumerate(wordModelList):
                     distCat = torch.cat(distList[idx])
                     scoresCat = torch.cat(scoresList[idx])
-                    loss = ((RList[idx]) ** 2) + ((1 / nu) * torch.mean(torch.max(torch.zeros_like(scoresCat), scoresCat)))
-                    loss.backward()
-                    optimizerList[idx].step()
-                    RList[idx] = torch.tensor(np.quantile(np.sqrt(distCat.detach().cpu().numpy()), 1 - nu), device=device)
+                    if dedupWindowSize is None:
+                        loss = ((RList[idx]) ** 2) + ((1 / nu) * torch.mean(torch.max(torch.zeros_like(scoresCat), scoresCat)))
+                        loss.backward()
+                        optimizerList[idx].step()
+                        RList[idx] = torch.tensor(np.quantile(np.sqrt(distCat.detach().cpu().numpy()), 1 - nu), device=device)
+                    else:
+                        # Same objective and quantile as if each line was repeated by its count
+                        countCat = torch.cat(countList[idx])
+                        weightCat = countCat.to(scoresCat.dtype)
+                        loss = ((RList[idx]) ** 2) + ((1 / nu) * torch.sum(torch.max(torch.zeros_like(scoresCat), scoresCat) * weightCat) / torch.sum(weightCat))
+                        loss.backward()
+                        optimizerList[idx].step()
+                        RList[idx] = torch.tensor(miscTool.weightedQuantile(np.sqrt(distCat.detach().cpu().numpy()), countCat.cpu().numpy(), 1 - nu), dtype=distCat.dtype, device=device)
+                    if metricsWriter.enabled:
+                        metricsWriter.write("calibration", phase="R", batch=batchNum, position=idx, loss=loss.item(), R=RList[idx].item())
 
                     distList[idx] = []
                     scoresList[idx] = []
+                    countList[idx] = []
                     optimizerList[idx].zero_grad()
             timerR.stop()
-
-            if batchNum % 10000 == 0:
+            instrumentation.count("calibration/R/batches")
+            instrumentation.count("calibration/R/lines", inputTensor.size(0))
+            instrumentation.maybeExport()
+            profiler.step()
+
+            if batchNum % 10000 == 0 and metricsWriter.enabled:
+                linesCount = instrumentation.getCount("calibration/R/lines")
+                metricsWriter.write("calibration", phase="R", batch=batchNum, lines=linesCount,
+                                    linesPerSecond=linesCount / max(timerR.totalElapsedTime, 1e-9))
+            elif batchNum % 10000 == 0:
                 print(str(batchNum) + " batch processed in " + str(timerR.totalElapsedTime) + " seconds")
                 print(RList)
                 for idx, R in enumerate(RList):
@@ -214,16 +306,30 @@ def LANLAnoClassif(corpusName, pathAllData, wordModelFilename, desiredBatchSize,
             for idx, wordModel in enumerate(wordModelList):
                 distCat = torch.cat(distList[idx])
                 scoresCat = torch.cat(scoresList[idx])
-                loss = ((RList[idx]) ** 2) + ((1 / nu) * torch.mean(torch.max(torch.zeros_like(scoresCat), scoresCat)))
-                loss.backward()
-                optimizerList[idx].step()
-                RList[idx] = torch.tensor(np.quantile(np.sqrt(distCat.detach().cpu().numpy()), 1 - nu), device=device)
+                if dedupWindowSize is None:
+                    loss = ((RList[idx]) ** 2) + ((1 / nu) * torch.mean(torch.max(torch.zeros_like(scoresCat), scoresCat)))
+                    loss.backward()
+                    optimizerList[idx].step()
+                    RList[idx] = torch.tensor(np.quantile(np.sqrt(distCat.detach().cpu().numpy()), 1 - nu), device=device)
+                else:
+                    # Same objective and quantile as if each line was repeated by its count
+                    countCat = torch.cat(countList[idx])
+                    weightCat = countCat.to(scoresCat.dtype)
+                    loss = ((RList[idx]) ** 2) + ((1 / nu) * torch.sum(torch.max(torch.zeros_like(scoresCat), scoresCat) * weightCat) / torch.sum(weightCat))
+                    loss.backward()
+                    optimizerList[idx].step()
+                    RList[idx] = torch.tensor(miscTool.weightedQuantile(np.sqrt(distCat.detach().cpu().numpy()), countCat.cpu().numpy(), 1 - nu), dtype=distCat.dtype, device=device)
 
                 distList[idx] = []
                 scoresList[idx] = []
+                countList[idx] = []
                 optimizerList[idx].zero_grad()
 
+    profiler.stop()
     print("End calibrating R")
+    if dedupWindowSize is not None:
+        dedupLinesCount = linesParam.dedupLinesCount - dedupLinesCountStart
+        print("Deduplication : " + str(dedupLinesCount) + " lines, " + str(round(dedupLinesCount / timerR.totalElapsedTime)) + " effective lines/s")
     for idx, R in enumerate(RList):
         print("R" + str(idx) + " = " + str(R))
         print("R" + str(idx) + "**2 = " + str(R**2))
@@ -239,6 +345,11 @@ def LANLAnoClassif(corpusName, pathAllData, wordModelFilename, desiredBatchSize,
     # Save the objects on disk
     modelPathOnDisk = modelSaving.saveObject(modelsToSave)
 
+    instrumentation.printReport()
+    instrumentation.export()
+    metricsWriter.writeTimers(instrumentation, "calibration")
+    metricsWriter.close()
+
     return modelPathOnDisk
 
 if __name__ == "__main__":
@@ -258,8 +369,10 @@ if __name__ == "__main__":
         slidingWindowRenewRate = 0
         nu = 0.005
         eps = 0.01
+        dedupWindowSize = None
 
-        LANLAnoClassif(corpusName, pathAllData, encoderModelFilename, desiredBatchSize, desiredLinesPerBatch, slidingWindowRenewRate, nu, eps)
+        LANLAnoClassif(corpusName, pathAllData, encoderModelFilename, desiredBatchSize, desiredLinesPerBatch, slidingWindowRenewRate, nu, eps, dedupWindowSize,
+                       progArg.profilePath)
 
     finally:
         print("=============== End of program ===============")
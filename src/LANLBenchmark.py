@@ -0,0 +1,121 @@
+# -*- coding: utf8 -*-
+
+"""
+Benchmark of each stage of the pipeline on synthetic LANL logs
+A synthetic corpus is written in the data directory (if not already there), then each stage is measured in its own process,
+so its peak resident memory is its own. Results are written in a JSON file. If a baseline file is given,
+results are compared with it and the program fails if a stage regressed.
+With --startup, the start-up time of the command line (python -m src) is also measured : the program fails if a lightweight command
+imports torch or takes more than maxStartupSeconds
+"""
+
+import argparse
+import multiprocessing
+import os
+import sys
+
+from src.benchmark.BenchmarkResults import compareResults, environmentDescription, loadResults, printComparison, saveResults
+from src.benchmark.StageBenchmarks import StageBenchmarks
+from src.benchmark.StartupBenchmark import StartupBenchmark
+from src.benchmark.SyntheticLogGenerator import SyntheticLogGenerator
+from src.tools.Paths import Paths
+
+
+def _runStage(stageArgs):
+    pathAllData, stageName, parameters = stageArgs
+    stageBenchmarks = StageBenchmarks(pathAllData, batchSize=parameters["batchSize"], maxBatches=parameters["maxBatches"],
+                                      curveLineCount=parameters["curveLineCount"])
+    return stageBenchmarks.run(stageName, parameters["repeatCount"])
+
+
+def runBenchmarks(pathAllData, stageNames=None, resultsPath="", baselinePath="", tolerance=0.2, startup=False):
+    """
+    :param pathAllData: Directory of the synthetic data (created if needed)
+    :param stageNames: Stages to measure. If None, all stages of StageBenchmarks.STAGES
+    :param resultsPath: If not empty, results are saved in this JSON file
+    :param baselinePath: If not empty, results are compared with the results saved in this file
+    :param tolerance: Relative change in the bad direction above which a metric is a regression
+    :param startup: If True, start-up times of the lightweight commands of the command line are measured too
+    :return: Results, list of the regressions (empty if no baseline and no slow start-up)
+    """
+
+    # Synthetic corpus. Changing these parameters changes the results : compare only results with the same parameters
+    generatorParameters = {"userCount": 10000, "computerCount": 5000, "zipfExponent": 1.1, "repetitionRate": 0.6, "seed": 0}
+    trainLineCount = 200000
+    devLineCount = 10000
+    testLineCount = 50000
+
+    # Measure parameters
+    parameters = {"batchSize": 64, "maxBatches": 20, "curveLineCount": 1000000, "repeatCount": 3}
+
+    # Maximum start-up time in seconds of a lightweight command (help, vocabulary from the cache)
+    maxStartupSeconds = 1.0
+
+    if stageNames is None:
+        stageNames = StageBenchmarks.STAGES
+
+    paths = Paths(pathAllData, "LANL", create=True)
+    if len(os.listdir(paths.trainPath)) == 0:
+        print("Writing synthetic corpus in " + pathAllData)
+        generator = SyntheticLogGenerator(**generatorParameters)
+        generator.writeCorpus(pathAllData, trainLineCount, devLineCount, testLineCount)
+    if not os.path.isfile(paths.modelPath + StageBenchmarks.MODEL_FILENAME):
+        StageBenchmarks.prepareModel(pathAllData)
+
+    results = {"environment": environmentDescription(),
+               "parameters": dict(parameters, trainLineCount=trainLineCount, devLineCount=devLineCount, testLineCount=testLineCount, **generatorParameters),
+               "stages": {}}
+
+    # One new process per stage
+    processContext = multiprocessing.get_context("spawn")
+    for stageName in stageNames:
+        with processContext.Pool(1, maxtasksperchild=1) as pool:
+            stageResults = pool.apply(_runStage, ((pathAllData, stageName, parameters),))
+        results["stages"][stageName] = stageResults
+        print(stageName + " : " + str(round(stageResults["linesPerSecond"])) + " lines/s, " + str(round(stageResults["msPerBatch"], 3)) + " ms/batch, "
+              + str(round(stageResults["peakRssMb"])) + " MB peak RSS")
+
+    regressions = []
+    if startup:
+        results["startup"] = StartupBenchmark(pathAllData, parameters["repeatCount"]).run()
+        for name, startupResults in results["startup"].items():
+            print(name + " : " + str(round(startupResults["seconds"], 3)) + " s" + (", imports torch" if startupResults["importsTorch"] else ""))
+            if name != "import torch" and (startupResults["importsTorch"] or startupResults["seconds"] > maxStartupSeconds):
+                print("Slow start-up : python -m src " + name)
+                regressions.append({"stage": "startup", "metric": name, "baseline": maxStartupSeconds, "current": startupResults["seconds"],
+                                    "change": startupResults["seconds"] / maxStartupSeconds - 1, "regression": True})
+
+    if resultsPath != "":
+        saveResults(results, resultsPath)
+
+    if baselinePath != "":
+        baseline = loadResults(baselinePath)
+        if baseline["parameters"] != results["parameters"]:
+            print("Warning : baseline was measured with different parameters")
+        comparison = compareResults(results, baseline, tolerance)
+        printComparison(comparison)
+        regressions = [row for row in comparison if row["regression"]]
+
+    return results, regressions
+
+
+if __name__ == "__main__":
+    print("Beginning of program")
+    # execute only if run as a script
+    try:
+        argParser = argparse.ArgumentParser()
+        argParser.add_argument("path_data", help="Directory of the synthetic data (created if needed)")
+        argParser.add_argument("--stages", nargs="*", choices=StageBenchmarks.STAGES, help="Stages to measure. Default : all. None if the option is empty")
+        argParser.add_argument("--output", default="", help="JSON file where results are saved")
+        argParser.add_argument("--baseline", default="", help="JSON file of results to compare with")
+        argParser.add_argument("--tolerance", type=float, default=0.2, help="Relative change considered as a regression")
+        argParser.add_argument("--startup", action="store_true", help="Measure the start-up time of the command line too")
+        args = argParser.parse_args()
+
+        results, regressions = runBenchmarks(args.path_data, args.stages, args.output, args.baseline, args.tolerance, args.startup)
+        if len(regressions) > 0:
+            print(str(len(regressions)) + " regressions")
+            sys.exit(1)
+
+    finally:
+        print("=============== End of program ===============")
@@ -0,0 +1,218 @@
+# -*- coding: utf8 -*-
+
+"""
+Distill the anomaly classifier trained by LANLAnoClassif (teacher, one LANLWordModel per position) into one small student network
+(LANLStudentModel) used to screen the test lines (see TwoStageScorer)
+"""
+
+import logging
+
+import numpy as np
+import torch
+import torch.nn as nn
+import torch.optim as optim
+
+from src.model.AnomalyScorer import AnomalyScorer
+from src.model.StudentScorer import LANLStudentModel
+from src.tools.ModelSave import ModelSave
+from src.tools.Paths import Paths
+from src.tools.ProgramArguments import ProgramArguments
+from src.tools.Timer import Timer
+from src.tools.line.LinesTools import LinesTools
+
+
+def LANLDistillStudent(corpusName, pathAllData, anoClassModelFilename, desiredBatchSize, epochNumber, learningRate, positionLossWeight, targetRecall):
+    """
+    Train the student to regress the scores of the teacher on the train dataset, then choose its screening threshold on the dev dataset
+    :param positionLossWeight: Weight of the loss of the scores of the positions against the loss of the score of the line.
+                               If 0, only the score of the line is learnt
+    :param targetRecall: Fraction of the dev lines detected by the teacher which must be above the threshold of the student
+    :return: Path of the saved student
+    """
+
+    if not 0 < targetRecall <= 1:
+        raise ValueError("Target recall ", targetRecall, " must be in ]0, 1]")
+
+    paths = Paths(pathAllData, corpusName)
+
+    # Set logging level
+    logger = logging.getLogger()
+    logger.setLevel(logging.ERROR)
+
+    # Size of the student
+    embeddingSize = 32
+    hiddenSize = 256
+
+    devCalculStep = 200 # Step of the dev loss report
+    scaleSampleLines = 10000 # Count of train lines used to set the scale of the targets
+
+    # Dev lines used to choose the threshold : lines detected by the teacher. If there are less than minCalibrationPositives,
+    # the calibrationTopRate fraction of dev lines with the highest teacher score is used (the closest to the boundary of the hypersphere)
+    calibrationTopRate = 0.01
+    minCalibrationPositives = 20
+
+    """ ==========================
+             Process the lines
+        ==========================
+    """
+
+    #  Tensors parameters
+    dtype = torch.long
+    if torch.cuda.is_available():
+        print("Cuda OK")
+        device = torch.device("cuda")
+    else:
+        print("Cuda KO")
+        device = torch.device("cpu")
+
+    # Teacher
+    anomalyScorer = AnomalyScorer(device, dtype, paths.vocabularyCachePath, corpusName, paths.modelPath + anoClassModelFilename)
+    lineLength = anomalyScorer.lineLength
+    linesParam = LinesTools(corpusName, anomalyScorer.voc, lineLength)
+
+    # Student
+    studentModel = LANLStudentModel(len(anomalyScorer.voc.wordIndex), lineLength, embeddingSize, hiddenSize)
+    studentModel.to(device)
+    lossFunc = nn.MSELoss()
+    optimizer = optim.Adam(studentModel.parameters(), lr=learningRate)
+
+    # Scale of the targets : median of the absolute teacher scores of the first train lines
+    print("Start calculating the scale of the targets")
+    sampleScores = []
+    sampleLinesCount = 0
+    with torch.no_grad():
+        for batch in linesParam.loadBatch(paths.trainPath, False, desiredBatchSize, 1, 0, True):
+            inputTensor = linesParam.convertBatchIntoTensor(batch, dtype, device).view(-1, lineLength)
+            positionScores, scoresSum = anomalyScorer.score(inputTensor)
+            sampleScores.append(torch.cat((positionScores, scoresSum.unsqueeze(0)), 0).t())
+            sampleLinesCount += inputTensor.size(0)
+            if sampleLinesCount >= scaleSampleLines:
+                break
+    studentModel.targetScale.copy_(torch.clamp(torch.median(torch.abs(torch.cat(sampleScores)), 0).values, min=1e-6))
+    print("Scale of the targets : " + str(studentModel.targetScale))
+
+    # Dev lines and their teacher scores, calculated once (the models of the teacher are already created : the time is the time of the scoring)
+    devIterator = linesParam.loadBatch(paths.devPath, False, 0, 1)
+    devBatch = next(devIterator)
+    devInputTensor = linesParam.convertBatchIntoTensor(devBatch, dtype, device).view(-1, lineLength)
+    timerTeacher = Timer()
+    timerTeacher.start()
+    with torch.no_grad():
+        devPositionScores, devScoresSum = _scoreByBatch(anomalyScorer.score, devInputTensor, desiredBatchSize)
+    timerTeacher.stop()
+    devTargets = studentModel.transformTargets(devPositionScores, devScoresSum)
+
+    # Distillation
+    print("Start distillation")
+    timerTrain = Timer()
+    batchNum = 0
+    for epoch in range(epochNumber):
+        trainLossSum = 0
+        trainBatchCount = 0
+        for batch in linesParam.loadBatch(paths.trainPath, False, desiredBatchSize, 1, 0, True):
+            timerTrain.start()
+            batchNum += 1
+            inputTensor = linesParam.convertBatchIntoTensor(batch, dtype, device).view(-1, lineLength)
+            with torch.no_grad():
+                targets = studentModel.transformTargets(*anomalyScorer.score(inputTensor))
+
+            studentModel.train()
+            optimizer.zero_grad()
+            outputs = studentModel(inputTensor)
+            loss = _distillationLoss(lossFunc, outputs, targets, lineLength, positionLossWeight)
+            loss.backward()
+            optimizer.step()
+            trainLossSum += loss.item()
+            trainBatchCount += 1
+            timerTrain.stop()
+
+            if batchNum % devCalculStep == 0:
+                studentModel.eval()
+                with torch.no_grad():
+                    devLoss = _distillationLoss(lossFunc, studentModel(devInputTensor), devTargets, lineLength, positionLossWeight)
+                print("Epoch " + str(epoch) + " batch " + str(batchNum) + " : train loss " + str(trainLossSum / trainBatchCount) +
+                      " / dev loss " + str(devLoss.item()) + " (" + str(timerTrain.totalElapsedTime) + " seconds)")
+                trainLossSum = 0
+                trainBatchCount = 0
+    print("End distillation")
+
+    # Threshold of the screening, chosen on the dev dataset
+    studentModel.eval()
+    timerStudent = Timer()
+    timerStudent.start()
+    with torch.no_grad():
+        studentPositionScores, studentScoresSum = _scoreByBatch(studentModel.predictScores, devInputTensor, desiredBatchSize)
+    timerStudent.stop()
+
+    devScoresArray = devScoresSum.cpu().numpy()
+    studentScoresArray = studentScoresSum.cpu().numpy()
+    positives = devScoresArray > 0
+    positivesSource = "teacher anomalies"
+    if np.count_nonzero(positives) < minCalibrationPositives:
+        topCount = min(len(devScoresArray), max(minCalibrationPositives, int(np.ceil(calibrationTopRate * len(devScoresArray)))))
+        positives = np.zeros(len(devScoresArray), dtype=bool)
+        positives[np.argsort(devScoresArray)[-topCount:]] = True
+        positivesSource = "top " + str(topCount) + " teacher scores"
+    threshold = float(np.quantile(studentScoresArray[positives], 1 - targetRecall))
+
+    passRate = float(np.mean(studentScoresArray >= threshold))
+    teacherSeconds = timerTeacher.totalElapsedTime
+    screeningSeconds = timerStudent.totalElapsedTime + passRate * teacherSeconds
+    report = {"devLines": len(devScoresArray), "calibrationLines": int(np.count_nonzero(positives)), "calibrationSource": positivesSource,
+              "threshold": threshold, "correlation": float(np.corrcoef(devScoresArray, studentScoresArray)[0, 1]),
+              "passRate": passRate, "recallRetained": float(np.mean(studentScoresArray[positives] >= threshold)),
+              "teacherSeconds": teacherSeconds, "studentSeconds": timerStudent.totalElapsedTime, "teacherSecondsPerLine": teacherSeconds / len(devScoresArray),
+              "estimatedSpeedup": teacherSeconds / screeningSeconds if screeningSeconds > 0 else float("nan")}
+    print("Screening on dev dataset (" + positivesSource + ") : ")
+    for name, value in report.items():
+        print("  " + name + " : " + str(value))
+
+    # Save the student with the fingerprint of its teacher (checked before screening, see testAnomalyClassification)
+    modelSaving = ModelSave(corpusName, paths.modelPath, "student", nameFormat="short", fixedTs=True)
+    return modelSaving.saveObject({"model": studentModel.state_dict(), "vocSize": studentModel.vocSize, "lineLength": lineLength,
+                                   "embeddingSize": embeddingSize, "hiddenSize": hiddenSize, "threshold": threshold,
+                                   "positionScores": positionLossWeight > 0, "teacherFingerprint": anomalyScorer.fingerprint, "report": report})
+
+
+def _distillationLoss(lossFunc, outputs, targets, lineLength, positionLossWeight):
+    loss = lossFunc(outputs[:, lineLength], targets[:, lineLength])
+    if positionLossWeight > 0:
+        loss = loss + positionLossWeight * lossFunc(outputs[:, :lineLength], targets[:, :lineLength])
+    return loss
+
+
+def _scoreByBatch(scoreFunction, inputTensor, batchSize):
+    """
+    :param scoreFunction: Function with the API of AnomalyScorer.score
+    :return: Scores of all the lines of inputTensor, scored by batches of batchSize lines
+    """
+    positionScoresList = []
+    scoresSumList = []
+    for start in range(0, inputTensor.size(0), batchSize):
+        positionScores, scoresSum = scoreFunction(inputTensor[start:start + batchSize])
+        positionScoresList.append(positionScores)
+        scoresSumList.append(scoresSum)
+    return torch.cat(positionScoresList, 1), torch.cat(scoresSumList)
+
+
+if __name__ == "__main__":
+    print("Beginning of program")
+    # execute only if run as a script
+    try:
+        # Parsing command lines option
+        progArg = ProgramArguments(withModel=True)
+
+        corpusName = progArg.corpusName
+        pathAllData = progArg.pathData
+        anoClassModelFilename = progArg.modelFile
+
+        desiredBatchSize = 128
+        epochNumber = 1
+        learningRate = 0.001
+        positionLossWeight = 0.5
+        targetRecall = 1.0
+
+        LANLDistillStudent(corpusName, pathAllData, anoClassModelFilename, desiredBatchSize, epochNumber, learningRate, positionLossWeight, targetRecall)
+
+    finally:
+        print("=============== End of program ===============")
@@ -0,0 +1,159 @@
+# -*- coding: utf8 -*-
+
+"""
+Score with the classifier trained in anomalyClassification.py the lines appended to growing log files
+New lines are batched by size or by time, so a line is scored at most about pollInterval + maxDelay seconds after it's written.
+Anomalies are written as soon as their batch is scored
+"""
+
+import logging
+import os
+import sys
+import time
+
+import torch
+
+from src.model.AnomalyScorer import AnomalyScorer
+from src.tools.FileFollower import FileFollower
+from src.tools.Paths import Paths
+from src.tools.ProgramArguments import ProgramArguments
+from src.tools.ScoreCache import ScoreCache
+from src.tools.Timer import Timer
+from src.tools.line.LANLLine import LANLLine
+
+
+def followAnomalyClassification(corpusName, pathAllData, anoClassModelFilename, followPaths, alertPath="", offsetsPath="", maxRunTime=0):
+    """
+    :param followPaths: Paths of the log files to follow
+    :param alertPath: Anomalies are appended to this file (same columns as the anomaly report). If empty, they are printed
+    :param offsetsPath: If not empty, offsets of the scored lines are saved in this file and reading resumes from them after a restart
+    :param maxRunTime: If > 0, stop after this time in seconds. Otherwise run until interrupted
+    """
+
+    # Retrieving paths
+    paths = Paths(pathAllData, corpusName)
+
+    # Set logging level
+    logger = logging.getLogger()
+    logger.setLevel(logging.ERROR)
+
+    # Files are polled every pollInterval seconds when no new line is found
+    pollInterval = 0.5
+
+    # New lines are scored when maxBatchSize lines are waiting, or when the oldest waiting line was read maxDelay seconds ago
+    maxBatchSize = 1024
+    maxDelay = 1.0
+
+    # If True, files without saved offset are read from their end : only lines written after the start are scored
+    fromEnd = False
+
+    # Maximum count of lines in the score cache. If 0, cache is disabled
+    scoreCacheSize = 1000000
+
+    #  Tensors parameters
+    dtype = torch.long
+    if torch.cuda.is_available():
+        print("Following logs on GPU")
+        device = torch.device("cuda")
+    else:
+        print("Following logs on CPU")
+        device = torch.device("cpu")
+
+    #  Construct the DL model
+    anomalyScorer = AnomalyScorer(device, dtype, paths.vocabularyCachePath, corpusName, paths.modelPath + anoClassModelFilename)
+    if scoreCacheSize > 0:
+        anomalyScorer.scoreCache = ScoreCache(scoreCacheSize, anomalyScorer.fingerprint)
+
+    fileFollower = FileFollower(followPaths, offsetsPath, fromEnd)
+    if alertPath != "":
+        alertFile = open(alertPath, "a")
+    else:
+        alertFile = sys.stdout
+
+    pendingLines = [] # Tuples (LANLLine, file) waiting to be scored
+    pendingTime = 0 # Time when the oldest pending line was read
+    scoredLinesCount = 0
+    alertCount = 0
+    timerModel = Timer()
+    startTime = time.perf_counter()
+    try:
+        with torch.no_grad():
+            while maxRunTime <= 0 or time.perf_counter() - startTime < maxRunTime:
+                newLines = fileFollower.poll()
+                if len(pendingLines) == 0 and len(newLines) > 0:
+                    pendingTime = time.perf_counter()
+                for file, strLine in newLines:
+                    line = LANLLine(strLine, anomalyScorer.lineLength)
+                    if line.keepLine:
+                        pendingLines.append((line, file))
+
+                if len(pendingLines) == 0 or (len(pendingLines) < maxBatchSize and time.perf_counter() - pendingTime < maxDelay):
+                    if len(newLines) == 0:
+                        # Wait for new lines, or until the deadline of the pending lines
+                        time.sleep(pollInterval if len(pendingLines) == 0 else min(pollInterval, max(pendingTime + maxDelay - time.perf_counter(), 0)))
+                    continue
+
+                # Score pending lines, by batches of maxBatchSize lines
+                for start in range(0, len(pendingLines), maxBatchSize):
+                    batchLines = pendingLines[start:start + maxBatchSize]
+                    timerModel.start()
+                    inputTensor = torch.tensor([line.getEncodedLine(anomalyScorer.voc) for line, file in batchLines], dtype=dtype, device=device)
+                    scoresListTensor, scoresSum = anomalyScorer.score(inputTensor)
+                    scoresSumList = scoresSum.cpu().tolist()
+                    timerModel.stop()
+
+                    # Lines with a score strictly positive are out of the hypersphere
+                    for idx in torch.nonzero(torch.gt(scoresSum, 0)).view(-1).tolist():
+                        line, file = batchLines[idx]
+                        alertFile.write(str(round(scoresSumList[idx], 6)) + "\t" + line.inputRawStrLine.rstrip("\n") + "\t" + file + "\t"
+                                        + ",".join(str(round(positionScore, 6)) for positionScore in scoresListTensor[:, idx].tolist()) + "\n")
+                        alertCount += 1
+                    alertFile.flush()
+                    scoredLinesCount += len(batchLines)
+
+                # All read lines are scored
+                pendingLines = []
+                fileFollower.saveOffsets()
+
+    except KeyboardInterrupt:
+        pass
+    finally:
+        # Offsets are saved only if all read lines are scored : lines read but not scored are read again after a restart
+        if len(pendingLines) == 0:
+            fileFollower.saveOffsets()
+        fileFollower.close()
+        if alertFile is not sys.stdout:
+            alertFile.close()
+
+    print("End of log following")
+    print("Lines scored : " + str(scoredLinesCount))
+    print("Anomalies : " + str(alertCount))
+    print("Rotated files : " + str(fileFollower.rotationCount) + " / Truncated files : " + str(fileFollower.truncationCount))
+    print("Timers : ")
+    print("  Model time : " + str(timerModel.totalElapsedTime))
+    if anomalyScorer.scoreCache is not None:
+        print("Score cache hit rate : " + str(anomalyScorer.scoreCache.getHitRate()))
+
+    return scoredLinesCount, alertCount
+
+
+if __name__ == "__main__":
+    print("Beginning of program")
+    # execute only if run as a script
+    try:
+        # Parsing command lines option
+        progArg = ProgramArguments(withModel=True, withInputFile='Y')
+
+        corpusName = progArg.corpusName
+        pathAllData = progArg.pathData
+        anoClassModelFilename = progArg.modelFile
+
+        # Followed file is given relatively to the data directory
+        followPaths = [os.path.join(pathAllData, progArg.inputFile)]
+        alertPath = os.path.join(pathAllData, "LANLanoClassAlerts.txt")
+        offsetsPath = os.path.join(pathAllData, "LANLfollowOffsets.json")
+
+        followAnomalyClassification(corpusName, pathAllData, anoClassModelFilename, followPaths, alertPath, offsetsPath)
+
+    finally:
+        print("=============== End of program ===============")
@@ -0,0 +1,185 @@
+# -*- coding: utf8 -*-
+
+"""
+Contribution of each position (word model) of the anomaly classifier to the ranking of the labelled test lines,
+and trade-off between speed and precision-recall AUC of subsets of positions (see the positions parameter of AnomalyScorer)
+"""
+
+import json
+import logging
+import os
+
+import numpy as np
+import torch
+
+from src.model.AnomalyScorer import AnomalyScorer
+from src.tools.Graphs import Graphs
+from src.tools.Paths import Paths
+from src.tools.ProgramArguments import ProgramArguments
+from src.tools.Timer import Timer
+from src.tools.line.LANLLine import LANLLine
+from src.tools.line.LinesTools import LinesTools
+from src.tools.metrics.LabelIndex import LabelIndex
+from src.tools.metrics.ScoreSink import ScoreSink
+
+
+def LANLPositionSelection(corpusName, pathAllData, anoClassModelFilename, desiredBatchSize, redteamFilePath, testFilePath="", maxAucLoss=0.01):
+    """
+    Score the labelled lines once with every position, then calculate the precision-recall AUC of the score of subsets of positions
+    (score of a line = sum of the scores of the positions of the subset) :
+      - leave-one-out : AUC without each position
+      - backward elimination : from all the positions, the position whose removal keeps the best AUC is removed, until one position is left
+    Time of a subset is estimated with the time of each position measured during the scoring
+    :param maxAucLoss: The recommended subset is the fastest subset of the backward elimination whose AUC is at least the AUC of all the positions - maxAucLoss
+    :return: Dictionary with the AUC of all the positions (fullPrecisionRecallAuc), the time of each position (positionSeconds),
+             the leave-one-out AUC (leaveOneOut), the subsets of the backward elimination (subsets) and the recommended subset (recommended)
+    """
+
+    # Retrieving paths
+    paths = Paths(pathAllData, corpusName)
+
+    # Set logging level
+    logger = logging.getLogger()
+    logger.setLevel(logging.ERROR)
+
+    if testFilePath == "":
+        testFilePath = paths.testPath
+
+    # If not None, scores of each position are written in this directory and read back as memory-mapped arrays
+    scoreSpillDirectory = None
+
+    # If not empty, the report is also written in this JSON file
+    reportPath = ""
+
+    """ ==========================
+             Process the lines
+        ==========================
+    """
+
+    #  Tensors parameters
+    dtype = torch.long
+    if torch.cuda.is_available():
+        print("Position selection on GPU")
+        device = torch.device("cuda")
+        cudaOK = True
+    else:
+        print("Position selection on CPU")
+        device = torch.device("cpu")
+        cudaOK = False
+
+    anomalyScorer = AnomalyScorer(device, dtype, paths.vocabularyCachePath, corpusName, paths.modelPath + anoClassModelFilename)
+    lineLength = anomalyScorer.lineLength
+    linesParam = LinesTools(corpusName, anomalyScorer.voc, lineLength)
+    labelIndex = LabelIndex(redteamFilePath)
+
+    # Score of each position of each line, stored by position
+    positionSinks = [ScoreSink(spillDirectory=scoreSpillDirectory, spillPrefix="position" + str(i)) for i in range(lineLength)]
+    positionTimers = [Timer() for i in range(lineLength)]
+    linesCount = 0
+    with torch.no_grad():
+        for batch in linesParam.loadBatch(testFilePath, False, desiredBatchSize, 1, 0, False):
+            inputTensor = linesParam.convertBatchIntoTensor(batch, dtype, device).view(-1, lineLength)
+            labels = labelIndex.labelBatch(batch)
+            for i in range(lineLength):
+                positionTimers[i].start()
+                positionScores = anomalyScorer.scorePosition(i, inputTensor).cpu().numpy()
+                positionTimers[i].stop()
+                positionSinks[i].append(positionScores, labels)
+            linesCount += inputTensor.size(0)
+            if linesCount % 100000 < desiredBatchSize:
+                print("Lines scored : " + str(linesCount))
+    for positionSink in positionSinks:
+        positionSink.close()
+    labels = positionSinks[0].labels
+    positionSeconds = [timer.totalElapsedTime for timer in positionTimers]
+    print("Lines scored : " + str(linesCount) + " (" + str(int(np.count_nonzero(labels == 1))) + " anomalies)")
+
+    aucCache = {} # Key = tuple of positions ; value = (precision-recall AUC, ROC AUC)
+
+    def subsetAuc(positions):
+        positions = tuple(sorted(positions))
+        if positions not in aucCache:
+            scoresSum = np.zeros(linesCount, dtype=np.float64)
+            for i in positions:
+                scoresSum += positionSinks[i].scores
+            subsetSink = ScoreSink(max(linesCount, 1))
+            subsetSink.append(scoresSum, labels)
+            subsetSink.close()
+            curve = Graphs(subsetSink, 1, 0, 0, 1, 0.01, "sort", cudaOK).curve
+            aucCache[positions] = (curve["precisionRecallAuc"], curve["rocAuc"])
+        return aucCache[positions]
+
+    def subsetReport(positions):
+        precisionRecallAuc, rocAuc = subsetAuc(positions)
+        estimatedSeconds = sum(positionSeconds[i] for i in positions)
+        return {"positions": sorted(positions), "words": [_wordName(i) for i in sorted(positions)], "precisionRecallAuc": precisionRecallAuc,
+                "rocAuc": rocAuc, "estimatedSeconds": estimatedSeconds,
+                "estimatedSpeedup": sum(positionSeconds) / estimatedSeconds if estimatedSeconds > 0 else float("nan")}
+
+    allPositions = list(range(lineLength))
+    fullPrecisionRecallAuc, fullRocAuc = subsetAuc(allPositions)
+
+    # Leave-one-out : loss of AUC when one position is removed
+    leaveOneOut = []
+    for i in allPositions:
+        precisionRecallAuc, rocAuc = subsetAuc([position for position in allPositions if position != i])
+        leaveOneOut.append({"position": i, "word": _wordName(i), "seconds": positionSeconds[i], "precisionRecallAuc": precisionRecallAuc,
+                            "precisionRecallAucLoss": fullPrecisionRecallAuc - precisionRecallAuc, "rocAuc": rocAuc})
+
+    # Backward elimination
+    subsets = [subsetReport(allPositions)]
+    currentPositions = list(allPositions)
+    while len(currentPositions) > 1:
+        removedPosition = max(currentPositions, key=lambda i: subsetAuc([position for position in currentPositions if position != i])[0])
+        currentPositions.remove(removedPosition)
+        subsets.append(subsetReport(currentPositions))
+
+    recommended = min((subset for subset in subsets if subset["precisionRecallAuc"] >= fullPrecisionRecallAuc - maxAucLoss),
+                      key=lambda subset: subset["estimatedSeconds"])
+
+    print("Precision-recall AUC of all the positions : " + str(fullPrecisionRecallAuc) + " (ROC AUC : " + str(fullRocAuc) + ")")
+    print("Leave-one-out (position, word, seconds, precision-recall AUC without the position, AUC loss) : ")
+    for positionReport in leaveOneOut:
+        print("  " + str(positionReport["position"]) + "\t" + positionReport["word"] + "\t" + "{:.3f}".format(positionReport["seconds"]) + "\t" +
+              "{:.6f}".format(positionReport["precisionRecallAuc"]) + "\t" + "{:+.6f}".format(positionReport["precisionRecallAucLoss"]))
+    print("Backward elimination (positions, estimated speedup, precision-recall AUC, ROC AUC) : ")
+    for subset in subsets:
+        print("  " + ",".join(str(position) for position in subset["positions"]) + "\t" + "{:.2f}".format(subset["estimatedSpeedup"]) + "\t" +
+              "{:.6f}".format(subset["precisionRecallAuc"]) + "\t" + "{:.6f}".format(subset["rocAuc"]))
+    print("Recommended positions (AUC loss <= " + str(maxAucLoss) + ") : " + ",".join(str(position) for position in recommended["positions"]) +
+          " (" + ", ".join(recommended["words"]) + ")")
+    if recommended["positions"] != allPositions:
+        print("Anomalies (score > 0) of a subset are not the anomalies of all the positions : check precision and recall with the test")
+
+    report = {"lines": linesCount, "fullPrecisionRecallAuc": fullPrecisionRecallAuc, "fullRocAuc": fullRocAuc, "positionSeconds": positionSeconds,
+              "leaveOneOut": leaveOneOut, "subsets": subsets, "recommended": recommended}
+    if reportPath != "":
+        with open(reportPath, "w") as reportFile:
+            json.dump(report, reportFile, indent=2)
+    return report
+
+
+def _wordName(position):
+    return LANLLine.WORD_NAMES[position] if position < len(LANLLine.WORD_NAMES) else "word" + str(position)
+
+
+if __name__ == "__main__":
+    print("Beginning of program")
+    # execute only if run as a script
+    try:
+        # Parsing command lines option
+        progArg = ProgramArguments(withModel=True)
+
+        corpusName = progArg.corpusName
+        pathAllData = progArg.pathData
+        anoClassModelFilename = progArg.modelFile
+
+        desiredBatchSize = 128
+        maxAucLoss = 0.01
+
+        redteamFilePath = os.path.join(pathAllData, "redteam_example")
+
+        LANLPositionSelection(corpusName, pathAllData, anoClassModelFilename, desiredBatchSize, redteamFilePath, maxAucLoss=maxAucLoss)
+
+    finally:
+        print("=============== End of program ===============")
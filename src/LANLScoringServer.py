@@ -0,0 +1,191 @@
+# -*- coding: utf8 -*-
+
+"""
+Scoring service of the classifier trained in anomalyClassification.py
+The model is loaded once and raw LANL lines are scored on demand through a local socket (Unix domain socket or localhost TCP).
+Lines of concurrent requests are scored together by a micro batcher
+
+Protocol : one JSON object per line in each direction
+  - {"lines": ["<raw LANL line>", ...]} => {"scores": [...], "anomalies": [...]}. Score and anomaly are null for an invalid line
+  - {"command": "stats"} => counters, throughputs and latency percentiles (in milliseconds)
+  - Error => {"error": "<message>"}. Error "overloaded" means the request was rejected because too many lines are waiting : retry later
+"""
+
+import json
+import logging
+import os
+import socketserver
+
+import torch
+
+from src.model.AnomalyScorer import AnomalyScorer
+from src.tools.Paths import Paths
+from src.tools.ProgramArguments import ProgramArguments
+from src.tools.ScoreCache import ScoreCache
+from src.tools.line.LANLLine import LANLLine
+from src.tools.serving.LatencyStats import LatencyStats
+from src.tools.serving.MicroBatcher import MicroBatcher
+
+
+class ScoringRequestHandler(socketserver.StreamRequestHandler):
+    """
+    Handle the requests of one connection, one after the other. A client waits for the result of a request before sending the next one
+    """
+
+    def handle(self):
+        for requestLine in self.rfile:
+            if len(requestLine.strip()) == 0:
+                continue
+            try:
+                response = self.server.processRequest(json.loads(requestLine))
+            except (ValueError, KeyError, TypeError) as exception:
+                response = {"error": "invalid request : " + str(exception)}
+            self.wfile.write((json.dumps(response) + "\n").encode("utf8"))
+            self.wfile.flush()
+
+
+class _ScoringServerMixin:
+
+    daemon_threads = True
+
+    def initScoring(self, anomalyScorer, microBatcher, latencyStats):
+        self.anomalyScorer = anomalyScorer
+        self.microBatcher = microBatcher
+        self.latencyStats = latencyStats
+
+
+    def processRequest(self, request):
+        """
+        :param request: Dictionary decoded from the JSON request
+        :return: Dictionary of the JSON response
+        """
+        if not isinstance(request, dict):
+            raise ValueError("request must be a JSON object")
+        if request.get("command") == "stats":
+            return self.latencyStats.summary()
+
+        if not isinstance(request.get("lines"), list) or not all(isinstance(strLine, str) for strLine in request["lines"]):
+            raise ValueError("lines must be a list of strings")
+
+        # Encode valid lines. Invalid lines are not scored
+        encodedLines = []
+        validIdx = []
+        for idx, strLine in enumerate(request["lines"]):
+            line = LANLLine(strLine.rstrip("\r\n"), self.anomalyScorer.lineLength)
+            if line.keepLine:
+                encodedLines.append(line.getEncodedLine(self.anomalyScorer.voc))
+                validIdx.append(idx)
+
+        scores = [None] * len(request["lines"])
+        anomalies = [None] * len(request["lines"])
+        if len(encodedLines) > 0:
+            # Errors of the model (raised again by the future) or of a closing batcher are answered, the connection is kept
+            try:
+                future = self.microBatcher.submit(torch.tensor(encodedLines, dtype=self.anomalyScorer.dtype, device=self.anomalyScorer.device))
+                if future is None:
+                    return {"error": "overloaded"}
+                scoresListTensor, scoresSum = future.result()
+            except Exception as exception:
+                return {"error": "scoring failed : " + str(exception)}
+            for idx, score in zip(validIdx, scoresSum.cpu().tolist()):
+                scores[idx] = score
+                # Lines with a score strictly positive are out of the hypersphere
+                anomalies[idx] = score > 0
+
+        return {"scores": scores, "anomalies": anomalies}
+
+
+class TcpScoringServer(_ScoringServerMixin, socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+
+
+if hasattr(socketserver, "ThreadingUnixStreamServer"):
+    class UnixScoringServer(_ScoringServerMixin, socketserver.ThreadingUnixStreamServer):
+        pass
+
+
+def runScoringServer(corpusName, pathAllData, anoClassModelFilename, socketPath="", host="127.0.0.1", port=0):
+    """
+    Load the model and serve scoring requests until interrupted
+    :param socketPath: Path of the Unix domain socket. If empty, the server listens on TCP host:port
+    :param host: Host of the TCP server. Keep a local address : requests are not authenticated
+    :param port: Port of the TCP server. If 0, a free port is chosen and printed
+    """
+
+    # Retrieving paths
+    paths = Paths(pathAllData, corpusName)
+
+    # Set logging level
+    logger = logging.getLogger()
+    logger.setLevel(logging.ERROR)
+
+    # Micro batching : a batch is scored when it has maxBatchSize lines or when its oldest request waited maxDelay seconds
+    maxBatchSize = 1024
+    maxDelay = 0.005
+
+    # Maximum count of lines waiting to be scored. Requests arriving when the queue is full are rejected with the error "overloaded"
+    maxQueueLines = 65536
+
+    # Maximum count of lines in the score cache. If 0, cache is disabled
+    scoreCacheSize = 1000000
+
+    # Count of last requests used to calculate latency percentiles
+    latencyWindowSize = 10000
+
+    # Positions scored (see LANLPositionSelection). If None, all the positions are scored
+    positions = None
+
+    #  Tensors parameters
+    dtype = torch.long
+    if torch.cuda.is_available():
+        print("Scoring server on GPU")
+        device = torch.device("cuda")
+    else:
+        print("Scoring server on CPU")
+        device = torch.device("cpu")
+
+    #  Construct the DL model once for all requests
+    anomalyScorer = AnomalyScorer(device, dtype, paths.vocabularyCachePath, corpusName, paths.modelPath + anoClassModelFilename, positions=positions)
+    if scoreCacheSize > 0:
+        anomalyScorer.scoreCache = ScoreCache(scoreCacheSize, anomalyScorer.fingerprint)
+
+    latencyStats = LatencyStats(latencyWindowSize)
+    microBatcher = MicroBatcher(anomalyScorer.score, maxBatchSize, maxDelay, maxQueueLines, latencyStats)
+
+    if socketPath != "":
+        if os.path.exists(socketPath):
+            os.remove(socketPath)
+        server = UnixScoringServer(socketPath, ScoringRequestHandler)
+        print("Listening on " + socketPath)
+    else:
+        server = TcpScoringServer((host, port), ScoringRequestHandler)
+        print("Listening on " + str(server.server_address[0]) + ":" + str(server.server_address[1]))
+    server.initScoring(anomalyScorer, microBatcher, latencyStats)
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        microBatcher.close()
+        if socketPath != "" and os.path.exists(socketPath):
+            os.remove(socketPath)
+        print("Scoring server stopped : " + json.dumps(latencyStats.summary()))
+
+
+if __name__ == "__main__":
+    print("Beginning of program")
+    # execute only if run as a script
+    try:
+        # Parsing command lines option
+        progArg = ProgramArguments(withModel=True)
+
+        # Path of the Unix domain socket. If empty, the server listens on localhost TCP port
+        socketPath = ""
+        port = 7007
+
+        runScoringServer(progArg.corpusName, progArg.pathData, progArg.modelFile, socketPath, port=port)
+
+    finally:
+        print("=============== End of program ===============")
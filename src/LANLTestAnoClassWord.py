@@ -6,21 +6,37 @@ Test classifier trained in anomalyClassification.py
 
 import logging
 import os
-import re
-from collections import Counter
 
+import numpy as np
 import torch
-import torch.nn as nn
 
-from src.model.LANLWordModel import LANLWordModel
+from src.model.AnomalyScorer import AnomalyScorer
+from src.model.StudentScorer import TwoStageScorer, loadStudent
 from src.tools.Graphs import Graphs
+from src.tools.Instrumentation import Instrumentation
 from src.tools.Paths import Paths
+from src.tools.Profiling import StageProfiler
 from src.tools.ProgramArguments import ProgramArguments
-from src.tools.Timer import Timer
+from src.tools.ScoreCache import ScoreCache
 from src.tools.line.LinesTools import LinesTools
+from src.tools.metrics.AnomalyReport import EntityRollup, TopKAnomalies, writeAnomalyReport
+from src.tools.metrics.LabelIndex import LabelIndex, SortedLabelIndex
+from src.tools.metrics.MetricAccumulators import FmeasureAccumulator
+from src.tools.metrics.MetricsWriter import MetricsWriter
+from src.tools.metrics.ScoreHistogram import ScoreHistogram
+from src.tools.metrics.ScoreSink import ScoreSink
 
 
-def testAnomalyClassification(corpusName, pathAllData, anoClassModelFilename, desiredBatchSize, desiredLinesPerBatch, slidingWindowRenewRate, redteamFilePath, testFilePath=""):
+def testAnomalyClassification(corpusName, pathAllData, anoClassModelFilename, desiredBatchSize, desiredLinesPerBatch, slidingWindowRenewRate, redteamFilePath, testFilePath="", profilePath="",
+                              studentModelFilename="", positions=None):
+    """
+    Score the test lines with the anomaly classifier and calculate the metrics with the redteam annotations
+    :param studentModelFilename: If not empty, student saved by LANLDistillStudent : lines are screened by the student and only lines above
+                                 its threshold are scored by the anomaly classifier (see TwoStageScorer)
+    :param positions: Positions scored by the anomaly classifier (see LANLPositionSelection). If None, all the positions are scored
+    :return: Dictionary with the counts of lines (lines, linesIn, linesOut), true positives and false positives
+             (and the report of the screening under "screening" if a student is used)
+    """
 
     # Retrieving paths
     paths = Paths(pathAllData, corpusName)
@@ -35,6 +51,46 @@ def testAnomalyClassification(corpusName, pathAllData, anoClassModelFilename, de
     # Decide if the graphs are drawn or if we save only values on the disk
     drawGraph = True
 
+    # If > 0, redteam file (sorted by timestamp) is joined with test lines by time buckets of this duration instead of being fully loaded in memory
+    redteamBucketSize = 0
+
+    # If not None, scores and labels of test lines are written in this directory and read back as memory-mapped arrays
+    scoreSpillDirectory = None
+
+    # Report of the most anomalous lines and of the scores aggregated by source user and source computer
+    reportPath = os.path.join(pathAllData, "LANLanoClassOutEx.txt") # Written in the data directory, never in the working directory
+    topAnomaliesCount = 1000 # Count of lines with the highest score kept in the report
+    maxEntities = 1000000 # Maximum count of source users and source computers aggregated. Least recently seen are evicted
+    reportStep = 0 # If > 0, report is written every reportStep lines tested. Always written at the end
+
+    # Scores of already seen lines are reused instead of running the models again
+    scoreCacheSize = 0 # Maximum count of lines in the cache. If 0, cache is disabled. Each line costs about 400 bytes (about 400 MB for 1000000 lines)
+    scoreCachePath = "" # If not empty, cache is loaded from and saved to this file. It's emptied if the model changed
+
+    # If not empty, histograms of the scores by label are saved in this file. They can be merged with histograms of other runs (ScoreHistogram.mergeFiles)
+    scoreHistogramPath = ""
+
+    # With a student : fraction of the lines screened out by the student also scored by the anomaly classifier to estimate the recall lost
+    studentAuditRate = 0.05
+
+    # Timers and counters of the test. If paths are not empty, they are exported every metricsExportInterval seconds
+    metricsJsonLinesPath = "" # Snapshots appended as JSON lines
+    metricsPrometheusPath = "" # Prometheus text file (e.g. for the textfile collector of node_exporter)
+    metricsExportInterval = 60
+    instrumentation = Instrumentation(metricsJsonLinesPath, metricsPrometheusPath, metricsExportInterval)
+
+    # Profiling mode : if profilePath is not empty, a window of batches is profiled by torch.profiler and memory is traced at each step
+    profileSkipBatches = 10 # First batches are not profiled
+    profileWarmupBatches = 2
+    profiledBatches = 20
+    profiler = StageProfiler(profilePath, "test", profileSkipBatches, profileWarmupBatches, profiledBatches)
+
+    # If not empty, progress, results and timers are written as records in files (see MetricsWriter, read with loadMetrics)
+    # instead of the progress reports printed during the test
+    metricsStreamPath = ""
+    metricsStreamFormat = "jsonl" # jsonl or csv
+    metricsWriter = MetricsWriter(metricsStreamPath, metricsStreamFormat)
+
     """ ==========================
              Process the lines 
         ==========================     
@@ -53,33 +109,34 @@ def testAnomalyClassification(corpusName, pathAllData, anoClassModelFilename, de
         cudaOK = False
 
     #  Construct the DL model
-    # Load dictionary with encoder, R and c
-    savedAnoClassWordModel = torch.load(paths.modelPath + anoClassModelFilename, map_location=device)
-
-    wordModelList = []
-    RList = []
-    cList = []
-    for i in range(len(savedAnoClassWordModel)):
-        wordModel = LANLWordModel(device, dtype, paths.vocabularyCachePath, corpusName, savedAnoClassWordModel["word" + str(i)]["model"])
-        wordModel.eval()
-        if cudaOK:
-            wordModel.to(device)
-        wordModelList.append(wordModel)
-        RList.append(savedAnoClassWordModel["word" + str(i)]["R"])
-        cList.append(savedAnoClassWordModel["word" + str(i)]["c"])
+    anomalyScorer = AnomalyScorer(device, dtype, paths.vocabularyCachePath, corpusName, paths.modelPath + anoClassModelFilename, positions=positions)
+    if scoreCacheSize == 0:
+        scoreCache = None
+    elif scoreCachePath != "":
+        scoreCache = ScoreCache.load(scoreCachePath, anomalyScorer.fingerprint, scoreCacheSize)
+    else:
+        scoreCache = ScoreCache(scoreCacheSize, anomalyScorer.fingerprint)
+    anomalyScorer.scoreCache = scoreCache
+    scoreLines = anomalyScorer.score
+    twoStageScorer = None
+    if studentModelFilename != "":
+        studentModel, savedStudent = loadStudent(paths.modelPath + studentModelFilename, device)
+        if savedStudent["teacherFingerprint"] != anomalyScorer.fingerprint:
+            raise ValueError("Student ", studentModelFilename, " was not distilled from the anomaly classifier ", anoClassModelFilename)
+        twoStageScorer = TwoStageScorer(anomalyScorer, studentModel, savedStudent["threshold"], savedStudent["positionScores"], studentAuditRate,
+                                        savedStudent["report"]["teacherSecondsPerLine"])
+        scoreLines = twoStageScorer.score
+        print("Screening by the student " + studentModelFilename + " with threshold " + str(savedStudent["threshold"]))
 
     # Load lines parameters
-    linesParam = LinesTools(corpusName, wordModelList[0].voc, wordModelList[0].lineLength)
+    linesParam = LinesTools(corpusName, anomalyScorer.voc, anomalyScorer.lineLength)
+    profiler.boundary("model")
 
-    #  Special loss function for anomaly detection
-    lossFunc = nn.CrossEntropyLoss(reduction="none")
-    lossRepeat = 1000
-
-    # Load a redteam file in a list to calculate true positive and false positive
-    redteamFile = open(redteamFilePath, "r")
-    redLineList = []
-    for redLine in redteamFile:
-        redLineList.append(re.sub('\n', '', redLine).lower())
+    # Index redteam events to calculate true positive and false positive
+    if redteamBucketSize > 0:
+        labelIndex = SortedLabelIndex(redteamFilePath, redteamBucketSize)
+    else:
+        labelIndex = LabelIndex(redteamFilePath)
 
     # Test files
     with torch.no_grad():
@@ -87,120 +144,135 @@ def testAnomalyClassification(corpusName, pathAllData, anoClassModelFilename, de
         batchOutCount = 0
         batchInCount = 0
         print("R**2 = ")
-        for idx, R in enumerate(RList):
-            print("word" + str(idx) + " : " + str(R))
+        for idx, R in enumerate(anomalyScorer.RList):
+            print("word" + str(idx) + " : " + str(R) + ("" if idx in anomalyScorer.positions else " (not scored)"))
 
         datasetIterator = linesParam.loadBatch(testFilePath, False, desiredBatchSize, desiredLinesPerBatch, slidingWindowRenewRate, False)
 
-        outLineList = []
-
-        timerTotal = Timer()
-        timerModel = Timer()
+        timerTotal = instrumentation.timer("test")
+        timerModel = instrumentation.timer("test/model")
+        timerProgress = instrumentation.timer("test/progress") # Progress reports, inside the single "test" span
 
-        scoresListMetrics = [] # Stores all scores for metrics calculation
+        scoreSink = ScoreSink(spillDirectory=scoreSpillDirectory) # Stores all scores for metrics calculation
+        topAnomalies = TopKAnomalies(topAnomaliesCount)
+        entityRollup = EntityRollup(maxEntities=maxEntities)
+        scoreHistogram = ScoreHistogram() if scoreHistogramPath != "" else None
+        fmeasureAccumulator = FmeasureAccumulator(1, device) # Lines out of the hypersphere against labels, counted on the device
 
+        profiler.start()
         timerTotal.start()
         for batch in datasetIterator:
 
             timerModel.start()
 
             inputTensor = linesParam.convertBatchIntoTensor(batch, dtype, device)
-            inputTensor = inputTensor.view(-1, wordModelList[0].lineLength)
+            inputTensor = inputTensor.view(-1, anomalyScorer.lineLength)
             currentBatchSize = inputTensor.size(0)
-            distList = []
-            scoresList = []
-            for i in range(inputTensor.size(1)):
-
-                trainInputTensor = torch.cat((inputTensor[:, 0:i], inputTensor[:, i+1:]), 1)
-                trainTargetTensor = inputTensor[:, i]
-
-                wordModelOutput = wordModelList[i](trainInputTensor)
-                targetTensorLoss = trainTargetTensor.view(-1)
-
-                # Adding loss to the last hidden layer output
-                currentLoss = lossFunc(wordModelOutput, targetTensorLoss)
-                repeatLoss = currentLoss.unsqueeze(1).repeat(1, lossRepeat)
-                catOutLoss = torch.cat((wordModelList[i].lastHiddenLayer, repeatLoss), 1)
 
-                # Calculate distance
-                dist = torch.sum((catOutLoss - cList[i]) ** 2, dim=1)
-
-                distList.append(dist)
-                scores = distList[i] - (RList[i] ** 2)
-                scoresList.append(scores)
-
-            
-            # Calculate score for a line (= sum of score of each word)
+            # Score of each word and score of the line (= sum of score of each word)
             # If it's strictly positive => anomaly. If not => no anomaly
-            scoresListTensor = torch.stack(scoresList)
-            scoresSum = torch.sum(scoresListTensor, 0)
-            for lineIdx in range(scoresSum.size(0)):
-                currentLine = batch[lineIdx][0][0]
-                lineExtract = currentLine.ts + "," + currentLine.sourceUser + "," + currentLine.sourceComputer + "," + currentLine.destComputer
-                if lineExtract in redLineList:
-                    scoresListMetrics.append((scoresSum[lineIdx], 1))
-                else:
-                    scoresListMetrics.append((scoresSum[lineIdx], 0))
-
-            scoresSumPositive = (torch.gt(scoresSum, 0) == 1).nonzero().squeeze()
-            if scoresSumPositive.dim() > 0:
-                # More than 2 distance are greater than radius
-                listIndexOut = scoresSumPositive.tolist()
-            else:
-                # 1 or 0 distance greater than radius
-                listIndexOut = [scoresSumPositive.item()]
+            with profiler.region("score"):
+                scoresListTensor, scoresSum = scoreLines(inputTensor)
+            timerModel.stop()
+            labels = labelIndex.labelBatch(batch)
+            scoresSumArray = scoresSum.cpu().numpy()
+            scoreSink.append(scoresSumArray, labels)
+            if scoreHistogram is not None:
+                scoreHistogram.add(scoresSumArray, labels)
+
+            # Update the report
+            batchLines = [line for lineList, fileName in batch for line in lineList]
+            batchFiles = [fileName for lineList, fileName in batch for line in lineList]
+            topAnomalies.update(scoresSumArray, batchLines, scoresListTensor.t().cpu().numpy(), batchFiles)
+            entityRollup.update(scoresSumArray, batchLines)
+
+            # Lines with a score strictly positive are out of the hypersphere
+            fmeasureAccumulator.update(torch.gt(scoresSum, 0), torch.as_tensor(labels, device=device))
+            outCount = int(np.count_nonzero(scoresSumArray > 0))
 
             totalBatchCount += currentBatchSize
-            batchInCount += currentBatchSize - len(listIndexOut)
-            batchOutCount += len(listIndexOut)
-            if len(listIndexOut) > 0:
-                # At least one batch has a larger distance than radius. Save all these batch
-                for i in listIndexOut:
-                    outLineList.append((batch[i][0], batch[i][1], scoresSum[i]))
-                """
-                print("New batch out hypersphere")
-                print("R**2 = " + str(R ** 2))
-                print("Dist = " + str(dist))
-                print("Index out = " + str(listIndexOut))
-                """
-
-            if totalBatchCount % 1000 == 0:
-                timerTotal.stop()
+            batchInCount += currentBatchSize - outCount
+            batchOutCount += outCount
+            instrumentation.count("test/batches")
+            instrumentation.count("test/lines", currentBatchSize)
+            instrumentation.count("test/bytes", sum(len(line.inputRawStrLine) for line in batchLines))
+            instrumentation.count("test/anomalies", outCount)
+            instrumentation.maybeExport()
+
+            if reportStep > 0 and totalBatchCount // reportStep > (totalBatchCount - currentBatchSize) // reportStep:
+                writeAnomalyReport(reportPath, topAnomalies, entityRollup)
+
+            if totalBatchCount % 1000 == 0 and metricsWriter.enabled:
+                metricsWriter.write("test", lines=totalBatchCount, linesIn=batchInCount, linesOut=batchOutCount,
+                                    linesPerSecond=totalBatchCount / max(timerModel.totalElapsedTime, 1e-9),
+                                    scoreCacheHitRate=scoreCache.getHitRate() if scoreCache is not None else float("nan"))
+            elif totalBatchCount % 1000 == 0:
+                timerProgress.start()
                 print("Batch processed : " + str(totalBatchCount))
                 print("Batch in hypersphere : " + str(batchInCount))
                 print("Batch out hypersphere : " + str(batchOutCount))
-                print("Timers : ")
-                print("  Total time : " + str(timerTotal.totalElapsedTime))
-                print("  Model time : " + str(timerModel.totalElapsedTime))
-                timerTotal.start()
+                instrumentation.printReport()
+                if scoreCache is not None:
+                    print("Score cache hit rate : " + str(scoreCache.getHitRate()))
+                timerProgress.stop()
+            profiler.step()
 
         timerTotal.stop()
+        profiler.stopBatches()
+        profiler.boundary("test")
 
-    outputFileOutEx = open("LANLanoClassOutEx.txt", 'w')
-    # Analyze batch out hypersphere
-    truePositive = 0
-    falsePositive = 0
+    if scoreCache is not None and scoreCachePath != "":
+        scoreCache.save(scoreCachePath)
 
-    outputFileOutEx.close()
+    if scoreHistogram is not None:
+        scoreHistogram.save(scoreHistogramPath)
+        bestFmeasure, bestThreshold, bestFmeasureUpperBound, thresholdWidth = scoreHistogram.bestFmeasure()
+        print("Best fmeasure (histogram) : ", bestFmeasure, " with threshold ", bestThreshold, " (upper bound : ", bestFmeasureUpperBound, ")")
 
-    print(Counter(elem[1] for elem in scoresListMetrics))
-    graphs = Graphs(scoresListMetrics, 1, 0, 0, 1, 0.01, "sort", cudaOK)
+    writeAnomalyReport(reportPath, topAnomalies, entityRollup)
+
+    # Analyze batch out hypersphere
+    scoreSink.close()
+    fmeasure = fmeasureAccumulator.getFmeasure()
+    truePositive = fmeasure.truePositive
+    falsePositive = fmeasure.falsePositive
+
+    print(scoreSink.labelCounts())
+    with instrumentation.span("curves"):
+        graphs = Graphs(scoreSink, 1, 0, 0, 1, 0.01, "sort", cudaOK)
     if drawGraph:
         graphs.drawPrecisionRecallCurve()
     else:
         # Save graphs value on the disk
         torch.save(graphs, os.path.join(pathAllData, "graphValue.obj"))
+    profiler.stop()
 
     print("End of anomaly classification")
     print("Total batch tested : " + str(totalBatchCount))
     print("Batch in hypersphere : " + str(batchInCount))
     print("Batch out hypersphere : " + str(batchOutCount))
-    print("Timers : ")
-    print("  Total time : " + str(timerTotal.totalElapsedTime))
-    print("  Model time : " + str(timerModel.totalElapsedTime))
+    instrumentation.printReport()
+    if scoreCache is not None:
+        print("Score cache hit rate : " + str(scoreCache.getHitRate()) + " (" + str(len(scoreCache)) + " lines in cache)")
     print("Results : ")
     print("True positive : ", truePositive)
     print("False positive : ", falsePositive)
+    print("Precision : ", fmeasure.precision, " / Recall : ", fmeasure.recall, " / Fmeasure : ", fmeasure.fmeasure)
+    if twoStageScorer is not None:
+        screeningReport = twoStageScorer.report()
+        print("Screening by the student : ")
+        for name, value in screeningReport.items():
+            print("  " + name + " : " + str(value))
+    instrumentation.export()
+    metricsWriter.write("testResults", lines=totalBatchCount, linesIn=batchInCount, linesOut=batchOutCount,
+                        truePositive=truePositive, falsePositive=falsePositive)
+    metricsWriter.writeTimers(instrumentation, "test")
+    metricsWriter.close()
+
+    results = {"lines": totalBatchCount, "linesIn": batchInCount, "linesOut": batchOutCount, "truePositive": truePositive, "falsePositive": falsePositive}
+    if twoStageScorer is not None:
+        results["screening"] = screeningReport
+    return results
 
 
 if __name__ == "__main__":
@@ -220,7 +292,8 @@ if __name__ == "__main__":
 
         redteamFilePath = os.path.join(pathAllData, "redteam_example")
 
-        testAnomalyClassification(corpusName, pathAllData, anoClassModelFilename, desiredBatchSize, desiredLinesPerBatch, slidingWindowRenewRate, redteamFilePath)
+        testAnomalyClassification(corpusName, pathAllData, anoClassModelFilename, desiredBatchSize, desiredLinesPerBatch, slidingWindowRenewRate, redteamFilePath,
+                                  profilePath=progArg.profilePath)
 
 
     finally:
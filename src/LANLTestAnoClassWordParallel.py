@@ -0,0 +1,215 @@
+# -*- coding: utf8 -*-
+
+"""
+Test classifier trained in anomalyClassification.py with several processes
+Test files are split in shards (files, or byte ranges of large files) scored by worker processes. Results of the shards are merged in one evaluation
+"""
+
+import logging
+import multiprocessing
+import os
+from collections import Counter
+
+import torch
+
+import src.tools.fileAccess as fa
+from src.model.AnomalyScorer import AnomalyScorer
+from src.tools.Graphs import Graphs
+from src.tools.Paths import Paths
+from src.tools.ProgramArguments import ProgramArguments
+from src.tools.ScoreCache import ScoreCache
+from src.tools.Timer import Timer
+from src.tools.line.LinesTools import LinesTools
+from src.tools.metrics.LabelIndex import LabelIndex
+from src.tools.metrics.ScoreSink import ScoreSink
+
+
+# Objects of a worker process, loaded once by initWorker and used for all its shards
+_workerState = {}
+
+
+def initWorker(corpusName, vocabularyCachePath, anoClassModelPath, redteamFilePath, scoreCacheSize, sharedState=None):
+    """
+    Load the model, the lines parameters and the redteam index in a worker process
+    Workers score on CPU with one thread each : parallelism comes from the processes
+    :param sharedState: Model loaded by the driver with AnomalyScorer.loadSharedState. If None, each worker loads its own copy of the model
+    """
+    torch.set_num_threads(1)
+    logging.getLogger().setLevel(logging.ERROR)
+
+    anomalyScorer = AnomalyScorer(torch.device("cpu"), torch.long, vocabularyCachePath, corpusName, anoClassModelPath, sharedState=sharedState)
+    if scoreCacheSize > 0:
+        anomalyScorer.scoreCache = ScoreCache(scoreCacheSize, anomalyScorer.fingerprint)
+
+    _workerState["anomalyScorer"] = anomalyScorer
+    _workerState["linesParam"] = LinesTools(corpusName, anomalyScorer.voc, anomalyScorer.lineLength)
+    _workerState["labelIndex"] = LabelIndex(redteamFilePath)
+
+
+def scoreShard(shardArgs):
+    """
+    Score the lines of a shard in a worker process
+    :param shardArgs: Tuple (shard, desiredBatchSize, desiredLinesPerBatch, slidingWindowRenewRate). Shard is a list of byte ranges (file, startByte, endByte)
+    :return: Dictionary with the scores (numpy float32) and the labels (numpy int8) of the lines in the shard order, and a Counter of the shard
+    """
+    shard, desiredBatchSize, desiredLinesPerBatch, slidingWindowRenewRate = shardArgs
+    anomalyScorer = _workerState["anomalyScorer"]
+    linesParam = _workerState["linesParam"]
+    labelIndex = _workerState["labelIndex"]
+    scoreCache = anomalyScorer.scoreCache
+
+    counters = Counter()
+    if scoreCache is not None:
+        counters["cacheHitCount"] -= scoreCache.hitCount
+        counters["cacheMissCount"] -= scoreCache.missCount
+
+    timerModel = Timer()
+    scoreSink = ScoreSink()
+    with torch.no_grad():
+        for batch in linesParam.loadBatch(shard, False, desiredBatchSize, desiredLinesPerBatch, slidingWindowRenewRate, False):
+            timerModel.start()
+            inputTensor = linesParam.convertBatchIntoTensor(batch, torch.long, torch.device("cpu"))
+            inputTensor = inputTensor.view(-1, anomalyScorer.lineLength)
+            scoresListTensor, scoresSum = anomalyScorer.score(inputTensor)
+            timerModel.stop()
+
+            scoreSink.append(scoresSum.numpy(), labelIndex.labelBatch(batch))
+
+            # Lines with a score strictly positive are out of the hypersphere
+            outCount = int(torch.sum(torch.gt(scoresSum, 0)))
+            counters["totalBatchCount"] += inputTensor.size(0)
+            counters["batchInCount"] += inputTensor.size(0) - outCount
+            counters["batchOutCount"] += outCount
+
+    if scoreCache is not None:
+        counters["cacheHitCount"] += scoreCache.hitCount
+        counters["cacheMissCount"] += scoreCache.missCount
+
+    return {"scores": scoreSink.scores, "labels": scoreSink.labels, "counters": counters, "modelTime": timerModel.totalElapsedTime}
+
+
+def testAnomalyClassificationParallel(corpusName, pathAllData, anoClassModelFilename, desiredBatchSize, desiredLinesPerBatch, slidingWindowRenewRate, redteamFilePath,
+                                      testFilePath="", workerCount=0):
+    """
+    Same evaluation as testAnomalyClassification with the test files scored by several processes
+    :param workerCount: Count of worker processes. If 0, one worker per CPU core
+    :return: Dictionary with the counts of lines (lines, linesIn, linesOut), true positives and false positives
+    """
+
+    # Retrieving paths
+    paths = Paths(pathAllData, corpusName)
+
+    # Set logging level
+    logger = logging.getLogger()
+    logger.setLevel(logging.ERROR)
+
+    if testFilePath == "":
+        testFilePath = paths.testPath
+
+    if workerCount <= 0:
+        workerCount = os.cpu_count()
+
+    # Decide if the graphs are drawn or if we save only values on the disk
+    drawGraph = True
+
+    # Files larger than this size (in bytes) are split in byte ranges scored by different workers
+    # Only used with one line per batch unit, because a batch unit can't have lines of two ranges
+    shardBytes = 64 * 1024 * 1024
+
+    # Maximum count of lines in the score cache of each worker. If 0, cache is disabled. Each line costs about 400 bytes
+    # (about 400 MB per worker for 1000000 lines)
+    scoreCacheSize = 0
+
+    # If True, model and vocabulary are loaded once in shared memory and workers are forked from the driver, so they don't have their own copy
+    sharedModel = True
+
+    """ ==========================
+             Split the lines
+        ==========================
+    """
+    # Shards are sorted by file then by position in the file, and merged in this order
+    shardList = []
+    for file in sorted(fa.files_iterator(testFilePath)):
+        for byteRange in fa.file_byte_ranges(file, shardBytes if desiredLinesPerBatch == 1 else 0):
+            shardList.append([byteRange])
+    print("Testing anomaly classification on CPU with " + str(workerCount) + " processes (" + str(len(shardList)) + " shards)")
+
+    """ ==========================
+             Process the lines
+        ==========================
+    """
+    timerTotal = Timer()
+    timerTotal.start()
+
+    scoreSink = ScoreSink() # Stores all scores for metrics calculation
+    counters = Counter()
+    modelTime = 0
+    if sharedModel:
+        sharedState = AnomalyScorer.loadSharedState(paths.vocabularyCachePath, corpusName, paths.modelPath + anoClassModelFilename)
+        processContext = multiprocessing.get_context("fork")
+    else:
+        sharedState = None
+        processContext = multiprocessing.get_context("spawn")
+    workerArgs = (corpusName, paths.vocabularyCachePath, paths.modelPath + anoClassModelFilename, redteamFilePath, scoreCacheSize, sharedState)
+    shardArgsList = [(shard, desiredBatchSize, desiredLinesPerBatch, slidingWindowRenewRate) for shard in shardList]
+    with processContext.Pool(workerCount, initWorker, workerArgs) as pool:
+        for shardResult in pool.imap(scoreShard, shardArgsList):
+            scoreSink.append(shardResult["scores"], shardResult["labels"])
+            counters.update(shardResult["counters"])
+            modelTime += shardResult["modelTime"]
+
+    timerTotal.stop()
+
+    # Analyze batch out hypersphere
+    linesOut = scoreSink.scores > 0
+    truePositive = int((linesOut & (scoreSink.labels == 1)).sum())
+    falsePositive = int((linesOut & (scoreSink.labels != 1)).sum())
+
+    print(scoreSink.labelCounts())
+    graphs = Graphs(scoreSink, 1, 0, 0, 1, 0.01, "sort", False)
+    if drawGraph:
+        graphs.drawPrecisionRecallCurve()
+    else:
+        # Save graphs value on the disk
+        torch.save(graphs, os.path.join(pathAllData, "graphValue.obj"))
+
+    print("End of anomaly classification")
+    print("Total batch tested : " + str(counters["totalBatchCount"]))
+    print("Batch in hypersphere : " + str(counters["batchInCount"]))
+    print("Batch out hypersphere : " + str(counters["batchOutCount"]))
+    print("Timers : ")
+    print("  Total time : " + str(timerTotal.totalElapsedTime))
+    print("  Model time (sum of workers) : " + str(modelTime))
+    if scoreCacheSize > 0:
+        cacheLookupCount = counters["cacheHitCount"] + counters["cacheMissCount"]
+        print("Score cache hit rate : " + str(round(counters["cacheHitCount"] / cacheLookupCount, 6) if cacheLookupCount > 0 else 0))
+    print("Results : ")
+    print("True positive : ", truePositive)
+    print("False positive : ", falsePositive)
+
+    return {"lines": counters["totalBatchCount"], "linesIn": counters["batchInCount"], "linesOut": counters["batchOutCount"],
+            "truePositive": truePositive, "falsePositive": falsePositive}
+
+
+if __name__ == "__main__":
+    print("Beginning of program")
+    # execute only if run as a script
+    try:
+        # Parsing command lines option
+        progArg = ProgramArguments(withModel=True)
+
+        corpusName = progArg.corpusName
+        pathAllData = progArg.pathData
+        anoClassModelFilename = progArg.modelFile
+
+        desiredBatchSize = 128
+        desiredLinesPerBatch = 1
+        slidingWindowRenewRate = 1
+
+        redteamFilePath = os.path.join(pathAllData, "redteam_example")
+
+        testAnomalyClassificationParallel(corpusName, pathAllData, anoClassModelFilename, desiredBatchSize, desiredLinesPerBatch, slidingWindowRenewRate, redteamFilePath)
+
+
+    finally:
+        print("=============== End of program ===============")
@@ -9,11 +9,35 @@ import src.tools.misc as miscTool
 from src.model.LANLWordModel import LANLWordModel
 from src.tools.ModelSave import ModelSave
 from src.tools.Paths import Paths
-from src.tools.Timer import Timer
+from src.tools.Instrumentation import Instrumentation
+from src.tools.Profiling import StageProfiler
 from src.tools.line.LinesTools import LinesTools
-from src.tools.metrics.Accuracy import Accuracy
+from src.tools.metrics.MetricAccumulators import AccuracyAccumulator, scalarsToHost
+from src.tools.metrics.MetricsWriter import MetricsWriter
+from src.tools.training.EarlyStopping import EarlyStopping
+from src.tools.training.ImportanceSampler import ImportanceSampler
+from src.tools.training.LearningRateScheduler import LearningRateScheduler
+
+def LANLTrainWord(corpusName, pathAllData, desiredBatchSize, desiredLinesPerBatch, slidingWindowRenewRate, devCalculStep, learningRate, epochNumber,
+                  earlyStoppingPatience=0, lrScheduleName="constant", dedupWindowSize=None,
+                  importanceSampling=False, shuffleBufferSize=0, interleaveFiles=1, profilePath=""):
+    """
+    Train one word model for each position of the line
+    :param earlyStoppingPatience: Number of dev evaluations without dev loss improvement before stopping the training of a position.
+                                  0 disables early stopping (all positions are trained during epochNumber epochs)
+    :param lrScheduleName: Learning rate schedule applied to each position (see LearningRateScheduler.SCHEDULES)
+    :param dedupWindowSize: If not None, identical lines are collapsed in windows of dedupWindowSize lines (0 = whole train dataset)
+                            and trained once with a loss weighted by their count. Needs desiredLinesPerBatch = 1
+    :param importanceSampling: If True, lines are selected with a probability depending on their recent loss (well predicted lines are skipped more often)
+                               and weighted by the inverse of this probability
+    :param shuffleBufferSize: If > 0, train lines are shuffled with a buffer of this number of lines (lines of all files are mixed)
+    :param interleaveFiles: If > 1, number of train files read at the same time (lines of all files are mixed)
+    :param profilePath: If not empty, directory where the profiling results are written (see StageProfiler)
+    :return: Path of the saved word models. If early stopping is enabled, each position is saved with its best dev parameters
+    """
 
-def LANLTrainWord(corpusName, pathAllData, desiredBatchSize, desiredLinesPerBatch, slidingWindowRenewRate, devCalculStep, learningRate, epochNumber):
+    if dedupWindowSize is not None and desiredLinesPerBatch != 1:
+        raise ValueError("Deduplication of lines needs 1 line per batch unit")
 
     # Uncomment to simplify debugging on graphic card
     #os.environ['CUDA_LAUNCH_BLOCKING'] = "1"
@@ -25,6 +49,24 @@ def LANLTrainWord(corpusName, pathAllData, desiredBatchSize, desiredLinesPerBatc
     logger = logging.getLogger()
     logger.setLevel(logging.ERROR)
 
+    # Timers and counters of the training. If paths are not empty, they are exported every metricsExportInterval seconds
+    metricsJsonLinesPath = "" # Snapshots appended as JSON lines
+    metricsPrometheusPath = "" # Prometheus text file (e.g. for the textfile collector of node_exporter)
+    metricsExportInterval = 60
+    instrumentation = Instrumentation(metricsJsonLinesPath, metricsPrometheusPath, metricsExportInterval)
+
+    # If not empty, losses, accuracies, throughput and timers are written as records in files (see MetricsWriter, read with loadMetrics)
+    # instead of the PLOTLOSS lines and the timer reports printed at each dev evaluation
+    metricsStreamPath = ""
+    metricsStreamFormat = "jsonl" # jsonl or csv
+    metricsWriter = MetricsWriter(metricsStreamPath, metricsStreamFormat)
+
+    # Profiling mode : if profilePath is not empty, a window of batches is profiled by torch.profiler and memory is traced at each step
+    profileSkipBatches = 10 # First batches are not profiled
+    profileWarmupBatches = 2
+    profiledBatches = 20
+    profiler = StageProfiler(profilePath, "train", profileSkipBatches, profileWarmupBatches, profiledBatches)
+
     #--- Vocabulary creation/loading ---
     print("Start vocabulary loading")
 
@@ -32,11 +74,10 @@ def LANLTrainWord(corpusName, pathAllData, desiredBatchSize, desiredLinesPerBatc
     forceRefreshVocabularyCache = False
     stopAfterVocCreation = False
 
-    loadVocabularyTimer = Timer()
-    loadVocabularyTimer.start()
-    wordDic = miscTool.loadVocabulary(paths.corpusPath, useVocabularyCache, paths.vocabularyCachePath, corpusName, forceRefreshVocabularyCache)
-    loadVocabularyTimer.stop()
+    with instrumentation.span("vocabulary") as loadVocabularyTimer:
+        wordDic = miscTool.loadVocabulary(paths.corpusPath, useVocabularyCache, paths.vocabularyCachePath, corpusName, forceRefreshVocabularyCache)
     print("Vocabulary loading time : " + str(loadVocabularyTimer.totalElapsedTime) + " seconds")
+    profiler.boundary("vocabulary")
 
     # Stop program there if you want to only create the vocabulary
     if stopAfterVocCreation:
@@ -91,6 +132,32 @@ def LANLTrainWord(corpusName, pathAllData, desiredBatchSize, desiredLinesPerBatc
 
         optimizerList.append(optim.Adam(wordModel.parameters(), lr=learningRate))
 
+    # Convergence control parameters
+    earlyStoppingMinDelta = 0.0 # Minimum dev loss decrease considered as an improvement
+    warmupSteps = 500 # Batches of warmup for warmup and cosine schedules
+    cosineCycleSteps = 20000 # Batches of cosine decrease after warmup
+    minLearningRate = learningRate / 100 # Lower bound of the learning rate for cosine and plateau schedules
+    plateauFactor = 0.5 # Learning rate factor when a plateau is detected
+    plateauPatience = 2 # Dev evaluations without improvement defining a plateau
+
+    # One early stopping and one learning rate scheduler for each position
+    earlyStoppingList = []
+    lrSchedulerList = []
+    for optimizer in optimizerList:
+        earlyStoppingList.append(EarlyStopping(earlyStoppingPatience, earlyStoppingMinDelta))
+        lrSchedulerList.append(LearningRateScheduler(optimizer, lrScheduleName, warmupSteps, cosineCycleSteps, minLearningRate, plateauFactor, plateauPatience))
+    bestModelSaving = ModelSave(corpusName, paths.modelPath, "WordBest", nameFormat="short", fixedTs=True)
+    allPositionsStopped = False
+
+    # Importance sampling parameters
+    minKeepProbability = 0.1 # Minimum selection probability of a line, to revisit well predicted lines
+    lossSmoothing = 0.5 # Weight of the previous loss estimate of a line when its new loss is known
+    maxLossEstimates = 5000000 # Maximum count of lines with a stored loss estimate
+    importanceSampler = ImportanceSampler(minKeepProbability, lossSmoothing, maxEntries=maxLossEstimates) if importanceSampling else None
+
+    # Seed of train lines shuffling. Incremented at each epoch to get a different order
+    shuffleSeed = 0
+
     # Load lines parameters
     linesParam = LinesTools(corpusName, wordModelList[0].voc, wordModelList[0].lineLength)
 
@@ -101,21 +168,37 @@ def LANLTrainWord(corpusName, pathAllData, desiredBatchSize, desiredLinesPerBatc
     # As we load all devdata in one batch, we need only one iteration over the iterator
     devBatch = next(devIterator)
     devInputTensorList = torch.stack([lineList.convertListToTensor(wordDic, dtype, device) for lineList, fileName in devBatch], 0).view(-1, wordModelList[0].lineLength)
+    profiler.boundary("model and dev")
 
     # Start training process
     batchNum = 0
-    totalTime = Timer()
-    devTime = Timer()
-    saveModelTime = Timer()
-    batchTime = Timer()
-    batchEncodingTime = Timer()
-    batchTrainTime = Timer()
+    totalTime = instrumentation.timer("train")
+    batchTime = instrumentation.timer("train/batch")
+    batchEncodingTime = instrumentation.timer("train/batch/encoding")
+    batchTrainTime = instrumentation.timer("train/batch/training")
+    devTime = instrumentation.timer("train/dev")
+    saveModelTime = instrumentation.timer("train/save")
+
+    # Accuracies of all positions are counted on the device and copied to the host only when they are displayed
+    accuTrain = AccuracyAccumulator(wordModelList[0].lineLength, device)
+    accuTrainList = accuTrain.positionList()
+    accuDev = AccuracyAccumulator(wordModelList[0].lineLength, device)
+    accuDevList = accuDev.positionList()
 
     print("Start training")
+    profiler.start()
     for epoch in range(epochNumber):
-
-        trainDatasetIterator = linesParam.loadBatch(paths.trainPath, False, desiredBatchSize, desiredLinesPerBatch,
-                                                        slidingWindowRenewRate, False)
+        epochShuffleSeed = shuffleSeed + epoch if shuffleBufferSize > 0 or interleaveFiles > 1 else None
+
+        if dedupWindowSize is not None:
+            trainDatasetIterator = linesParam.loadDedupBatch(paths.trainPath, desiredBatchSize, dedupWindowSize, dtype, device)
+        elif slidingWindowRenewRate > 0:
+            # Sliding window units are built directly as tensors, each line is encoded once
+            trainDatasetIterator = linesParam.loadWindowBatch(paths.trainPath, desiredBatchSize, desiredLinesPerBatch, slidingWindowRenewRate,
+                                                              dtype, device, False, False, shuffleBufferSize, epochShuffleSeed, interleaveFiles)
+        else:
+            trainDatasetIterator = linesParam.loadBatch(paths.trainPath, False, desiredBatchSize, desiredLinesPerBatch,
+                                                            slidingWindowRenewRate, False, shuffleBufferSize, epochShuffleSeed, interleaveFiles)
 
         while True:
             totalTime.start()
@@ -130,37 +213,72 @@ def LANLTrainWord(corpusName, pathAllData, desiredBatchSize, desiredLinesPerBatc
                 break
 
             # Convert batch into input and target tensors
-            inputTensor = linesParam.convertBatchIntoTensor(batch, dtype, device)
-            inputTensor = inputTensor.view(-1, wordModelList[0].lineLength) # Only 1 line per batch => Removing number of lines dimension
+            countTensor = None
+            if dedupWindowSize is not None:
+                # Deduplicated batch is already encoded. Each unique line comes with its occurrence count
+                inputTensor, countTensor = batch
+            elif slidingWindowRenewRate > 0:
+                # Sliding window batch is already encoded
+                inputTensor = batch.reshape(-1, wordModelList[0].lineLength)
+            else:
+                inputTensor = linesParam.convertBatchIntoTensor(batch, dtype, device)
+                inputTensor = inputTensor.view(-1, wordModelList[0].lineLength) # Only 1 line per batch => Removing number of lines dimension
+
+            # Select lines to train. Loss of selected lines is weighted to be an unbiased estimation of the loss of the whole batch
+            lineWeightTensor = countTensor
+            weightNormalizer = None
+            if importanceSampler is not None:
+                selectedIdx, sampleWeightTensor = importanceSampler.sample(inputTensor)
+                weightNormalizer = inputTensor.size(0) if countTensor is None else countTensor.sum()
+                inputTensor = inputTensor[selectedIdx]
+                lineWeightTensor = sampleWeightTensor if countTensor is None else sampleWeightTensor * countTensor[selectedIdx]
+                sampledLineLoss = torch.zeros(inputTensor.size(0), device=device)
             batchEncodingTime.stop()
 
             batchTrainTime.start()
-            accuTrainList = []
-            for i in range(wordModelList[0].lineLength):
-                accuTrainList.append(Accuracy())
+            accuTrain.reset()
 
-            lossTrainList = [0] * wordModelList[0].lineLength
+            lossTrainList = [None] * wordModelList[0].lineLength
+            trainedPositionsCount = 0
             for i in range(inputTensor.size(1)):
-                optimizerList[i].zero_grad()
-                trainInputTensor = torch.cat((inputTensor[:, 0:i], inputTensor[:, i+1:]), 1)
-                trainTargetTensor = inputTensor[:, i]
-
-                # Forward pass
-                wordModelOutput = wordModelList[i](trainInputTensor)
-                targetTensorLoss = trainTargetTensor.view(-1)
-
-                lossTrainList[i] = wordModelList[i].lossFunc(wordModelOutput, targetTensorLoss)
-                lossTrainList[i].backward()
-                optimizerList[i].step()
-
-                # Retrieve predicted numbers
-                predictedWordTensor = torch.argmax(wordModelOutput, 1)
-                accuTrainList[i].calculateAccuracyTensors(trainTargetTensor, predictedWordTensor)
-
+                # Converged positions are not trained anymore. No training if no line was selected
+                if earlyStoppingList[i].stopped or inputTensor.size(0) == 0:
+                    continue
+
+                trainedPositionsCount += 1
+                with profiler.region("position" + str(i)):
+                    optimizerList[i].zero_grad()
+                    trainInputTensor = torch.cat((inputTensor[:, 0:i], inputTensor[:, i+1:]), 1)
+                    trainTargetTensor = inputTensor[:, i]
+
+                    # Forward pass
+                    wordModelOutput = wordModelList[i](trainInputTensor)
+                    targetTensorLoss = trainTargetTensor.view(-1)
+
+                    if importanceSampler is None:
+                        lossTrainList[i] = wordModelList[i].weightedLossFunc(wordModelOutput, targetTensorLoss, lineWeightTensor)
+                    else:
+                        lineLoss = wordModelList[i].lineLossFunc(wordModelOutput, targetTensorLoss)
+                        sampledLineLoss += lineLoss.detach()
+                        lossTrainList[i] = wordModelList[i].weightedLossFunc(wordModelOutput, targetTensorLoss, lineWeightTensor, weightNormalizer, lineLoss)
+                    lossTrainList[i].backward()
+                    optimizerList[i].step()
+                    lrSchedulerList[i].stepBatch()
+
+                    # Retrieve predicted numbers
+                    predictedWordTensor = torch.argmax(wordModelOutput, 1)
+                    accuTrainList[i].calculateAccuracyTensors(trainTargetTensor, predictedWordTensor, lineWeightTensor)
+
+            # Mean of the losses of the trained positions is the loss estimate of a line : estimates keep the same scale
+            # when positions are stopped by early stopping
+            if importanceSampler is not None and trainedPositionsCount > 0:
+                importanceSampler.update(sampledLineLoss / trainedPositionsCount)
 
 
             batchTrainTime.stop()
             batchTime.stop()
+            instrumentation.count("train/batches")
+            instrumentation.count("train/lines", inputTensor.size(0))
 
             # ===== Dev dataset processing =====
             # Each devCalculStep times, run the forward pass on dev dataset
@@ -169,13 +287,15 @@ def LANLTrainWord(corpusName, pathAllData, desiredBatchSize, desiredLinesPerBatc
                 # Calculate trainLoss and accuracy for dev dataset
                 devTotalLoss = 0
                 devTime.start()
-                accuDevList = []
-                for i in range(wordModelList[0].lineLength):
-                    accuDevList.append(Accuracy())
-                lossDevList = [0] * wordModelList[0].lineLength
+                accuDev.reset()
+                lossDevList = [None] * wordModelList[0].lineLength
                 # Set eval mode with model.eval and no_grad to improve computation speed
                 with torch.no_grad():
                     for i in range(devInputTensorList.size(1)):
+                        # Dev loss of converged positions doesn't change anymore
+                        if earlyStoppingList[i].stopped:
+                            continue
+
                         wordModelList[i].eval()
                         devInputTensor = torch.cat((devInputTensorList[:, 0:i], devInputTensorList[:, i + 1:]), 1)
                         devTargetTensor = devInputTensorList[:, i]
@@ -194,6 +314,22 @@ def LANLTrainWord(corpusName, pathAllData, desiredBatchSize, desiredLinesPerBatc
 
                 devTime.stop()
 
+                # Convergence control with dev loss. Losses of all positions are copied to the host together
+                devLossValues = scalarsToHost(lossDevList)
+                trainLossValues = scalarsToHost(lossTrainList)
+                bestModelImproved = False
+                for i in range(devInputTensorList.size(1)):
+                    if devLossValues[i] is None:
+                        continue
+                    devLoss = devLossValues[i]
+                    lrSchedulerList[i].stepDev(devLoss)
+                    if earlyStoppingPatience > 0:
+                        bestModelImproved |= earlyStoppingList[i].update(devLoss, wordModelList[i], epoch, batchNum)
+                        if earlyStoppingList[i].stopped:
+                            print("Position " + str(i) + " converged at batch " + str(batchNum) + ". Best dev loss " +
+                                  str(round(earlyStoppingList[i].bestLoss, 6)) + " at batch " + str(earlyStoppingList[i].bestBatch))
+                allPositionsStopped = all(earlyStopping.stopped for earlyStopping in earlyStoppingList)
+
                 # Display informations about the execution only when dev dataset is passed to the model
                 # EPOCH : current epoch count (starts at 0)
                 # BATCH : current batch count (starts at 0, not reset when epoch changes)
@@ -201,11 +337,28 @@ def LANLTrainWord(corpusName, pathAllData, desiredBatchSize, desiredLinesPerBatc
                 # ACCTR : ACCuracy TRain dataset
                 # LDV : Loss DeV dataset
                 # ACCDV : ACCuracy DeV dataset
+                # LR : Learning Rate
+                linesPerSecond = instrumentation.getCount("train/lines") / max(batchTime.totalElapsedTime, 1e-9)
                 for i in range(devInputTensorList.size(1)):
-                    print("PLOTLOSS " + str(i) + " EPOCH " + str(epoch) + " BATCH " + str(batchNum) +
-                          " LTR " + str(round(lossTrainList[i].item(), 6)) + " ACCTR " + str(accuTrainList[i].getTotalAccuracy()) +
-                          " LDV " + str(round(lossDevList[i].item(), 6)) + " ACCDV " + str(accuDevList[i].getTotalAccuracy())
-                          )
+                    if trainLossValues[i] is None or devLossValues[i] is None:
+                        continue
+                    if metricsWriter.enabled:
+                        metricsWriter.write("train", epoch=epoch, batch=batchNum, position=i,
+                                            trainLoss=trainLossValues[i], trainAccuracy=accuTrainList[i].getTotalAccuracy(),
+                                            devLoss=devLossValues[i], devAccuracy=accuDevList[i].getTotalAccuracy(),
+                                            learningRate=lrSchedulerList[i].getLearningRate(), linesPerSecond=linesPerSecond)
+                    else:
+                        print("PLOTLOSS " + str(i) + " EPOCH " + str(epoch) + " BATCH " + str(batchNum) +
+                              " LTR " + str(round(trainLossValues[i], 6)) + " ACCTR " + str(accuTrainList[i].getTotalAccuracy()) +
+                              " LDV " + str(round(devLossValues[i], 6)) + " ACCDV " + str(accuDevList[i].getTotalAccuracy()) +
+                              " LR " + str(lrSchedulerList[i].getLearningRate())
+                              )
+
+                # Keep the best dev parameters of each position on disk
+                if bestModelImproved:
+                    saveModelTime.start()
+                    bestModelSaving.saveObject({"word" + str(idx): earlyStopping.bestStateDict for idx, earlyStopping in enumerate(earlyStoppingList)})
+                    saveModelTime.stop()
 
             # End of the batch, save model
             saveModelTime.start()
@@ -216,31 +369,37 @@ def LANLTrainWord(corpusName, pathAllData, desiredBatchSize, desiredLinesPerBatc
             saveModelTime.stop()
 
             totalTime.stop()
+            instrumentation.maybeExport()
 
             # Display time information
             if batchNum % devCalculStep == 0:
-                print("===== Timers =====")
-                print("Last time : ")
-                print("  - Total : " + str(totalTime.lastElapsedTime))
-                print("  - Batch : " + str(batchTime.lastElapsedTime))
-                print("    * Batch encoding : " + str(batchEncodingTime.lastElapsedTime))
-                print("    * Batch training : " + str(batchTrainTime.lastElapsedTime))
-                print("  - Dev : " + str(devTime.lastElapsedTime))
-                print("  - Save : " + str(saveModelTime.lastElapsedTime))
-
-                print("Total time : ")
-                print("  - Total : " + str(totalTime.totalElapsedTime))
-                print("  - Batch : " + str(batchTime.totalElapsedTime))
-                print("    * Batch encoding : " + str(batchEncodingTime.totalElapsedTime))
-                print("    * Batch training : " + str(batchTrainTime.totalElapsedTime))
-                print("  - Dev : " + str(devTime.totalElapsedTime))
-                print("  - Save : " + str(saveModelTime.totalElapsedTime))
+                if metricsWriter.enabled:
+                    metricsWriter.writeTimers(instrumentation, "train")
+                else:
+                    instrumentation.printReport()
+                if dedupWindowSize is not None:
+                    print("Deduplication : " + str(linesParam.dedupLinesCount) + " lines in " + str(linesParam.dedupUniqueCount) +
+                          " unique lines (ratio " + str(linesParam.getDedupCompressionRatio()) + "), " +
+                          str(round(linesParam.dedupLinesCount / batchTime.totalElapsedTime)) + " effective lines/s")
+                if importanceSampler is not None:
+                    print("Importance sampling : " + str(importanceSampler.selectedCount) + " lines trained out of " + str(importanceSampler.linesCount) +
+                          " (rate " + str(importanceSampler.getSelectedRate()) + ")")
 
                 # Reset last elapsed time for save to display 0 if no save is done when batch information are displayed
                 saveModelTime.resetLastElapsedTime()
 
             # Next iteration
             batchNum += 1
+            profiler.step()
+
+            # All positions have converged, training is over
+            if allPositionsStopped:
+                break
+
+        # Restore best dev parameters before the last save of the training
+        if earlyStoppingPatience > 0 and (allPositionsStopped or epoch == epochNumber - 1):
+            for idx, wordModel in enumerate(wordModelList):
+                earlyStoppingList[idx].restoreBest(wordModel)
 
         # End of the epoch, save model
         saveModelTime.start()
@@ -250,22 +409,22 @@ def LANLTrainWord(corpusName, pathAllData, desiredBatchSize, desiredLinesPerBatc
         modelSaving.saveModel(wordModelStateDict, epoch, batchNum, True)
         saveModelTime.stop()
 
-    print("===== Timers =====")
-    print("Last time : ")
-    print("  - Total : " + str(totalTime.lastElapsedTime))
-    print("  - Batch : " + str(batchTime.lastElapsedTime))
-    print("    * Batch encoding : " + str(batchEncodingTime.lastElapsedTime))
-    print("    * Batch training : " + str(batchTrainTime.lastElapsedTime))
-    print("  - Dev : " + str(devTime.lastElapsedTime))
-    print("  - Save : " + str(saveModelTime.lastElapsedTime))
-
-    print("Total time : ")
-    print("  - Total : " + str(totalTime.totalElapsedTime))
-    print("  - Batch : " + str(batchTime.totalElapsedTime))
-    print("    * Batch encoding : " + str(batchEncodingTime.totalElapsedTime))
-    print("    * Batch training : " + str(batchTrainTime.totalElapsedTime))
-    print("  - Dev : " + str(devTime.totalElapsedTime))
-    print("  - Save : " + str(saveModelTime.totalElapsedTime))
+        if allPositionsStopped:
+            print("All positions converged at epoch " + str(epoch) + ", batch " + str(batchNum))
+            break
+
+    profiler.stop()
+    instrumentation.printReport()
+    metricsWriter.writeTimers(instrumentation, "train")
+    metricsWriter.close()
+    if dedupWindowSize is not None:
+        print("Deduplication : " + str(linesParam.dedupLinesCount) + " lines in " + str(linesParam.dedupUniqueCount) +
+              " unique lines (ratio " + str(linesParam.getDedupCompressionRatio()) + "), " +
+              str(round(linesParam.dedupLinesCount / batchTime.totalElapsedTime)) + " effective lines/s")
+    if importanceSampler is not None:
+        print("Importance sampling : " + str(importanceSampler.selectedCount) + " lines trained out of " + str(importanceSampler.linesCount) +
+              " (rate " + str(importanceSampler.getSelectedRate()) + ")")
+    instrumentation.export()
 
     return modelSaving.lastFileSave
 
@@ -281,14 +440,23 @@ if __name__ == "__main__":
         devCalculStep = 200
         learningRate = 0.0001
         epochNumber = 1
+        earlyStoppingPatience = 0
+        lrScheduleName = "constant"
+        dedupWindowSize = None
+        importanceSampling = False
+        shuffleBufferSize = 0
+        interleaveFiles = 1
 
         # Parsing command lines option
         parser = argparse.ArgumentParser()
         parser.add_argument("corpus_name", choices={"LANL"}, help="Accept LANL")
         parser.add_argument("path_data", help="Path to data directory.")
+        parser.add_argument("--profile", default="", help="Directory of the profiling results. Profiling is disabled if not given")
         args = parser.parse_args()
 
-        savePath = LANLTrainWord(args.corpus_name, args.path_data, desiredBatchSize, desiredLinesPerBatch, slidingWindowRenewRate, devCalculStep, learningRate, epochNumber)
+        savePath = LANLTrainWord(args.corpus_name, args.path_data, desiredBatchSize, desiredLinesPerBatch, slidingWindowRenewRate, devCalculStep, learningRate, epochNumber,
+                                 earlyStoppingPatience, lrScheduleName, dedupWindowSize, importanceSampling,
+                                 shuffleBufferSize, interleaveFiles, args.profile)
 
     finally:
         print("=============== End of program ===============")
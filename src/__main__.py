@@ -0,0 +1,248 @@
+# -*- coding: utf8 -*-
+
+"""
+Command line of all the parts of the pipeline : python -m src <command> ...
+  - vocab : build (or check) the vocabulary cache
+  - train : train the LANL Word model
+  - calibrate : train the anomaly classifier (DeepSVDD) on an encoder model
+  - distill : distill the anomaly classifier into a small student model screening the test lines
+  - test : test the anomaly classifier with the redteam annotations
+  - positions : contribution of each position to the ranking of the test lines and speed of subsets of positions
+  - score : score raw lines of a file (or standard input) with the anomaly classifier, locally or through a scoring server
+Arguments are parsed before any import of torch : --help and errors of command line are immediate, and the commands which
+do not use a model (vocab, score through a server) never import it
+"""
+
+import argparse
+import os
+import sys
+
+
+def _vocab(args):
+    import src.tools.misc as miscTool
+    from src.tools.Paths import Paths
+    from src.tools.Timer import Timer
+
+    paths = Paths(args.path_data, args.corpus_name)
+
+    loadVocabularyTimer = Timer()
+    loadVocabularyTimer.start()
+    wordDic = miscTool.loadVocabulary(paths.corpusPath, True, paths.vocabularyCachePath, args.corpus_name, args.refresh)
+    loadVocabularyTimer.stop()
+    print("Vocabulary of " + str(len(wordDic.wordIndex)) + " words in " + paths.vocabularyCachePath + " (" +
+          str(loadVocabularyTimer.lastElapsedTime) + " seconds)")
+
+
+def _train(args):
+    import src.LANLTrainWord as WordModelScript
+
+    # Training parameters (see launchScript.py)
+    desiredLinesPerBatch = 1 # Number of lines loaded in one minibatch
+    slidingWindowRenewRate = 0 # If 2 or more lines are selected, determine the window selection sliding between two minibatch
+    devCalculStep = 200 # Step for the forward pass on dev dataset
+    earlyStoppingPatience = 0 # Dev evaluations without dev loss improvement before stopping a position. 0 disables early stopping
+    lrScheduleName = "constant" # Learning rate schedule : constant, warmup, cosine or plateau
+    dedupWindowSize = None # If not None, identical lines are trained once with their count in windows of this number of lines (0 = whole dataset)
+    importanceSampling = False # If True, well predicted lines are less often trained (with weights keeping the loss unbiased)
+    shuffleBufferSize = 0 # If > 0, train lines are shuffled in a buffer of this number of lines (no need to shuffle files on disk)
+    interleaveFiles = 1 # If > 1, number of train files read at the same time
+
+    encoderModelFilepath = WordModelScript.LANLTrainWord(args.corpus_name, args.path_data, args.batch_size, desiredLinesPerBatch, slidingWindowRenewRate,
+                                                         devCalculStep, args.learning_rate, args.epochs, earlyStoppingPatience, lrScheduleName,
+                                                         dedupWindowSize, importanceSampling, shuffleBufferSize, interleaveFiles, args.profile)
+    print("Encoder model : " + os.path.basename(encoderModelFilepath))
+
+
+def _calibrate(args):
+    import src.LANLAnoClassifWord as AnoClassifScript
+
+    # Training parameters (see launchScript.py)
+    desiredLinesPerBatch = 1
+    slidingWindowRenewRate = 0
+    nu = 0.005
+    eps = 0.01
+    dedupWindowSize = None
+
+    anoClassModelPath = AnoClassifScript.LANLAnoClassif(args.corpus_name, args.path_data, args.model_file, args.batch_size, desiredLinesPerBatch,
+                                                        slidingWindowRenewRate, nu, eps, dedupWindowSize, args.profile)
+    print("Anomaly classifier model : " + os.path.basename(anoClassModelPath))
+
+
+def _distill(args):
+    import src.LANLDistillStudent as DistillScript
+
+    # Distillation parameters (see LANLDistillStudent.py)
+    positionLossWeight = 0.5 # Weight of the loss of the scores of the positions. If 0, only the score of the line is learnt
+
+    studentModelPath = DistillScript.LANLDistillStudent(args.corpus_name, args.path_data, args.model_file, args.batch_size, args.epochs,
+                                                        args.learning_rate, positionLossWeight, args.target_recall)
+    print("Student model : " + os.path.basename(studentModelPath))
+
+
+def _test(args):
+    # Parameters are the same than for training the anomaly classifier model
+    desiredLinesPerBatch = 1
+    slidingWindowRenewRate = 0
+
+    redteamFilePath = args.redteam if args.redteam != "" else os.path.join(args.path_data, "redteam_example")
+    if args.workers > 0:
+        if args.student != "" or args.positions is not None:
+            raise ValueError("Screening by a student and subsets of positions are not supported with workers")
+        import src.LANLTestAnoClassWordParallel as AnoClassifTestParallel
+        AnoClassifTestParallel.testAnomalyClassificationParallel(args.corpus_name, args.path_data, args.model_file, args.batch_size, desiredLinesPerBatch,
+                                                                 slidingWindowRenewRate, redteamFilePath, workerCount=args.workers)
+    else:
+        import src.LANLTestAnoClassWord as AnoClassifTest
+        AnoClassifTest.testAnomalyClassification(args.corpus_name, args.path_data, args.model_file, args.batch_size, desiredLinesPerBatch,
+                                                 slidingWindowRenewRate, redteamFilePath, profilePath=args.profile,
+                                                 studentModelFilename=args.student, positions=args.positions)
+
+
+def _positions(args):
+    import src.LANLPositionSelection as PositionSelectionScript
+
+    redteamFilePath = args.redteam if args.redteam != "" else os.path.join(args.path_data, "redteam_example")
+    PositionSelectionScript.LANLPositionSelection(args.corpus_name, args.path_data, args.model_file, args.batch_size, redteamFilePath,
+                                                  maxAucLoss=args.max_auc_loss)
+
+
+def _score(args):
+    """
+    Print one line per input line : score, 1 if anomaly else 0, raw line. Score and anomaly are "-" for an invalid line
+    """
+    inputFile = sys.stdin if args.input_file == "-" else open(args.input_file, "r")
+    try:
+        if args.socket != "" or args.port > 0:
+            # Lines are scored by a running scoring server : torch is not needed
+            from src.tools.serving.ScoringClient import ScoringClient
+            scoringClient = ScoringClient(args.socket, port=args.port)
+            scoreBatch = scoringClient.scoreLines
+        else:
+            scoreBatch = _localScorer(args)
+
+        batchLines = []
+        for strLine in inputFile:
+            batchLines.append(strLine.rstrip("\r\n"))
+            if len(batchLines) >= args.batch_size:
+                _printScores(batchLines, *scoreBatch(batchLines))
+                batchLines = []
+        if len(batchLines) > 0:
+            _printScores(batchLines, *scoreBatch(batchLines))
+    finally:
+        if inputFile is not sys.stdin:
+            inputFile.close()
+
+
+def _localScorer(args):
+    """
+    :return: Function scoring a list of raw lines with the model loaded in this process (same output as ScoringClient.scoreLines)
+    """
+    import torch
+
+    from src.model.AnomalyScorer import AnomalyScorer
+    from src.tools.Paths import Paths
+    from src.tools.line.LANLLine import LANLLine
+
+    paths = Paths(args.path_data, args.corpus_name)
+    device = torch.device("cuda") if torch.cuda.is_available() else torch.device("cpu")
+    anomalyScorer = AnomalyScorer(device, torch.long, paths.vocabularyCachePath, args.corpus_name, paths.modelPath + args.model_file,
+                                  positions=args.positions)
+
+    def scoreLines(strLines):
+        scores = [None] * len(strLines)
+        anomalies = [None] * len(strLines)
+        encodedLines = []
+        validIdx = []
+        for idx, strLine in enumerate(strLines):
+            line = LANLLine(strLine, anomalyScorer.lineLength)
+            if line.keepLine:
+                encodedLines.append(line.getEncodedLine(anomalyScorer.voc))
+                validIdx.append(idx)
+        if len(encodedLines) > 0:
+            with torch.no_grad():
+                scoresListTensor, scoresSum = anomalyScorer.score(torch.tensor(encodedLines, dtype=torch.long, device=device))
+            for idx, score in zip(validIdx, scoresSum.cpu().tolist()):
+                scores[idx] = score
+                # Lines with a score strictly positive are out of the hypersphere
+                anomalies[idx] = score > 0
+        return scores, anomalies
+
+    return scoreLines
+
+
+def _printScores(strLines, scores, anomalies):
+    outputLines = []
+    for strLine, score, anomaly in zip(strLines, scores, anomalies):
+        if score is None:
+            outputLines.append("-\t-\t" + strLine)
+        else:
+            outputLines.append(str(score) + "\t" + ("1" if anomaly else "0") + "\t" + strLine)
+    print("\n".join(outputLines))
+
+
+def buildParser():
+    """
+    :return: ArgumentParser of all the commands. It only uses the standard library
+    """
+    parser = argparse.ArgumentParser(prog="python -m src", description="Anomaly detection in system logs")
+    subparsers = parser.add_subparsers(dest="command", metavar="command")
+    subparsers.required = True
+
+    def addCommand(name, function, description, withModel=False, batchSize=None, withProfile=False, withPositions=False):
+        commandParser = subparsers.add_parser(name, help=description, description=description)
+        commandParser.add_argument("corpus_name", choices={"LANL"}, help="Accept LANL")
+        commandParser.add_argument("path_data", help="Path to data directory.")
+        if withModel:
+            commandParser.add_argument("model_file", help="Name of the model file in model directory")
+        if batchSize is not None:
+            commandParser.add_argument("--batch-size", type=int, default=batchSize, help="Number of lines in one batch (default : " + str(batchSize) + ")")
+        if withProfile:
+            commandParser.add_argument("--profile", default="", help="Directory of the profiling results. Profiling is disabled if not given")
+        if withPositions:
+            commandParser.add_argument("--positions", type=int, nargs="+", default=None,
+                                       help="Positions scored by the anomaly classifier (see the positions command). Default : all")
+        commandParser.set_defaults(function=function)
+        return commandParser
+
+    vocabParser = addCommand("vocab", _vocab, "Build the vocabulary cache of the corpus (or load it if it exists)")
+    vocabParser.add_argument("--refresh", action="store_true", help="Build the vocabulary again even if the cache exists")
+
+    trainParser = addCommand("train", _train, "Train the LANL Word model", batchSize=64, withProfile=True)
+    trainParser.add_argument("--epochs", type=int, default=1, help="Number of epochs (default : 1)")
+    trainParser.add_argument("--learning-rate", type=float, default=0.0001, help="Learning rate (default : 0.0001)")
+
+    addCommand("calibrate", _calibrate, "Train the anomaly classifier (DeepSVDD) on an encoder model", withModel=True, batchSize=32, withProfile=True)
+
+    distillParser = addCommand("distill", _distill, "Distill the anomaly classifier into a student model screening the lines", withModel=True, batchSize=128)
+    distillParser.add_argument("--epochs", type=int, default=1, help="Number of epochs (default : 1)")
+    distillParser.add_argument("--learning-rate", type=float, default=0.001, help="Learning rate (default : 0.001)")
+    distillParser.add_argument("--target-recall", type=float, default=1.0,
+                               help="Fraction of the dev anomalies of the anomaly classifier kept by the screening (default : 1.0)")
+
+    testParser = addCommand("test", _test, "Test the anomaly classifier with the redteam annotations", withModel=True, batchSize=32, withProfile=True,
+                            withPositions=True)
+    testParser.add_argument("--redteam", default="", help="Path of the redteam file (default : path_data/redteam_example)")
+    testParser.add_argument("--student", default="", help="Name of a student model (distill command) screening the lines before the anomaly classifier")
+    testParser.add_argument("--workers", type=int, default=0, help="If > 0, test files are scored by this number of processes (on CPU)")
+
+    positionsParser = addCommand("positions", _positions, "Measure the contribution of each position to the ranking of the test lines", withModel=True,
+                                 batchSize=128)
+    positionsParser.add_argument("--redteam", default="", help="Path of the redteam file (default : path_data/redteam_example)")
+    positionsParser.add_argument("--max-auc-loss", type=float, default=0.01,
+                                 help="Loss of precision-recall AUC accepted for the recommended subset (default : 0.01)")
+
+    scoreParser = addCommand("score", _score, "Score raw lines with the anomaly classifier", withModel=True, batchSize=1024, withPositions=True)
+    scoreParser.add_argument("input_file", nargs="?", default="-", help="File of raw lines. Default : standard input")
+    scoreParser.add_argument("--socket", default="", help="Unix domain socket of a running scoring server. The model file is then not loaded")
+    scoreParser.add_argument("--port", type=int, default=0, help="Localhost TCP port of a running scoring server. The model file is then not loaded")
+
+    return parser
+
+
+def main(argv=None):
+    args = buildParser().parse_args(argv)
+    args.function(args)
+
+
+if __name__ == "__main__":
+    main()
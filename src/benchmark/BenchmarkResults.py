@@ -0,0 +1,63 @@
+# -*- coding: utf8 -*-
+
+import json
+import os
+import platform
+
+import torch
+
+
+# Metrics compared with the baseline. Value = True if a higher value is better
+COMPARED_METRICS = {"linesPerSecond": True, "msPerBatch": False, "peakRssMb": False}
+
+
+def environmentDescription():
+    """
+    :return: Dictionary describing the machine and the versions, saved with the results (results of different machines are not comparable)
+    """
+    return {"platform": platform.platform(), "processor": platform.processor(), "cpuCount": os.cpu_count(),
+            "python": platform.python_version(), "torch": torch.__version__, "cuda": torch.cuda.is_available()}
+
+
+def saveResults(results, resultsPath):
+    """
+    :param results: Dictionary with "environment", "parameters" and "stages" (key = stage name ; value = metrics of StageBenchmarks.run)
+    :param resultsPath: Path of the JSON file
+    """
+    with open(resultsPath, "w") as resultsFile:
+        json.dump(results, resultsFile, indent=2, sort_keys=True)
+
+
+def loadResults(resultsPath):
+    with open(resultsPath, "r") as resultsFile:
+        return json.load(resultsFile)
+
+
+def compareResults(results, baseline, tolerance=0.2):
+    """
+    Compare the metrics of the stages present in both results
+    :param results: Current results
+    :param baseline: Results of reference
+    :param tolerance: Relative change of a metric in the bad direction above which it's a regression
+    :return: List of dictionaries (stage, metric, baseline, current, change, regression). change is relative to the baseline
+    """
+    comparison = []
+    for stageName, stageMetrics in results["stages"].items():
+        baselineMetrics = baseline["stages"].get(stageName)
+        if baselineMetrics is None:
+            continue
+        for metric, higherIsBetter in COMPARED_METRICS.items():
+            if metric not in stageMetrics or metric not in baselineMetrics or baselineMetrics[metric] == 0:
+                continue
+            change = (stageMetrics[metric] - baselineMetrics[metric]) / baselineMetrics[metric]
+            regression = change < -tolerance if higherIsBetter else change > tolerance
+            comparison.append({"stage": stageName, "metric": metric, "baseline": baselineMetrics[metric], "current": stageMetrics[metric],
+                               "change": change, "regression": regression})
+    return comparison
+
+
+def printComparison(comparison):
+    print("stage\tmetric\tbaseline\tcurrent\tchange")
+    for row in comparison:
+        print(row["stage"] + "\t" + row["metric"] + "\t" + str(round(row["baseline"], 3)) + "\t" + str(round(row["current"], 3)) + "\t"
+              + "{:+.1%}".format(row["change"]) + ("\tREGRESSION" if row["regression"] else ""))
@@ -0,0 +1,299 @@
+# -*- coding: utf8 -*-
+
+import contextlib
+import io
+import os
+import resource
+import statistics
+import sys
+import time
+
+import numpy as np
+import torch
+import torch.nn as nn
+import torch.optim as optim
+
+import src.tools.misc as miscTool
+from src.model.AnomalyScorer import AnomalyScorer
+from src.model.LANLWordModel import LANLWordModel
+from src.tools.Graphs import Graphs
+from src.tools.Paths import Paths
+from src.tools.WordDictionary import WordDictionary
+from src.tools.line.LANLLine import LANLLine
+from src.tools.line.LinesTools import LinesTools
+from src.tools.metrics.ScoreSink import ScoreSink
+
+
+class StageBenchmarks:
+    """
+    Microbenchmarks of each stage of the pipeline on a corpus written by SyntheticLogGenerator.
+    Each stage prepares its inputs, then its timed part is run once for warmup and repeatCount times. The median time is kept
+    """
+
+    # Stages in pipeline order
+    STAGES = ("lineParsing", "vocabulary", "loadBatch", "trainStep", "calibrateC", "calibrateR", "scoring", "curve")
+
+    # Name of the anomaly classifier checkpoint written in the model directory by prepareModel
+    MODEL_FILENAME = "LANL_wordAno_benchmark.pt"
+
+    def __init__(self, pathAllData, corpusName="LANL", batchSize=64, maxBatches=20, curveLineCount=1000000, device=None):
+        """
+        :param pathAllData: Data directory of the synthetic corpus, with its vocabulary cache and model (see prepareModel)
+        :param batchSize: Count of lines in a batch
+        :param maxBatches: Count of batches of the model stages (train step, calibrations, scoring)
+        :param curveLineCount: Count of scores of the curve stage
+        :param device: Device of the model stages. If None, GPU if available
+        """
+        self.paths = Paths(pathAllData, corpusName)
+        self.corpusName = corpusName
+        self.batchSize = batchSize
+        self.maxBatches = maxBatches
+        self.curveLineCount = curveLineCount
+        if device is None:
+            device = torch.device("cuda") if torch.cuda.is_available() else torch.device("cpu")
+        self.device = device
+        self.dtype = torch.long
+
+        self._voc = None
+        self._encodedBatches = None
+
+
+    @staticmethod
+    def prepareModel(pathAllData, corpusName="LANL"):
+        """
+        Create the vocabulary cache of the train directory and save an anomaly classifier with random weights.
+        Timings of the model stages don't depend on the values of the weights
+        """
+        paths = Paths(pathAllData, corpusName)
+        with contextlib.redirect_stdout(io.StringIO()):
+            voc = miscTool.loadVocabulary(paths.corpusPath, True, paths.vocabularyCachePath, corpusName)
+
+        torch.manual_seed(0)
+        savedAnoClassWordModel = {}
+        for i in range(8):
+            wordModel = LANLWordModel(torch.device("cpu"), torch.long, None, corpusName, voc=voc)
+            savedAnoClassWordModel["word" + str(i)] = {"model": wordModel.state_dict(), "R": torch.tensor(1.0),
+                                                     "c": torch.full((wordModel.lastLinearOutSize + 1000,), 0.01)}
+        torch.save(savedAnoClassWordModel, paths.modelPath + StageBenchmarks.MODEL_FILENAME)
+
+
+    def _getVoc(self):
+        if self._voc is None:
+            self._voc = miscTool.loadVocabularyFromCache(self.paths.vocabularyCachePath, self.corpusName)
+        return self._voc
+
+
+    def _getEncodedBatches(self):
+        # Batches of encoded test lines used by the model stages
+        if self._encodedBatches is None:
+            linesParam = LinesTools(self.corpusName, self._getVoc(), 8)
+            self._encodedBatches = []
+            for batch in linesParam.loadBatch(self.paths.testPath, False, self.batchSize, 1, 0, False):
+                self._encodedBatches.append(linesParam.convertBatchIntoTensor(batch, self.dtype, self.device).view(-1, 8))
+                if len(self._encodedBatches) == self.maxBatches:
+                    break
+        return self._encodedBatches
+
+
+    def _newWordModels(self, train):
+        voc = self._getVoc()
+        wordModelList = []
+        for i in range(8):
+            wordModel = LANLWordModel(self.device, self.dtype, None, self.corpusName, voc=voc)
+            wordModel.to(self.device)
+            wordModel.train(train)
+            wordModelList.append(wordModel)
+        return wordModelList
+
+
+    def _batchesCount(self, lineCount):
+        return (lineCount + self.batchSize - 1) // self.batchSize
+
+
+    """ -------------------------------
+                    Stages
+            Each stage prepares its inputs and returns its timed part : function returning (lines count, batches count)
+        -------------------------------
+    """
+    def stageLineParsing(self):
+        lines = []
+        for file in sorted(os.listdir(self.paths.testPath)):
+            with open(os.path.join(self.paths.testPath, file), "r") as testFile:
+                lines.extend(testFile.readlines())
+
+        def run():
+            for strLine in lines:
+                LANLLine(strLine, 8)
+            return len(lines), self._batchesCount(len(lines))
+        return run
+
+
+    def stageVocabulary(self):
+        def run():
+            wordDic = WordDictionary(10, self.corpusName)
+            with contextlib.redirect_stdout(io.StringIO()):
+                wordDic.createVocabulary(self.paths.trainPath)
+            return wordDic.linesCount, self._batchesCount(wordDic.linesCount)
+        return run
+
+
+    def stageLoadBatch(self):
+        linesParam = LinesTools(self.corpusName, self._getVoc(), 8)
+
+        def run():
+            linesCount = 0
+            batchesCount = 0
+            for batch in linesParam.loadBatch(self.paths.testPath, False, self.batchSize, 1, 0, False):
+                inputTensor = linesParam.convertBatchIntoTensor(batch, self.dtype, "cpu")
+                linesCount += inputTensor.size(0)
+                batchesCount += 1
+            return linesCount, batchesCount
+        return run
+
+
+    def stageTrainStep(self):
+        # Same step as LANLTrainWord : each position is trained by its model and optimizer
+        encodedBatches = self._getEncodedBatches()
+        wordModelList = self._newWordModels(True)
+        optimizerList = [optim.Adam(wordModel.parameters(), lr=0.0001) for wordModel in wordModelList]
+
+        def run():
+            for inputTensor in encodedBatches:
+                for i in range(inputTensor.size(1)):
+                    optimizerList[i].zero_grad()
+                    trainInputTensor = torch.cat((inputTensor[:, 0:i], inputTensor[:, i+1:]), 1)
+                    wordModelOutput = wordModelList[i](trainInputTensor)
+                    loss = wordModelList[i].weightedLossFunc(wordModelOutput, inputTensor[:, i])
+                    loss.backward()
+                    optimizerList[i].step()
+                    torch.argmax(wordModelOutput, 1)
+            self._synchronize()
+            return sum(inputTensor.size(0) for inputTensor in encodedBatches), len(encodedBatches)
+        return run
+
+
+    def stageCalibrateC(self):
+        # Same forward pass and sums as the calibration of c in LANLAnoClassif
+        encodedBatches = self._getEncodedBatches()
+        wordModelList = self._newWordModels(False)
+        lossFunc = nn.CrossEntropyLoss(reduction="none")
+        lossRepeat = 1000
+
+        def run():
+            cList = [torch.zeros(wordModel.lastLinearOutSize + lossRepeat, device=self.device) for wordModel in wordModelList]
+            with torch.no_grad():
+                for inputTensor in encodedBatches:
+                    for i in range(inputTensor.size(1)):
+                        trainInputTensor = torch.cat((inputTensor[:, 0:i], inputTensor[:, i + 1:]), 1)
+                        wordModelOutput = wordModelList[i](trainInputTensor)
+                        repeatLoss = lossFunc(wordModelOutput, inputTensor[:, i]).unsqueeze(1).repeat(1, lossRepeat)
+                        cList[i] += torch.sum(torch.cat((wordModelList[i].lastHiddenLayer, repeatLoss), 1), 0)
+            self._synchronize()
+            return sum(inputTensor.size(0) for inputTensor in encodedBatches), len(encodedBatches)
+        return run
+
+
+    def stageCalibrateR(self):
+        # Same forward pass, backward pass and quantile as the calibration of R in LANLAnoClassif, with a backward pass every backprogCalculationStep batches
+        encodedBatches = self._getEncodedBatches()
+        wordModelList = self._newWordModels(True)
+        optimizerList = [optim.Adam(wordModel.parameters(), lr=0.0001) for wordModel in wordModelList]
+        lossFunc = nn.CrossEntropyLoss(reduction="none")
+        lossRepeat = 1000
+        nu = 0.005
+        backprogCalculationStep = 10
+        cList = [torch.full((wordModel.lastLinearOutSize + lossRepeat,), 0.01, device=self.device) for wordModel in wordModelList]
+
+        def run():
+            RList = [torch.tensor(0.0, device=self.device) for wordModel in wordModelList]
+            distList = [[] for wordModel in wordModelList]
+            for batchNum, inputTensor in enumerate(encodedBatches):
+                for i in range(inputTensor.size(1)):
+                    trainInputTensor = torch.cat((inputTensor[:, 0:i], inputTensor[:, i+1:]), 1)
+                    wordModelOutput = wordModelList[i](trainInputTensor)
+                    repeatLoss = lossFunc(wordModelOutput, inputTensor[:, i]).unsqueeze(1).repeat(1, lossRepeat)
+                    catOutLoss = torch.cat((wordModelList[i].lastHiddenLayer, repeatLoss), 1)
+                    distList[i].append(torch.sum((catOutLoss - cList[i]) ** 2, dim=1))
+
+                if (batchNum + 1) % backprogCalculationStep == 0 or batchNum + 1 == len(encodedBatches):
+                    for idx in range(len(wordModelList)):
+                        distCat = torch.cat(distList[idx])
+                        scoresCat = distCat - RList[idx] ** 2
+                        loss = (RList[idx] ** 2) + ((1 / nu) * torch.mean(torch.max(torch.zeros_like(scoresCat), scoresCat)))
+                        loss.backward()
+                        optimizerList[idx].step()
+                        optimizerList[idx].zero_grad()
+                        RList[idx] = torch.tensor(np.quantile(np.sqrt(distCat.detach().cpu().numpy()), 1 - nu), device=self.device)
+                        distList[idx] = []
+            self._synchronize()
+            return sum(inputTensor.size(0) for inputTensor in encodedBatches), len(encodedBatches)
+        return run
+
+
+    def stageScoring(self):
+        # Scoring of testAnomalyClassification, without score cache
+        encodedBatches = self._getEncodedBatches()
+        anomalyScorer = AnomalyScorer(self.device, self.dtype, self.paths.vocabularyCachePath, self.corpusName, self.paths.modelPath + self.MODEL_FILENAME)
+
+        def run():
+            with torch.no_grad():
+                for inputTensor in encodedBatches:
+                    scoresListTensor, scoresSum = anomalyScorer.score(inputTensor)
+                    scoresSum.cpu()
+            return sum(inputTensor.size(0) for inputTensor in encodedBatches), len(encodedBatches)
+        return run
+
+
+    def stageCurve(self):
+        # Curves of Graphs in sort mode on random scores with 0.1 % of positive lines
+        rng = np.random.default_rng(0)
+        scoreSink = ScoreSink(self.curveLineCount)
+        scoreSink.append(rng.normal(size=self.curveLineCount).astype(np.float32), (rng.random(self.curveLineCount) < 0.001).astype(np.int8))
+
+        def run():
+            Graphs(scoreSink, 1, 0, 0, 1, 0.01, "sort")
+            return self.curveLineCount, 1
+        return run
+
+
+    def _synchronize(self):
+        if self.device.type == "cuda":
+            torch.cuda.synchronize()
+
+
+    def run(self, stageName, repeatCount=3):
+        """
+        :param stageName: Name of the stage, in STAGES
+        :param repeatCount: Count of timed runs after the warmup run
+        :return: Dictionary with the median time (seconds), linesPerSecond, msPerBatch, linesCount, batchesCount and peakRssMb
+                 (peak resident memory of the process : run each stage in its own process to get the peak of the stage)
+        """
+        if stageName not in self.STAGES:
+            raise ValueError("Stage ", stageName, " not supported")
+        timedRun = getattr(self, "stage" + stageName[0].upper() + stageName[1:])()
+
+        timedRun()
+        times = []
+        for _ in range(repeatCount):
+            startTime = time.perf_counter()
+            linesCount, batchesCount = timedRun()
+            times.append(time.perf_counter() - startTime)
+        medianTime = statistics.median(times)
+
+        return {"seconds": medianTime, "linesPerSecond": linesCount / medianTime, "msPerBatch": medianTime * 1000 / max(batchesCount, 1),
+                "linesCount": linesCount, "batchesCount": batchesCount,
+                "peakRssMb": self.peakRssMb()}
+
+
+    @staticmethod
+    def peakRssMb():
+        """
+        :return: Peak resident memory of the process in MB
+        """
+        # On Linux, ru_maxrss of a process started by fork + exec includes the peak of its parent before exec. VmHWM doesn't
+        if os.path.isfile("/proc/self/status"):
+            with open("/proc/self/status", "r") as statusFile:
+                for statusLine in statusFile:
+                    if statusLine.startswith("VmHWM:"):
+                        return int(statusLine.split()[1]) / 1024
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024)
@@ -0,0 +1,76 @@
+# -*- coding: utf8 -*-
+
+import os
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+
+# Root of the repository : commands are run as "python -m src ..." from this directory
+_ROOT_PATH = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class StartupBenchmark:
+    """
+    Start-up time of the commands of the command line (python -m src). Each command is run in a new Python process, several times,
+    and the median wall time is kept. The import of torch alone is measured as reference.
+    Lightweight commands (help of every command, vocabulary from the cache) must not import torch : it's checked with python -X importtime
+    """
+
+    HELP_COMMANDS = ("", "vocab", "train", "calibrate", "distill", "test", "positions", "score")
+
+    def __init__(self, pathAllData="", repeatCount=5):
+        """
+        :param pathAllData: Data directory with a vocabulary cache. If empty, the vocab command is not measured
+        :param repeatCount: Number of runs of each command
+        """
+        self.pathAllData = pathAllData
+        self.repeatCount = repeatCount
+
+
+    def lightCommands(self):
+        """
+        :return: Dictionary : key = name of the command ; value = arguments given to python -m src
+        """
+        commands = {(helpCommand + " --help").strip(): ([helpCommand] if helpCommand != "" else []) + ["--help"] for helpCommand in self.HELP_COMMANDS}
+        if self.pathAllData != "":
+            commands["vocab"] = ["vocab", "LANL", self.pathAllData]
+        return commands
+
+
+    def measureCommand(self, pythonArguments):
+        """
+        :param pythonArguments: Arguments of the Python interpreter
+        :return: Median wall time in seconds of the runs of the command
+        """
+        elapsedTimes = []
+        for run in range(self.repeatCount):
+            startTime = time.perf_counter()
+            subprocess.run([sys.executable] + pythonArguments, cwd=_ROOT_PATH, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+            elapsedTimes.append(time.perf_counter() - startTime)
+        return float(np.median(elapsedTimes))
+
+
+    @staticmethod
+    def importsTorch(pythonArguments):
+        """
+        :return: True if the command imports torch
+        """
+        completedProcess = subprocess.run([sys.executable, "-X", "importtime"] + pythonArguments, cwd=_ROOT_PATH, stdout=subprocess.DEVNULL,
+                                          stderr=subprocess.PIPE, check=True, universal_newlines=True)
+        # Lines of importtime : "import time: self [us] | cumulative | module"
+        return any(importLine.rsplit("|", 1)[-1].strip() == "torch" for importLine in completedProcess.stderr.splitlines())
+
+
+    def run(self):
+        """
+        :return: Dictionary : key = name of the command ; value = dictionary with the median start-up time ("seconds") and
+                 "importsTorch". Key "import torch" is the reference
+        """
+        results = {"import torch": {"seconds": self.measureCommand(["-c", "import torch"]), "importsTorch": True}}
+        for name, commandArguments in self.lightCommands().items():
+            pythonArguments = ["-m", "src"] + commandArguments
+            results[name] = {"seconds": self.measureCommand(pythonArguments), "importsTorch": self.importsTorch(pythonArguments)}
+        return results
@@ -0,0 +1,132 @@
+# -*- coding: utf8 -*-
+
+import os
+
+import numpy as np
+
+
+class SyntheticLogGenerator:
+    """
+    Generate authentication lines with the format of the LANL auth.txt file :
+    "ts,sourceUser@domain,destUser@domain,sourceComputer,destComputer,authType,logonType,authOrientation,authState"
+    Users and computers follow Zipf distributions (few very active entities, a long tail of rare ones), each user mostly
+    authenticates from its own computer, and a part of the lines repeats a recent line (same event at another time) as in real logs
+    """
+
+    AUTH_TYPES = (("?", 0.4), ("Kerberos", 0.3), ("NTLM", 0.15), ("Negotiate", 0.1), ("MICROSOFT_AUTHENTICATION_PACKAGE_V1_0", 0.05))
+    LOGON_TYPES = (("Network", 0.5), ("Service", 0.15), ("Batch", 0.1), ("Interactive", 0.1), ("?", 0.1), ("Unlock", 0.03), ("RemoteInteractive", 0.02))
+    AUTH_ORIENTATIONS = (("LogOn", 0.5), ("LogOff", 0.35), ("TGS", 0.1), ("TGT", 0.04), ("AuthMap", 0.01))
+    AUTH_STATES = (("Success", 0.99), ("Fail", 0.01))
+
+    def __init__(self, userCount=10000, computerCount=5000, zipfExponent=1.1, repetitionRate=0.6, repetitionWindow=1000, linesPerSecond=100, seed=0):
+        """
+        :param userCount: Count of distinct users
+        :param computerCount: Count of distinct computers
+        :param zipfExponent: Exponent of the Zipf distributions of users and computers
+        :param repetitionRate: Probability that a line repeats one of the last repetitionWindow lines (with a new timestamp)
+        :param repetitionWindow: Count of last lines that can be repeated
+        :param linesPerSecond: Average count of lines with the same timestamp
+        :param seed: Seed of the random generator
+        """
+        self.userCount = userCount
+        self.computerCount = computerCount
+        self.zipfExponent = zipfExponent
+        self.repetitionRate = repetitionRate
+        self.repetitionWindow = repetitionWindow
+        self.linesPerSecond = linesPerSecond
+        self.rng = np.random.default_rng(seed)
+
+        self.userProbabilities = self._zipfProbabilities(userCount)
+        self.computerProbabilities = self._zipfProbabilities(computerCount)
+        # Usual computer of each user
+        self.homeComputers = self.rng.choice(computerCount, size=userCount, p=self.computerProbabilities)
+
+        self.ts = 1
+        self.linesCount = 0
+
+
+    def _zipfProbabilities(self, count):
+        probabilities = 1.0 / np.arange(1, count + 1, dtype=np.float64) ** self.zipfExponent
+        return probabilities / np.sum(probabilities)
+
+
+    def _choice(self, values, size):
+        words, probabilities = zip(*values)
+        return np.asarray(words)[self.rng.choice(len(words), size=size, p=np.asarray(probabilities) / np.sum(probabilities))]
+
+
+    def generateEvents(self, lineCount):
+        """
+        :param lineCount: Count of lines to generate
+        :return: List of events : lists of the 8 words of a line after the timestamp
+        """
+        users = self.rng.choice(self.userCount, size=lineCount, p=self.userProbabilities)
+        sourceComputers = np.where(self.rng.random(lineCount) < 0.7, self.homeComputers[users],
+                                   self.rng.choice(self.computerCount, size=lineCount, p=self.computerProbabilities))
+        destComputers = np.where(self.rng.random(lineCount) < 0.3, sourceComputers,
+                                 self.rng.choice(self.computerCount, size=lineCount, p=self.computerProbabilities))
+        # Some authentications are made by computer accounts
+        computerAccounts = self.rng.random(lineCount) < 0.2
+        authTypes = self._choice(self.AUTH_TYPES, lineCount)
+        logonTypes = self._choice(self.LOGON_TYPES, lineCount)
+        authOrientations = self._choice(self.AUTH_ORIENTATIONS, lineCount)
+        authStates = self._choice(self.AUTH_STATES, lineCount)
+        repeated = self.rng.random(lineCount) < self.repetitionRate
+        repeatedIdx = self.rng.integers(1, self.repetitionWindow + 1, size=lineCount)
+
+        events = []
+        for idx in range(lineCount):
+            if repeated[idx] and len(events) > 0:
+                events.append(events[max(len(events) - int(repeatedIdx[idx]), 0)])
+                continue
+            if computerAccounts[idx]:
+                sourceUser = "C" + str(sourceComputers[idx]) + "$@DOM1"
+            else:
+                sourceUser = "U" + str(users[idx]) + "@DOM1"
+            events.append([sourceUser, sourceUser, "C" + str(sourceComputers[idx]), "C" + str(destComputers[idx]),
+                           authTypes[idx], logonTypes[idx], authOrientations[idx], authStates[idx]])
+        return events
+
+
+    def generateLines(self, lineCount):
+        """
+        :param lineCount: Count of lines to generate
+        :return: List of lines (with newline) with increasing timestamps
+        """
+        lines = []
+        for event in self.generateEvents(lineCount):
+            self.linesCount += 1
+            if self.rng.random() < 1.0 / self.linesPerSecond:
+                self.ts += 1
+            lines.append(str(self.ts) + "," + ",".join(event) + "\n")
+        return lines
+
+
+    def writeCorpus(self, rootPath, trainLineCount, devLineCount, testLineCount, filesPerDirectory=1, redteamRate=0.001, corpusName="LANL"):
+        """
+        Write a corpus with the directory tree expected by Paths, and a redteam file labelling random test lines
+        :param rootPath: Data directory (created if needed)
+        :param filesPerDirectory: Count of files in each of the train, dev and test directories
+        :param redteamRate: Proportion of test lines written in the redteam file
+        :return: Path of the redteam file
+        """
+        corpusPath = os.path.join(rootPath, corpusName + "_Corpus")
+        os.makedirs(os.path.join(rootPath, corpusName + "_Model"), exist_ok=True)
+
+        redteamEvents = []
+        for directory, lineCount in (("train", trainLineCount), ("dev", devLineCount), ("test", testLineCount)):
+            directoryPath = os.path.join(corpusPath, directory)
+            os.makedirs(directoryPath, exist_ok=True)
+            for fileIdx in range(filesPerDirectory):
+                lines = self.generateLines(lineCount // filesPerDirectory + (1 if fileIdx < lineCount % filesPerDirectory else 0))
+                with open(os.path.join(directoryPath, directory + str(fileIdx) + ".txt"), "w") as corpusFile:
+                    corpusFile.writelines(lines)
+                if directory == "test":
+                    for lineIdx in np.nonzero(self.rng.random(len(lines)) < redteamRate)[0].tolist():
+                        words = lines[lineIdx].rstrip("\n").split(",")
+                        redteamEvents.append(",".join((words[0], words[1], words[3], words[4])) + "\n")
+
+        redteamFilePath = os.path.join(rootPath, "redteam_synthetic")
+        with open(redteamFilePath, "w") as redteamFile:
+            redteamFile.writelines(redteamEvents)
+        return redteamFilePath
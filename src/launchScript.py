@@ -5,6 +5,10 @@ import os
 import LANLTrainWord as WordModelScript
 import LANLAnoClassifWord as AnoClassifScript
 import LANLTestAnoClassWord as AnoClassifTest
+import LANLTestAnoClassWordParallel as AnoClassifTestParallel
+import src.tools.misc as miscTool
+from src.tools.ArtifactCache import ArtifactCache, restoreFile
+from src.tools.Paths import Paths
 
 """
 Script example of the running pipeline of the anomaly detection in system logs tool
@@ -12,6 +16,8 @@ It has 3 parts :
   - Training the LANL Word model
   - Training the anomaly classifier model (DeepSVDD)
   - Testing the anomaly classifier model
+Each part is run only if its inputs (corpus files, upstream models, parameters) changed since its last run :
+outputs are stored in the model directory under the hash of their inputs (see ArtifactCache)
 """
 
 if __name__ == "__main__":
@@ -20,10 +26,27 @@ if __name__ == "__main__":
     # Retrieving command line parameters
     argParser = argparse.ArgumentParser()
     argParser.add_argument("path_data", help="Path to data directory.")
+    argParser.add_argument("--profile", default="", help="Directory of the profiling results (one sub directory per part). Profiling is disabled if not given")
+    argParser.add_argument("--rerun", action="store_true", help="Run all parts, even those whose outputs are up to date")
     args = argParser.parse_args()
 
     # General parameters for all parts
     corpusName = "LANL"
+    fileHashMode = "stat" # Corpus files are identified by size and modification time ("stat") or by the hash of their content ("content")
+
+    paths = Paths(args.path_data, corpusName)
+    artifactCache = ArtifactCache(paths.modelPath, corpusName, fileHashMode, reuse=not args.rerun)
+
+    """
+    Vocabulary, read by all parts in the vocabulary cache file. It's built again only if the train files changed
+    """
+    def buildVocabulary():
+        miscTool.loadVocabulary(paths.corpusPath, True, paths.vocabularyCachePath, corpusName, forceRefresh=True)
+        return paths.vocabularyCachePath
+
+    vocabularyInputs = {"train": artifactCache.fingerprintFiles(paths.trainPath)}
+    vocabularyPath, vocabularyKey = artifactCache.cached("Vocabulary", vocabularyInputs, buildVocabulary, ".cache", copy=True)
+    restoreFile(vocabularyPath, paths.vocabularyCachePath)
 
     """
     First part : training the LANL Word model
@@ -35,11 +58,23 @@ if __name__ == "__main__":
     slidingWindowRenewRate = 0 # If 2 or more lines are selected, determine the window selection sliding between two minibatch
     devCalculStep = 200 # Step for the forward pass on dev dataset
     learningRate = 0.0001 # Learning rate for the model
-    epochNumber = 1 # Number of epochs pass on the training dataset
+    epochNumber = 1 # Number of epochs pass on the training dataset (maximum number if early stopping is enabled)
+    earlyStoppingPatience = 0 # Dev evaluations without dev loss improvement before stopping a position. 0 disables early stopping
+    lrScheduleName = "constant" # Learning rate schedule : constant, warmup, cosine or plateau
+    dedupWindowSize = None # If not None, identical lines are trained once with their count in windows of this number of lines (0 = whole dataset)
+    importanceSampling = False # If True, well predicted lines are less often trained (with weights keeping the loss unbiased)
+    shuffleBufferSize = 0 # If > 0, train lines are shuffled in a buffer of this number of lines (no need to shuffle files on disk)
+    interleaveFiles = 1 # If > 1, number of train files read at the same time
 
     # Run training
-    encoderModelFilepath = WordModelScript.LANLTrainWord(corpusName, args.path_data, desiredBatchSize, desiredLinesPerBatch,
-                                                      slidingWindowRenewRate, devCalculStep, learningRate, epochNumber)
+    encoderInputs = {"vocabulary": vocabularyKey, "train": vocabularyInputs["train"], "dev": artifactCache.fingerprintFiles(paths.devPath),
+                     "desiredBatchSize": desiredBatchSize, "desiredLinesPerBatch": desiredLinesPerBatch, "slidingWindowRenewRate": slidingWindowRenewRate,
+                     "devCalculStep": devCalculStep, "learningRate": learningRate, "epochNumber": epochNumber, "earlyStoppingPatience": earlyStoppingPatience,
+                     "lrScheduleName": lrScheduleName, "dedupWindowSize": dedupWindowSize, "importanceSampling": importanceSampling,
+                     "shuffleBufferSize": shuffleBufferSize, "interleaveFiles": interleaveFiles}
+    encoderModelFilepath, encoderKey = artifactCache.cached("Word", encoderInputs, lambda: WordModelScript.LANLTrainWord(
+        corpusName, args.path_data, desiredBatchSize, desiredLinesPerBatch, slidingWindowRenewRate, devCalculStep, learningRate, epochNumber,
+        earlyStoppingPatience, lrScheduleName, dedupWindowSize, importanceSampling, shuffleBufferSize, interleaveFiles, args.profile))
 
     """
     Second part : training the the LANL anomaly classifier model
@@ -51,10 +86,15 @@ if __name__ == "__main__":
     slidingWindowRenewRate = 0
     nu = 0.005
     eps = 0.01
+    dedupWindowSize = None
 
     # Run training
-    anoClassModelPath = AnoClassifScript.LANLAnoClassif(corpusName, args.path_data, os.path.basename(encoderModelFilepath), desiredBatchSize, desiredLinesPerBatch,
-                   slidingWindowRenewRate, nu, eps)
+    anoClassInputs = {"encoder": encoderKey, "vocabulary": vocabularyKey, "train": vocabularyInputs["train"], "desiredBatchSize": desiredBatchSize,
+                      "desiredLinesPerBatch": desiredLinesPerBatch, "slidingWindowRenewRate": slidingWindowRenewRate, "nu": nu, "eps": eps,
+                      "dedupWindowSize": dedupWindowSize}
+    anoClassModelPath, anoClassKey = artifactCache.cached("wordAno", anoClassInputs, lambda: AnoClassifScript.LANLAnoClassif(
+        corpusName, args.path_data, os.path.basename(encoderModelFilepath), desiredBatchSize, desiredLinesPerBatch, slidingWindowRenewRate, nu, eps,
+        dedupWindowSize, args.profile))
 
     """
     Third part : testing the LANL anomaly classifier
@@ -64,8 +104,21 @@ if __name__ == "__main__":
     # Retrieving redteam file location
     redteamFilePath = os.path.join(args.path_data, "redteam_example")
 
+    # If > 0, test files are scored by this number of processes (on CPU)
+    testWorkerCount = 0
+
     # Run testing. Parameters are the same than for training the anomaly classifier model
-    AnoClassifTest.testAnomalyClassification(corpusName, args.path_data, os.path.basename(anoClassModelPath), desiredBatchSize, desiredLinesPerBatch,
-                              slidingWindowRenewRate, redteamFilePath)
+    def runTest():
+        if testWorkerCount > 0:
+            return AnoClassifTestParallel.testAnomalyClassificationParallel(corpusName, args.path_data, os.path.basename(anoClassModelPath), desiredBatchSize,
+                                                                            desiredLinesPerBatch, slidingWindowRenewRate, redteamFilePath, workerCount=testWorkerCount)
+        return AnoClassifTest.testAnomalyClassification(corpusName, args.path_data, os.path.basename(anoClassModelPath), desiredBatchSize, desiredLinesPerBatch,
+                                                        slidingWindowRenewRate, redteamFilePath, profilePath=args.profile)
+
+    # Count of workers doesn't change the results
+    testInputs = {"anoClass": anoClassKey, "test": artifactCache.fingerprintFiles(paths.testPath), "redteam": artifactCache.fingerprintFiles(redteamFilePath),
+                  "desiredBatchSize": desiredBatchSize, "desiredLinesPerBatch": desiredLinesPerBatch, "slidingWindowRenewRate": slidingWindowRenewRate}
+    testResults, testKey = artifactCache.cachedResults("Test", testInputs, runTest)
+    print("Test results : " + str(testResults))
 
     print("=============== End of program ===============")
\ No newline at end of file
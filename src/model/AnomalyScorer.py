@@ -0,0 +1,213 @@
+# -*- coding: utf8 -*-
+
+import hashlib
+
+import numpy as np
+import torch
+import torch.nn as nn
+
+import src.tools.misc as miscTool
+from src.model.ModelBundle import ModelBundle, loadCheckpoint
+
+
+class AnomalyScorer:
+    """
+    Anomaly classifier trained by LANLAnoClassif : one LANLWordModel per word position with the center c and the radius R of its hypersphere
+    Score of a word = distance to c - R**2. Score of a line = sum of the scores of its words. If it's strictly positive => anomaly
+    The checkpoint is memory-mapped and the model of a position is created over its tensors when it's first used (see ModelBundle)
+    """
+
+    def __init__(self, device, dtype, cachePathVocabulary, corpus, anoClassModelPath, scoreCache=None, sharedState=None, positions=None):
+        """
+        :param device: Device where the models are loaded
+        :param dtype: Type of the encoded lines
+        :param cachePathVocabulary: Path to the vocabulary cache file
+        :param corpus: Name of the corpus
+        :param anoClassModelPath: Path of the model saved by LANLAnoClassif (dictionary with model, R and c of each word)
+        :param scoreCache: ScoreCache used to avoid scoring again lines already seen. If None, every line is scored
+        :param sharedState: Dictionary returned by loadSharedState. If not None, models use its tensors without copy
+                            and cachePathVocabulary and anoClassModelPath are not used (CPU only)
+        :param positions: Positions scored (see LANLPositionSelection). Models of the other positions are never created and their score is 0.
+                          If None, all the positions are scored
+        """
+        self.device = device
+        self.dtype = dtype
+
+        if sharedState is None:
+            # Load dictionary with encoder, R and c (memory-mapped). Vocabulary is loaded once for all the word models
+            savedAnoClassWordModel = loadCheckpoint(anoClassModelPath)
+            self.voc = miscTool.loadVocabularyFromCache(cachePathVocabulary, corpus)
+            self._fingerprint = None # Calculated when it's first used : it reads all the parameters
+        else:
+            if device.type != "cpu":
+                raise ValueError("Shared state can only be used on CPU")
+            savedAnoClassWordModel = sharedState["savedAnoClassWordModel"]
+            self.voc = sharedState["voc"]
+            self._fingerprint = sharedState["fingerprint"]
+        self._savedAnoClassWordModel = savedAnoClassWordModel
+
+        # Models of the positions are created when they are first used
+        self.wordModelList = ModelBundle(savedAnoClassWordModel, device, dtype, corpus, self.voc, stateDictKey="model")
+        self.RList = []
+        self.cList = []
+        for i in range(len(self.wordModelList)):
+            self.RList.append(torch.as_tensor(self.wordModelList.entry(i)["R"], device=device))
+            self.cList.append(torch.as_tensor(self.wordModelList.entry(i)["c"], device=device))
+
+        self.lineLength = len(self.wordModelList)
+        if positions is None:
+            positions = range(self.lineLength)
+        self.positions = sorted(set(positions))
+        if len(self.positions) == 0 or self.positions[0] < 0 or self.positions[-1] >= self.lineLength:
+            raise ValueError("Positions ", positions, " not valid for lines of ", self.lineLength, " words")
+
+        #  Special loss function for anomaly detection
+        self.lossFunc = nn.CrossEntropyLoss(reduction="none")
+        self.lossRepeat = 1000
+
+        self.scoreCache = scoreCache
+        if self.scoreCache is not None:
+            self.scoreCache.checkFingerprint(self.fingerprint)
+
+
+    @staticmethod
+    def loadSharedState(cachePathVocabulary, corpus, anoClassModelPath):
+        """
+        Load the model once to share it between processes. Tensors (weights, R and c) are moved to shared memory :
+        scorers of worker processes created with this state (forked, or receiving it through torch.multiprocessing) use the same memory
+        :param cachePathVocabulary: Path to the vocabulary cache file
+        :param corpus: Name of the corpus
+        :param anoClassModelPath: Path of the model saved by LANLAnoClassif
+        :return: Dictionary with the vocabulary, the saved model with tensors in shared memory and its fingerprint
+        """
+        savedAnoClassWordModel = loadCheckpoint(anoClassModelPath)
+        fingerprint = AnomalyScorer.calculateFingerprint(savedAnoClassWordModel)
+
+        for i in range(len(savedAnoClassWordModel)):
+            savedWordModel = savedAnoClassWordModel["word" + str(i)]
+            # Remove "module." of models saved with DataParallel
+            savedWordModel["model"] = {(name[7:] if name.startswith("module.") else name): tensor.detach().share_memory_()
+                                       for name, tensor in savedWordModel["model"].items()}
+            savedWordModel["R"] = torch.as_tensor(savedWordModel["R"]).detach().share_memory_()
+            savedWordModel["c"] = torch.as_tensor(savedWordModel["c"]).detach().share_memory_()
+
+        return {"voc": miscTool.loadVocabularyFromCache(cachePathVocabulary, corpus), "savedAnoClassWordModel": savedAnoClassWordModel,
+                "fingerprint": fingerprint}
+
+
+    @staticmethod
+    def calculateFingerprint(savedAnoClassWordModel):
+        """
+        :param savedAnoClassWordModel: Dictionary saved by LANLAnoClassif
+        :return: str: Hash of all the parameters of the models, R and c
+        """
+        fingerprint = hashlib.sha1()
+        for i in range(len(savedAnoClassWordModel)):
+            savedWordModel = savedAnoClassWordModel["word" + str(i)]
+            for name in sorted(savedWordModel["model"].keys()):
+                fingerprint.update(name.encode())
+                fingerprint.update(np.ascontiguousarray(savedWordModel["model"][name].detach().cpu().numpy()))
+            for name in ("R", "c"):
+                fingerprint.update(np.ascontiguousarray(torch.as_tensor(savedWordModel[name]).detach().cpu().numpy()))
+        return fingerprint.hexdigest()
+
+
+    def _getFingerprint(self):
+        if self._fingerprint is None:
+            self._fingerprint = self.calculateFingerprint(self._savedAnoClassWordModel)
+        if len(self.positions) < self.lineLength:
+            # Scores of a subset of positions are not the scores of the model
+            return self._fingerprint + ":" + ",".join(str(position) for position in self.positions)
+        return self._fingerprint
+
+
+    def computeScores(self, inputTensor):
+        """
+        Score lines with the models
+        :param inputTensor: Tensor of encoded lines with shape (batchSize, lineLength)
+        :return: Tensor (lineLength, batchSize) with the score of each word of each line, tensor (batchSize) with the score of each line
+        """
+        if len(self.positions) == self.lineLength:
+            scoresListTensor = torch.stack([self.scorePosition(i, inputTensor) for i in range(self.lineLength)])
+        else:
+            scoresListTensor = None
+            for i in self.positions:
+                positionScores = self.scorePosition(i, inputTensor)
+                if scoresListTensor is None:
+                    scoresListTensor = torch.zeros((self.lineLength, inputTensor.size(0)), dtype=positionScores.dtype, device=positionScores.device)
+                scoresListTensor[i] = positionScores
+
+        # Calculate score for a line (= sum of score of each word)
+        scoresSum = torch.sum(scoresListTensor, 0)
+        return scoresListTensor, scoresSum
+
+
+    def scorePosition(self, i, inputTensor):
+        """
+        :param i: Position of the word
+        :param inputTensor: Tensor of encoded lines with shape (batchSize, lineLength)
+        :return: Tensor (batchSize) with the score of the word at position i of each line
+        """
+        trainInputTensor = torch.cat((inputTensor[:, 0:i], inputTensor[:, i+1:]), 1)
+        trainTargetTensor = inputTensor[:, i]
+
+        wordModelOutput = self.wordModelList[i](trainInputTensor)
+        targetTensorLoss = trainTargetTensor.view(-1)
+
+        # Adding loss to the last hidden layer output
+        currentLoss = self.lossFunc(wordModelOutput, targetTensorLoss)
+        repeatLoss = currentLoss.unsqueeze(1).repeat(1, self.lossRepeat)
+        catOutLoss = torch.cat((self.wordModelList[i].lastHiddenLayer, repeatLoss), 1)
+
+        # Calculate distance
+        dist = torch.sum((catOutLoss - self.cList[i]) ** 2, dim=1)
+        return dist - (self.RList[i] ** 2)
+
+
+    def score(self, inputTensor):
+        """
+        Score lines. Lines found in the score cache are not scored again by the models
+        :param inputTensor: Tensor of encoded lines with shape (batchSize, lineLength)
+        :return: Tensor (lineLength, batchSize) with the score of each word of each line, tensor (batchSize) with the score of each line
+        """
+        if self.scoreCache is None:
+            return self.computeScores(inputTensor)
+
+        keys = [line.tobytes() for line in inputTensor.cpu().numpy()]
+        cachedScores = self.scoreCache.lookup(keys)
+
+        # Lines to score. A line appearing several times in the batch is scored once
+        hitIdx = []
+        missIdx = []
+        missKeyIdx = {} # Key = line key ; value = index of the line in missKeys
+        missKeys = []
+        missInverse = []
+        for idx, (key, cachedScore) in enumerate(zip(keys, cachedScores)):
+            if cachedScore is not None:
+                hitIdx.append(idx)
+            else:
+                if key not in missKeyIdx:
+                    missKeyIdx[key] = len(missKeys)
+                    missKeys.append(key)
+                    missIdx.append(idx)
+                missInverse.append(missKeyIdx[key])
+
+        # Scores of each word and of the line in the same array
+        allScores = np.empty((len(keys), self.lineLength + 1), dtype=np.float32)
+        if len(hitIdx) > 0:
+            allScores[hitIdx] = np.stack([cachedScores[idx] for idx in hitIdx])
+        if len(missKeys) > 0:
+            missPositionScores, missScoresSum = self.computeScores(inputTensor[torch.tensor(missIdx, device=inputTensor.device)])
+            missScores = torch.cat((missPositionScores, missScoresSum.unsqueeze(0)), 0).t().cpu().numpy()
+            self.scoreCache.store(missKeys, missScores)
+            allScores[[idx for idx, cachedScore in enumerate(cachedScores) if cachedScore is None]] = missScores[missInverse]
+
+        allScores = torch.from_numpy(allScores).to(self.device)
+        return allScores[:, :self.lineLength].t(), allScores[:, self.lineLength]
+
+
+    """ -------------------------------
+                Properties definition
+        -------------------------------
+    """
+    fingerprint = property(_getFingerprint)
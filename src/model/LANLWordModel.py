@@ -2,6 +2,7 @@
 
 from collections import OrderedDict
 
+import torch
 import torch.nn as nn
 import torch.nn.functional as nnFunc
 
@@ -10,12 +11,20 @@ import src.tools.misc as miscTool
 MODEL_VERSION = '2.0.0'
 
 class LANLWordModel(nn.Module):
-    def __init__(self, device, dtype, cachePathVocabulary, corpus, modelStateDict=None):
+    def __init__(self, device, dtype, cachePathVocabulary, corpus, modelStateDict=None, voc=None, layerDevice=None):
+        """
+        :param voc: Vocabulary already loaded (e.g. shared by several models). If None, vocabulary is loaded from cachePathVocabulary
+        :param layerDevice: Device where the parameters are created. If "meta", parameters have no memory and are not initialized :
+                            they must be replaced with attachStateDict
+        """
 
         super(LANLWordModel, self).__init__()
 
         # Vocabulary parameters
-        self.voc = miscTool.loadVocabularyFromCache(cachePathVocabulary, corpus)
+        if voc is not None:
+            self.voc = voc
+        else:
+            self.voc = miscTool.loadVocabularyFromCache(cachePathVocabulary, corpus)
         self.vocSize = len(self.voc.wordIndex)
 
 
@@ -32,7 +41,9 @@ class LANLWordModel(nn.Module):
         # Layers definition
         #Embeddings
         self.embeddingSize = 100
-        self.embeddings = nn.Embedding(self.vocSize, self.embeddingSize)
+        # On the meta device, the embedding weights are given to skip their random initialization (slow on this device)
+        embeddingsWeight = torch.empty((self.vocSize, self.embeddingSize), device="meta") if str(layerDevice) == "meta" else None
+        self.embeddings = nn.Embedding(self.vocSize, self.embeddingSize, _weight=embeddingsWeight, device=layerDevice)
         #MLP
         """self.linear1 = nn.Linear((self.lineLength - 1) * self.embeddingSize, 600)
         self.linear2 = nn.Linear(600, 400)
@@ -40,11 +51,11 @@ class LANLWordModel(nn.Module):
         self.lastLinearOutSize = 1000
         self.linearLastHidden = nn.Linear(800, self.lastLinearOutSize)
         self.linearOut = nn.Linear(self.lastLinearOutSize, self.vocSize) # Output is only one word"""
-        self.linear1 = nn.Linear((self.lineLength - 1) * self.embeddingSize, 1600)
-        self.linear2 = nn.Linear(1600, 800)
+        self.linear1 = nn.Linear((self.lineLength - 1) * self.embeddingSize, 1600, device=layerDevice)
+        self.linear2 = nn.Linear(1600, 800, device=layerDevice)
         self.lastLinearOutSize = 600
-        self.linearLastHidden = nn.Linear(800, self.lastLinearOutSize)
-        self.linearOut = nn.Linear(self.lastLinearOutSize, self.vocSize)  # Output is only one word
+        self.linearLastHidden = nn.Linear(800, self.lastLinearOutSize, device=layerDevice)
+        self.linearOut = nn.Linear(self.lastLinearOutSize, self.vocSize, device=layerDevice)  # Output is only one word
         # Stores the last hidden layer to be reused
         self.lastHiddenLayer = None
 
@@ -71,6 +82,74 @@ class LANLWordModel(nn.Module):
 
 
 
+    @staticmethod
+    def fromStateDict(device, dtype, corpus, voc, stateDict, trainable=False):
+        """
+        Create a model directly over the tensors of stateDict (e.g. memory-mapped or in shared memory) :
+        its parameters are neither allocated nor initialized before being replaced
+        :param voc: Vocabulary already loaded
+        :param trainable: See attachStateDict
+        """
+        # Layers are created on the meta device : parameters have a shape but no memory
+        wordModel = LANLWordModel(device, dtype, None, corpus, voc=voc, layerDevice="meta")
+        wordModel.attachStateDict(stateDict, trainable)
+        return wordModel
+
+
+    def attachStateDict(self, stateDict, trainable=False):
+        """
+        Use the tensors of stateDict as parameters of the model, without copy (e.g. tensors in shared memory or memory-mapped).
+        :param stateDict: State dict with the same names and shapes as the model state dict. Names saved with DataParallel ("module.") are accepted
+        :param trainable: If False, attached parameters are read-only : they must not be trained. If True, they require gradients
+                          (tensors of a memory-mapped checkpoint are copied on write, the file is never modified)
+        """
+        for name, tensor in stateDict.items():
+            if name.startswith("module."):
+                name = name[7:]
+            moduleName, separator, attributeName = name.rpartition(".")
+            module = self.get_submodule(moduleName) if moduleName != "" else self
+            if attributeName in module._parameters:
+                if module._parameters[attributeName].shape != tensor.shape:
+                    raise ValueError("Shape of ", name, " is ", tuple(tensor.shape), " instead of ", tuple(module._parameters[attributeName].shape))
+                module._parameters[attributeName] = nn.Parameter(tensor, requires_grad=trainable)
+            elif attributeName in module._buffers:
+                module._buffers[attributeName] = tensor
+            else:
+                raise ValueError("Unexpected parameter ", name, " in state dict")
+
+        # A model created on the meta device must have received all its parameters
+        for name, tensor in list(self.named_parameters()) + list(self.named_buffers()):
+            if tensor.is_meta:
+                raise ValueError("Parameter ", name, " missing in state dict")
+
+
+    def lineLossFunc(self, output, target):
+        """
+        Loss function without reduction
+        :return: Tensor with the loss of each line
+        """
+        return nnFunc.cross_entropy(output, target, reduction="none")
+
+
+    def weightedLossFunc(self, output, target, weights=None, normalizer=None, lineLoss=None):
+        """
+        Loss function where each line has its own weight
+        :param weights: Weight of each line (e.g. occurrence count of deduplicated lines). If None, it's the same as lossFunc
+        :param normalizer: Value dividing the weighted sum of the losses. If None, the sum of weights is used
+        :param lineLoss: Loss of each line if already calculated with lineLossFunc
+        :return: Weighted mean of the losses of the lines
+        """
+        if weights is None:
+            return self.lossFunc(output, target)
+
+        if lineLoss is None:
+            lineLoss = self.lineLossFunc(output, target)
+        weights = weights.to(lineLoss.dtype)
+        if normalizer is None:
+            normalizer = torch.sum(weights)
+        return torch.sum(lineLoss * weights) / normalizer
+
+
     def forward(self, inputs):
         embeds = self.embeddings(inputs)
         batchSize, wordsPerLine, embeddingDim = embeds.size()
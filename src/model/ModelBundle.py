@@ -0,0 +1,84 @@
+# -*- coding: utf8 -*-
+
+import torch
+
+from src.model.LANLWordModel import LANLWordModel
+
+
+def loadCheckpoint(checkpointPath):
+    """
+    Load a checkpoint saved by torch.save with its tensors memory-mapped : tensor data is read from the file when it's used,
+    in pages of the page cache instead of a copy in the memory of the process.
+    Checkpoints saved in the legacy format (not zip) can't be memory-mapped : they are read entirely
+    :return: Checkpoint with its tensors on CPU
+    """
+    try:
+        return torch.load(checkpointPath, map_location="cpu", mmap=True)
+    except RuntimeError:
+        return torch.load(checkpointPath, map_location="cpu")
+
+
+class ModelBundle:
+    """
+    LANLWordModel of each position of a checkpoint ("word0", "word1"...), created on demand.
+    The model of a position is created directly over the tensors of the checkpoint (memory-mapped by loadCheckpoint or in shared memory)
+    the first time it's used : its parameters are never allocated nor copied on CPU.
+    Use it as the list of the models : bundle[i], len(bundle), iteration
+    """
+
+    def __init__(self, checkpoint, device, dtype, corpus, voc, stateDictKey=None, trainable=False):
+        """
+        :param checkpoint: Dictionary loaded with loadCheckpoint : key = "word" + position ; value = state dict of the model,
+                           or dictionary with the state dict under stateDictKey (e.g. "model" in the anomaly classifier with R and c)
+        :param device: Device of the models. On GPU, the model of a position is copied on the device when it's created
+        :param voc: Vocabulary shared by the models
+        :param stateDictKey: Key of the state dict in the value of each position. If None, the value is the state dict
+        :param trainable: If True, the parameters require gradients (see LANLWordModel.attachStateDict)
+        """
+        self.checkpoint = checkpoint
+        self.device = device
+        self.dtype = dtype
+        self.corpus = corpus
+        self.voc = voc
+        self.stateDictKey = stateDictKey
+        self.trainable = trainable
+        self._wordModels = [None] * len(checkpoint)
+
+
+    def __len__(self):
+        return len(self._wordModels)
+
+
+    def __getitem__(self, position):
+        wordModel = self._wordModels[position]
+        if wordModel is None:
+            wordModel = LANLWordModel.fromStateDict(self.device, self.dtype, self.corpus, self.voc, self.stateDict(position), self.trainable)
+            wordModel.eval()
+            if self.device.type != "cpu":
+                wordModel.to(self.device)
+            self._wordModels[position] = wordModel
+        return wordModel
+
+
+    def __iter__(self):
+        for position in range(len(self)):
+            yield self[position]
+
+
+    def entry(self, position):
+        """
+        :return: Value of the position in the checkpoint
+        """
+        return self.checkpoint["word" + str(position)]
+
+
+    def stateDict(self, position):
+        entry = self.entry(position)
+        return entry if self.stateDictKey is None else entry[self.stateDictKey]
+
+
+    def loadedPositions(self):
+        """
+        :return: List of the positions whose model was created
+        """
+        return [position for position, wordModel in enumerate(self._wordModels) if wordModel is not None]
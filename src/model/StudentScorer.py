@@ -0,0 +1,177 @@
+# -*- coding: utf8 -*-
+
+import torch
+import torch.nn as nn
+import torch.nn.functional as nnFunc
+
+from src.model.ModelBundle import loadCheckpoint
+from src.tools.Timer import Timer
+
+
+class LANLStudentModel(nn.Module):
+    """
+    Small network distilled from the anomaly classifier (see LANLDistillStudent) : one embedding shared by all the words of the line
+    and a small MLP predicting the score of the line and the score of each position, in one forward pass instead of one per position.
+    Scores are regressed in a compressed scale : asinh(score / targetScale)
+    """
+
+    def __init__(self, vocSize, lineLength=8, embeddingSize=32, hiddenSize=256):
+        super(LANLStudentModel, self).__init__()
+        self.vocSize = vocSize
+        self.lineLength = lineLength
+        self.embeddingSize = embeddingSize
+        self.hiddenSize = hiddenSize
+
+        self.embeddings = nn.Embedding(vocSize, embeddingSize)
+        self.linear1 = nn.Linear(lineLength * embeddingSize, hiddenSize)
+        self.linear2 = nn.Linear(hiddenSize, hiddenSize // 2)
+        self.linearOut = nn.Linear(hiddenSize // 2, lineLength + 1) # Score of each position, then score of the line
+
+        # Typical absolute value of each output, set from the teacher scores before training (saved with the parameters)
+        self.register_buffer("targetScale", torch.ones(lineLength + 1))
+
+
+    def forward(self, inputs):
+        """
+        :param inputs: Tensor of encoded lines with shape (batchSize, lineLength)
+        :return: Tensor (batchSize, lineLength + 1) of the scores in the compressed scale
+        """
+        embeds = self.embeddings(inputs).view(inputs.size(0), self.lineLength * self.embeddingSize)
+        out1 = nnFunc.relu(self.linear1(embeds))
+        out2 = nnFunc.relu(self.linear2(out1))
+        return self.linearOut(out2)
+
+
+    def transformTargets(self, positionScores, scoresSum):
+        """
+        :param positionScores: Tensor (lineLength, batchSize) of teacher scores of each position
+        :param scoresSum: Tensor (batchSize) of teacher scores of the lines
+        :return: Tensor (batchSize, lineLength + 1) of the targets in the compressed scale
+        """
+        return torch.asinh(torch.cat((positionScores, scoresSum.unsqueeze(0)), 0).t() / self.targetScale)
+
+
+    def predictScores(self, inputs):
+        """
+        :return: Tensor (lineLength, batchSize) of the predicted score of each position, tensor (batchSize) of the predicted score of the lines
+        """
+        scores = torch.sinh(self(inputs)) * self.targetScale
+        return scores[:, :self.lineLength].t(), scores[:, self.lineLength]
+
+
+def loadStudent(studentModelPath, device):
+    """
+    :param studentModelPath: Path of the checkpoint saved by LANLDistillStudent
+    :return: LANLStudentModel in eval mode, dictionary saved with it (threshold, teacherFingerprint, positionScores, report)
+    """
+    savedStudent = loadCheckpoint(studentModelPath)
+    studentModel = LANLStudentModel(savedStudent["vocSize"], savedStudent["lineLength"], savedStudent["embeddingSize"], savedStudent["hiddenSize"])
+    studentModel.load_state_dict(savedStudent["model"])
+    studentModel.eval()
+    studentModel.to(device)
+    return studentModel, savedStudent
+
+
+class TwoStageScorer:
+    """
+    Screening of the lines by the student before the anomaly classifier (teacher). The student scores every line and only the lines with
+    a student score above the threshold are scored by the teacher. The threshold is chosen low (see LANLDistillStudent) so that lines
+    screened out are almost never anomalies : they get their student score, at most 0 (never an anomaly).
+    A random part of the screened out lines (auditRate) is also scored by the teacher to estimate the anomalies missed by the screening.
+    Same API as AnomalyScorer.score
+    """
+
+    def __init__(self, anomalyScorer, studentModel, threshold, positionScores=True, auditRate=0.0, teacherSecondsPerLine=None):
+        """
+        :param anomalyScorer: AnomalyScorer of the model the student was distilled from
+        :param threshold: Lines with a student score greater or equal are scored by the teacher
+        :param positionScores: If True, the student was trained on the scores of the positions : screened out lines get them.
+                               If False, the score of a screened out line is split evenly between its positions
+        :param auditRate: Fraction of the screened out lines also scored by the teacher (their teacher score is kept)
+        :param teacherSecondsPerLine: Time of the teacher per line on full batches (measured by LANLDistillStudent), used to estimate
+                                      the time of the teacher alone. If None, its time per line on the passed lines is used : batches
+                                      of passed lines are smaller, so the speedup is overestimated
+        """
+        self.anomalyScorer = anomalyScorer
+        self.studentModel = studentModel
+        self.threshold = threshold
+        self.positionScores = positionScores
+        self.auditRate = auditRate
+        self.teacherSecondsPerLine = teacherSecondsPerLine
+        self.lineLength = anomalyScorer.lineLength
+
+        self.linesCount = 0
+        self.passedCount = 0 # Lines above the threshold, scored by the teacher
+        self.passedAnomaliesCount = 0 # Anomalies found by the teacher in passed lines
+        self.auditedCount = 0 # Screened out lines scored by the teacher for the audit
+        self.auditedAnomaliesCount = 0 # Anomalies found by the teacher in audited lines (missed by the screening)
+        self.timerStudent = Timer()
+        self.timerTeacher = Timer()
+
+
+    def score(self, inputTensor):
+        """
+        :param inputTensor: Tensor of encoded lines with shape (batchSize, lineLength)
+        :return: Tensor (lineLength, batchSize) with the score of each word of each line, tensor (batchSize) with the score of each line
+        """
+        self.timerStudent.start()
+        studentPositionScores, studentScoresSum = self.studentModel.predictScores(inputTensor)
+        passMask = studentScoresSum >= self.threshold
+        auditMask = torch.zeros_like(passMask)
+        if self.auditRate > 0:
+            auditMask = torch.logical_and(torch.logical_not(passMask), torch.rand(passMask.shape, device=passMask.device) < self.auditRate)
+
+        # Screened out lines are never anomalies
+        scoresSum = torch.clamp(studentScoresSum, max=0)
+        if self.positionScores:
+            positionScores = studentPositionScores.clone()
+        else:
+            positionScores = (scoresSum / self.lineLength).unsqueeze(0).repeat(self.lineLength, 1)
+        teacherIdx = torch.nonzero(torch.logical_or(passMask, auditMask)).view(-1)
+        self.timerStudent.stop()
+
+        self.linesCount += inputTensor.size(0)
+        if teacherIdx.numel() > 0:
+            self.timerTeacher.start()
+            teacherPositionScores, teacherScoresSum = self.anomalyScorer.score(inputTensor[teacherIdx])
+            self.timerTeacher.stop()
+            scoresSum[teacherIdx] = teacherScoresSum.to(scoresSum.dtype)
+            positionScores[:, teacherIdx] = teacherPositionScores.to(positionScores.dtype)
+
+            teacherAnomalies = teacherScoresSum > 0
+            audited = auditMask[teacherIdx]
+            counts = torch.stack((torch.logical_not(audited).sum(), torch.logical_and(teacherAnomalies, torch.logical_not(audited)).sum(),
+                                  audited.sum(), torch.logical_and(teacherAnomalies, audited).sum())).tolist()
+            self.passedCount += counts[0]
+            self.passedAnomaliesCount += counts[1]
+            self.auditedCount += counts[2]
+            self.auditedAnomaliesCount += counts[3]
+        return positionScores, scoresSum
+
+
+    def report(self):
+        """
+        :return: Dictionary with the counts of lines, the recall lost estimated by the audit and the throughput gained
+                 (time of the teacher alone is estimated with its time per line, see teacherSecondsPerLine)
+        """
+        screenedCount = self.linesCount - self.passedCount
+        auditedRate = self.auditedCount / screenedCount if screenedCount > 0 else 0.0
+        if auditedRate > 0:
+            # Each audited line stands for 1 / auditedRate screened out lines
+            missedAnomalies = self.auditedAnomaliesCount / auditedRate
+            recallLost = missedAnomalies / (self.passedAnomaliesCount + missedAnomalies) if self.passedAnomaliesCount + missedAnomalies > 0 else 0.0
+        else:
+            missedAnomalies = float("nan")
+            recallLost = float("nan")
+        teacherLinesCount = self.passedCount + self.auditedCount
+        teacherSecondsPerLine = self.teacherSecondsPerLine
+        if teacherSecondsPerLine is None:
+            teacherSecondsPerLine = self.timerTeacher.totalElapsedTime / teacherLinesCount if teacherLinesCount > 0 else float("nan")
+        screeningSeconds = self.timerStudent.totalElapsedTime + self.timerTeacher.totalElapsedTime
+        teacherOnlySeconds = teacherSecondsPerLine * self.linesCount
+        return {"lines": self.linesCount, "passedLines": self.passedCount, "passRate": self.passedCount / self.linesCount if self.linesCount > 0 else 0.0,
+                "passedAnomalies": self.passedAnomaliesCount, "auditedLines": self.auditedCount, "auditedAnomalies": self.auditedAnomaliesCount,
+                "estimatedMissedAnomalies": missedAnomalies, "estimatedRecallLost": recallLost,
+                "studentSeconds": self.timerStudent.totalElapsedTime, "teacherSeconds": self.timerTeacher.totalElapsedTime,
+                "estimatedTeacherOnlySeconds": teacherOnlySeconds,
+                "speedup": teacherOnlySeconds / screeningSeconds if screeningSeconds > 0 else float("nan")}
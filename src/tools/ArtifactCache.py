@@ -0,0 +1,162 @@
+# -*- coding: utf8 -*-
+
+import hashlib
+import json
+import os
+import shutil
+from datetime import datetime
+
+
+class ArtifactCache:
+    """
+    Outputs of the stages of the pipeline (vocabulary, word models, anomaly classifier, test results) stored in the model directory
+    under the hash of the inputs of the stage : corpusName_<stage>_<key>.<extension>.
+    Each stage declares its inputs (fingerprints of corpus files, keys of upstream artifacts, hyperparameters). If a valid artifact
+    exists for these inputs, the stage is not run again. A change of an input changes the key of the stage and of all the stages after it.
+    Artifacts are listed with their inputs in the manifest corpusName_Artifacts.json of the model directory
+    """
+
+    HASH_MODES = ("stat", "content")
+
+    def __init__(self, modelPath, corpusName, fileHashMode="stat", reuse=True):
+        """
+        :param modelPath: Model directory where artifacts and manifest are stored
+        :param corpusName: Name of the corpus, prefix of the artifact files
+        :param fileHashMode: Files are identified by their size and modification time ("stat", fast) or by the hash of their content ("content")
+        :param reuse: If False, stages are always run (their artifacts are stored anyway and replace the previous ones)
+        """
+        if fileHashMode not in self.HASH_MODES:
+            raise ValueError("File hash mode ", fileHashMode, " not supported")
+        self.modelPath = modelPath
+        self.corpusName = corpusName
+        self.fileHashMode = fileHashMode
+        self.reuse = reuse
+        self.manifestPath = os.path.join(modelPath, corpusName + "_Artifacts.json")
+        self.manifest = {} # Key = stage name + "_" + key ; value = dictionary with stage, key, file, size, sha256, created, inputs
+        if os.path.isfile(self.manifestPath):
+            with open(self.manifestPath, "r") as manifestFile:
+                self.manifest = json.load(manifestFile)
+
+
+    def fingerprintFiles(self, *paths):
+        """
+        :param paths: Files or directories (all their files, recursively)
+        :return: str: Hash of the relative path and of the size and modification time (or content) of each file
+        """
+        fingerprint = hashlib.sha256()
+        for path in paths:
+            if os.path.isdir(path):
+                filePaths = sorted(os.path.join(directory, fileName) for directory, subDirectories, fileNames in os.walk(path) for fileName in fileNames)
+            elif os.path.isfile(path):
+                filePaths = [path]
+            else:
+                raise ValueError("Input ", path, " not found")
+            for filePath in filePaths:
+                fingerprint.update(os.path.relpath(filePath, path).encode("utf8") + b"\0")
+                if self.fileHashMode == "content":
+                    fingerprint.update(_fileHash(filePath).encode())
+                else:
+                    fileStat = os.stat(filePath)
+                    fingerprint.update((str(fileStat.st_size) + ":" + str(fileStat.st_mtime_ns)).encode())
+        return fingerprint.hexdigest()
+
+
+    @staticmethod
+    def stageKey(stageName, inputs):
+        """
+        :param inputs: Dictionary of the inputs of the stage (values serializable in JSON : numbers, strings, fingerprints, keys of upstream stages)
+        :return: str: Key of the stage for these inputs
+        """
+        return hashlib.sha256(json.dumps({"stage": stageName, "inputs": inputs}, sort_keys=True).encode("utf8")).hexdigest()[:16]
+
+
+    def artifactPath(self, stageName, key, extension):
+        return os.path.join(self.modelPath, self.corpusName + "_" + stageName + "_" + key + extension)
+
+
+    def lookup(self, stageName, key):
+        """
+        :return: Path of the artifact of the stage for this key, None if there is none or if its file was removed or modified
+        """
+        entry = self.manifest.get(stageName + "_" + key)
+        if not self.reuse or entry is None:
+            return None
+        path = os.path.join(self.modelPath, entry["file"])
+        if not os.path.isfile(path) or os.path.getsize(path) != entry["size"]:
+            return None
+        return path
+
+
+    def store(self, stageName, key, inputs, outputPath, extension, copy=False):
+        """
+        Move (or copy) the output of a stage to its artifact path and add it to the manifest
+        :param outputPath: File written by the stage
+        :param copy: If True, the output file is copied (e.g. the vocabulary cache, used at its own path by the stages)
+        :return: Path of the artifact
+        """
+        path = self.artifactPath(stageName, key, extension)
+        if copy:
+            shutil.copyfile(outputPath, path)
+        else:
+            os.replace(outputPath, path)
+        self.manifest[stageName + "_" + key] = {"stage": stageName, "key": key, "file": os.path.basename(path), "size": os.path.getsize(path),
+                                                "sha256": _fileHash(path), "created": "{:%Y-%m-%d_%H:%M:%S}".format(datetime.now()), "inputs": inputs}
+        self._saveManifest()
+        return path
+
+
+    def cached(self, stageName, inputs, runStage, extension=".pt", copy=False):
+        """
+        Run a stage only if there is no valid artifact for its inputs
+        :param inputs: Dictionary of the inputs of the stage
+        :param runStage: Function without argument running the stage and returning the path of its output file
+        :return: Path of the artifact, key of the stage
+        """
+        key = self.stageKey(stageName, inputs)
+        path = self.lookup(stageName, key)
+        if path is not None:
+            print("Stage " + stageName + " up to date : " + os.path.basename(path) + " reused")
+            return path, key
+        print("Stage " + stageName + " : running (key " + key + ")")
+        return self.store(stageName, key, inputs, runStage(), extension, copy), key
+
+
+    def cachedResults(self, stageName, inputs, runStage):
+        """
+        Same as cached for a stage returning a dictionary (e.g. metrics of a test), stored in a JSON file
+        :return: Dictionary returned by the stage (or read from its artifact), key of the stage
+        """
+        def runAndWrite():
+            results = runStage()
+            resultsPath = self.artifactPath(stageName, "new", ".json")
+            with open(resultsPath, "w") as resultsFile:
+                json.dump(results, resultsFile, indent=2, sort_keys=True)
+            return resultsPath
+
+        path, key = self.cached(stageName, inputs, runAndWrite, ".json")
+        with open(path, "r") as resultsFile:
+            return json.load(resultsFile), key
+
+
+    def _saveManifest(self):
+        # Written in a temporary file then renamed, so the manifest is never half written
+        temporaryPath = self.manifestPath + ".tmp"
+        with open(temporaryPath, "w") as manifestFile:
+            json.dump(self.manifest, manifestFile, indent=2, sort_keys=True)
+        os.replace(temporaryPath, self.manifestPath)
+
+
+def restoreFile(artifactPath, path):
+    """
+    Copy an artifact to the path where the stages read it (e.g. the vocabulary cache), if the file there is different
+    """
+    if not os.path.isfile(path) or os.path.getsize(path) != os.path.getsize(artifactPath) or _fileHash(path) != _fileHash(artifactPath):
+        shutil.copyfile(artifactPath, path)
+
+
+def _fileHash(path):
+    fileHash = hashlib.sha256()
+    with open(path, "rb") as inputFile:
+        for block in iter(lambda: inputFile.read(1024 * 1024), b""):
+            fileHash.update(block)
+    return fileHash.hexdigest()
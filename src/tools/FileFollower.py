@@ -0,0 +1,156 @@
+# -*- coding: utf8 -*-
+
+import json
+import logging
+import os
+
+
+class FileFollower:
+    """
+    Read the lines appended to growing text files (like tail -F). Files are polled : each call of poll returns the new complete lines.
+    A rotated file (path now pointing to a new file) is read until its end before the new file is opened from its beginning.
+    A truncated file is read again from its beginning.
+    Offsets of the returned lines can be saved and are used to resume after a restart
+    """
+
+    def __init__(self, paths, offsetsPath="", fromEnd=False, maxBytesPerPoll=16 * 1024 * 1024):
+        """
+        :param paths: Paths of the files to follow. A file can be created after the follower
+        :param offsetsPath: If not empty, offsets are loaded from and saved to this file (JSON)
+        :param fromEnd: If True, files without saved offset are read from their end (only new lines). Otherwise from their beginning
+        :param maxBytesPerPoll: Maximum count of bytes read in one file by one poll, so a large backlog is returned in several polls
+        """
+        self.paths = list(paths)
+        self.offsetsPath = offsetsPath
+        self.fromEnd = fromEnd
+        self.maxBytesPerPoll = maxBytesPerPoll
+
+        # Key = path ; value = dictionary with the open file, its inode, the offset after the last returned line and the incomplete last line
+        self.states = {path: None for path in self.paths}
+
+        self.savedOffsets = {}
+        if self.offsetsPath != "" and os.path.isfile(self.offsetsPath):
+            with open(self.offsetsPath, "r") as offsetsFile:
+                self.savedOffsets = json.load(offsetsFile)
+
+        # Statistics
+        self.rotationCount = 0
+        self.truncationCount = 0
+
+
+    def _open(self, path, resume):
+        """
+        :param resume: If True, the saved offset is used when it is still valid (same inode, file not shorter)
+        :return: State of the opened file, None if it does not exist
+        """
+        try:
+            file = open(path, "rb")
+        except FileNotFoundError:
+            return None
+        fileStat = os.fstat(file.fileno())
+
+        offset = 0
+        savedOffset = self.savedOffsets.get(path)
+        if resume and savedOffset is not None:
+            if savedOffset["inode"] == fileStat.st_ino and savedOffset["offset"] <= fileStat.st_size:
+                offset = savedOffset["offset"]
+            else:
+                logging.warning("Saved offset of " + path + " is not valid anymore (rotated or truncated file). Reading from the beginning")
+        elif resume and self.fromEnd:
+            offset = fileStat.st_size
+        file.seek(offset)
+        return {"file": file, "inode": fileStat.st_ino, "offset": offset, "partialLine": b""}
+
+
+    def _readLines(self, state, maxBytes):
+        """
+        :return: List of complete lines read from the current position of the file
+        """
+        data = state["file"].read(maxBytes)
+        if not data:
+            return []
+        data = state["partialLine"] + data
+        lastNewline = data.rfind(b"\n")
+        state["partialLine"] = data[lastNewline + 1:]
+        if lastNewline < 0:
+            return []
+        state["offset"] = state["file"].tell() - len(state["partialLine"])
+        return [line.decode(errors="replace").replace("\r\n", "\n") for line in data[:lastNewline + 1].splitlines(keepends=True)]
+
+
+    def _pollFile(self, path):
+        state = self.states[path]
+        if state is None:
+            state = self._open(path, True)
+            if state is None:
+                return []
+            self.states[path] = state
+
+        lines = self._readLines(state, self.maxBytesPerPoll)
+        if len(lines) > 0:
+            return lines
+
+        # End of the open file reached. Check if the path still points to this file
+        try:
+            pathStat = os.stat(path)
+        except FileNotFoundError:
+            # Rotated file not yet replaced : keep reading the old file
+            return []
+
+        if pathStat.st_ino != state["inode"]:
+            # Rotated : the old file is over, its incomplete last line is returned as a complete line
+            self.rotationCount += 1
+            if len(state["partialLine"]) > 0:
+                lines = [state["partialLine"].decode(errors="replace") + "\n"]
+            state["file"].close()
+            self.states[path] = self._open(path, False)
+        elif pathStat.st_size < state["offset"] + len(state["partialLine"]):
+            # Truncated : read again from the beginning
+            self.truncationCount += 1
+            state["file"].seek(0)
+            state["offset"] = 0
+            state["partialLine"] = b""
+        return lines
+
+
+    def poll(self):
+        """
+        Read the new complete lines of all the files. A line without its newline is returned when it's completed
+        :return: List of tuples (path, line)
+        """
+        newLines = []
+        for path in self.paths:
+            newLines.extend((path, line) for line in self._pollFile(path))
+        return newLines
+
+
+    def offsets(self):
+        """
+        :return: Dictionary (key = path) with the inode of each open file and the offset after its last returned line
+        """
+        offsets = dict(self.savedOffsets)
+        for path, state in self.states.items():
+            if state is not None:
+                offsets[path] = {"inode": state["inode"], "offset": state["offset"]}
+        return offsets
+
+
+    def saveOffsets(self):
+        """
+        Save the offsets of the returned lines. Call it once the returned lines are processed :
+        after a restart, lines returned but not processed before the last save are read again
+        """
+        if self.offsetsPath == "":
+            return
+        self.savedOffsets = self.offsets()
+        temporaryPath = self.offsetsPath + ".tmp"
+        with open(temporaryPath, "w") as offsetsFile:
+            json.dump(self.savedOffsets, offsetsFile)
+        os.replace(temporaryPath, self.offsetsPath)
+
+
+    def close(self):
+        for state in self.states.values():
+            if state is not None:
+                state["file"].close()
+        self.states = {path: None for path in self.paths}
@@ -1,16 +1,29 @@
 # -*- coding: utf8 -*-
-import matplotlib.pyplot as plt
-import torch
-from scipy.integrate import simps, trapz
+import numpy as np
 
-from tools.metrics.Fmeasure import Fmeasure
+from src.tools.metrics.Fmeasure import Fmeasure
+
+
+def integrate(pointsY, pointsX):
+    """
+    Area under a curve. SciPy is imported here, only when an AUC is calculated
+    :return: Area with the Simpson rule, area with the trapezoidal rule
+    """
+    from scipy import integrate as scipyIntegrate
+
+    # simps and trapz are named simpson and trapezoid in recent SciPy versions
+    simpson = getattr(scipyIntegrate, "simpson", None) or scipyIntegrate.simps
+    trapezoid = getattr(scipyIntegrate, "trapezoid", None) or scipyIntegrate.trapz
+    return simpson(pointsY, x=pointsX), trapezoid(pointsY, x=pointsX)
 
 
 class Graphs:
 
     def __init__(self, probabilityList, positiveValue, negativeValue, thresholdStart, thresholdEnd, thresholdStep, fmeasureMode=None, onGC=False):
         """
-        :param probabilityList: A list of tuples with probability as first value and gold value as second value
+        :param probabilityList: A list of tuples with probability as first value and gold value as second value,
+                                or a ScoreSink (probabilities and gold values are read from its scores and labels),
+                                or a ScoreHistogram (points of the curves are calculated at its bin edges, whatever fmeasureMode)
         :param positiveValue: The value considered as positive value for metrics calculation
         :param negativeValue: The value considered as negative value for metrics calculation
         :param thresholdStart: Start value for the probability threshold
@@ -29,10 +42,15 @@ class Graphs:
         self.onGC = onGC
 
         # Calculate fmeasure list with model probabilities
-        if fmeasureMode is None:
-            self.fmeasureList = self.calculateFmeasureList(self.probabilityList)
+        # In sort mode, points of the curves are calculated as arrays and fmeasure list is only created when used
+        self.curve = None
+        self._fmeasureList = None
+        if hasattr(probabilityList, "histogramCounts"):
+            self.curve = self.probabilityList.curve()
+        elif fmeasureMode is None:
+            self._fmeasureList = self.calculateFmeasureList(self.probabilityList)
         elif fmeasureMode == "sort":
-            self.fmeasureList = self.calculateFmeasureListSort(self.probabilityList)
+            self.curve = self.calculateCurveSort(self.probabilityList)
         else:
             raise ValueError("fmeasureMode not supported")
 
@@ -41,35 +59,34 @@ class Graphs:
         """
         Plot the precision-recall curve to evaluate a model
         """
-        modelPointsPrecision, modelPointsRecall = self.precisionRecallCurve(self.fmeasureList)
+        if self.curve is not None:
+            modelPointsPrecision = np.nan_to_num(self.curve["precision"], nan=0.0)
+            modelPointsRecall = np.nan_to_num(self.curve["recall"], nan=0.0)
+            positiveCount = int(self.curve["truePositive"][0])
+            negativeCount = int(self.curve["falsePositive"][0])
+        else:
+            modelPointsPrecision, modelPointsRecall = self.precisionRecallCurve(self.fmeasureList)
+            probabilities, golds = self.probabilitiesAndGolds(self.probabilityList)
+            positiveCount = int(np.count_nonzero(golds == self.positiveValue))
+            negativeCount = golds.shape[0] - positiveCount
 
         # Baseline. Predicts always the ratio of the positive case (it's a horizontal line)
-        positiveCount = 0
-        negativeCount = 0
-        for prob, gold in self.probabilityList:
-            if gold == self.positiveValue:
-                positiveCount += 1
-            else:
-                negativeCount += 1
         baselinePoints = positiveCount / (positiveCount + negativeCount)
 
-        concatList = list(zip(modelPointsRecall, modelPointsPrecision))
-        concatList.sort(key=lambda elem: elem[0])
-        unconcatList = list(zip(*concatList))
-        modelPointsRecall = list(unconcatList[0])
-        modelPointsPrecision = list(unconcatList[1])
+        modelPointsRecall, modelPointsPrecision = self.sortPoints(modelPointsRecall, modelPointsPrecision)
 
         # Compute and print the AUC
-        realPrecRecAucSimps = simps(modelPointsPrecision, modelPointsRecall)
-        baselinePrecRecAucSimps = simps([baselinePoints, baselinePoints], [self.thresholdStart, self.thresholdEnd])
-        realPrecRecAucTrapz = trapz(modelPointsPrecision, modelPointsRecall)
-        baselinePrecRecAucTrapz = trapz([baselinePoints, baselinePoints], [self.thresholdStart, self.thresholdEnd])
+        realPrecRecAucSimps, realPrecRecAucTrapz = integrate(modelPointsPrecision, modelPointsRecall)
+        baselinePrecRecAucSimps, baselinePrecRecAucTrapz = integrate([baselinePoints, baselinePoints], [self.thresholdStart, self.thresholdEnd])
         print("Real Precision-Recall AUC Simps : ", realPrecRecAucSimps)
         print("Real Precision-Recall AUC Trapz : ", realPrecRecAucTrapz)
+        if self.curve is not None and "precisionRecallAucBounds" in self.curve:
+            print("Real Precision-Recall AUC bounds (histogram) : ", self.curve["precisionRecallAucBounds"])
         print("Baseline Precision-Recall AUC Simps : ", baselinePrecRecAucSimps)
         print("Baseline Precision-Recall AUC Trapz : ", baselinePrecRecAucTrapz)
 
-        #  Plot the graph and display it
+        #  Plot the graph and display it. Matplotlib is imported here, only when a graph is drawn
+        import matplotlib.pyplot as plt
         plt.plot(modelPointsRecall, modelPointsPrecision, marker=".", label="Model")
         plt.plot([self.thresholdStart, self.thresholdEnd], [baselinePoints, baselinePoints], linestyle="--", label="Baseline")
         plt.xlabel("Recall")
@@ -112,43 +129,36 @@ class Graphs:
         :param thresholdStep: Step between two threshold value
         """
 
-        modelPointsRecall, modelPointsFPRate = self.rocCurve(self.fmeasureList)
-        # Baseline. It's a random choose between the two classes, so the probability for each point is 0.5
-        # Calculate custom fmeasure list (beacause self.fmeasureList is created with model output probabilities)
-        baselineProb = [(0.5, gold) for prob, gold in self.probabilityList]
-        baselineFmeasureList = self.calculateFmeasureList(baselineProb)
-        baselinePointsRecall, baselinePointsFPRate = self.rocCurve(baselineFmeasureList)
+        if self.curve is not None:
+            modelPointsRecall = np.nan_to_num(self.curve["recall"], nan=0.0)
+            modelPointsFPRate = np.nan_to_num(self.curve["falsePositiveRate"], nan=0.0)
+        else:
+            modelPointsRecall, modelPointsFPRate = self.rocCurve(self.fmeasureList)
+        # Baseline. It's a random choose between the two classes, so the probability for each point is 0.5
+        # All lines are predicted positive (threshold <= 0.5) or negative (threshold > 0.5) : it's the diagonal
+        baselinePointsFPRate = [0, 1]
+        baselinePointsRecall = [0, 1]
 
         # Sort points lists
-        concatListReal = list(zip(modelPointsRecall, modelPointsFPRate))
-        concatListReal.sort(key=lambda elem: elem[0])
-        unconcatListReal = list(zip(*concatListReal))
-        modelPointsRecall = list(unconcatListReal[0])
-        modelPointsFPRate = list(unconcatListReal[1])
-
-        concatListBaseline = list(zip(baselinePointsRecall, baselinePointsFPRate))
-        concatListBaseline.sort(key=lambda elem: elem[0])
-        unconcatListBaseline = list(zip(*concatListBaseline))
-        baselinePointsRecall = list(unconcatListBaseline[0])
-        baselinePointsFPRate = list(unconcatListBaseline[1])
+        modelPointsFPRate, modelPointsRecall = self.sortPoints(modelPointsFPRate, modelPointsRecall)
 
         #  Compute and print the AUC
-        realRocAucSimps = simps(modelPointsFPRate, modelPointsRecall)
-        baselineRocAucSimps = simps(baselinePointsFPRate, baselinePointsRecall)
-        realRocAucTrapz = trapz(modelPointsFPRate, modelPointsRecall)
-        baselineRocAucTrapz = trapz(baselinePointsFPRate, baselinePointsRecall)
+        realRocAucSimps, realRocAucTrapz = integrate(modelPointsRecall, modelPointsFPRate)
+        baselineRocAucSimps, baselineRocAucTrapz = integrate(baselinePointsRecall, baselinePointsFPRate)
         print("Real ROC AUC Simps : ", realRocAucSimps)
         print("Real ROC AUC Trapz : ", realRocAucTrapz)
+        if self.curve is not None and "rocAucBounds" in self.curve:
+            print("Real ROC AUC bounds (histogram) : ", self.curve["rocAucBounds"])
         print("Baseline ROC AUC Simps : ", baselineRocAucSimps)
         print("Baseline ROC AUC Trapz : ", baselineRocAucTrapz)
 
-        #  Plot the graph and display it
-        plt.plot(modelPointsRecall, modelPointsFPRate, marker=".", label="Model")
-        plt.plot(baselinePointsRecall, baselinePointsFPRate, linestyle="--", label="Baseline")
+        #  Plot the graph and display it. Matplotlib is imported here, only when a graph is drawn
+        import matplotlib.pyplot as plt
+        plt.plot(modelPointsFPRate, modelPointsRecall, marker=".", label="Model")
+        plt.plot(baselinePointsFPRate, baselinePointsRecall, linestyle="--", label="Baseline")
         plt.xlabel("False Positive Rate")
         plt.ylabel("Recall")
         plt.title("ROC Curve")
-        plt.text()
         plt.gca().legend()
         plt.show()
 
@@ -177,24 +187,52 @@ class Graphs:
         return plotPointsRecall, plotPointsFalsePositiveRate
 
 
+    @staticmethod
+    def sortPoints(pointsX, pointsY):
+        """
+        Sort points of a curve by increasing x. Points with the same x keep their order
+        :return: numpy array of x, numpy array of y
+        """
+        pointsX = np.asarray(pointsX, dtype=np.float64)
+        pointsY = np.asarray(pointsY, dtype=np.float64)
+        sortOrder = np.argsort(pointsX, kind="stable")
+        return pointsX[sortOrder], pointsY[sortOrder]
+
+
+    @staticmethod
+    def trapezoidArea(pointsY, pointsX):
+        """
+        Area under a curve with the trapezoidal rule. Points must be sorted by x
+        """
+        return float(np.sum(np.diff(pointsX) * (pointsY[1:] + pointsY[:-1]) / 2))
+
+
+    def probabilitiesAndGolds(self, probabilityList):
+        """
+        :param probabilityList: A list of tuples with probability as first value and gold value as second value, or a ScoreSink
+        :return: numpy array of probabilities, numpy array of gold values
+        """
+        if hasattr(probabilityList, "scores") and hasattr(probabilityList, "labels"):
+            return probabilityList.scores, probabilityList.labels
+
+        probabilities = np.array([float(prob) for prob, gold in probabilityList], dtype=np.float64)
+        golds = np.array([int(gold) for prob, gold in probabilityList], dtype=np.int64)
+        return probabilities, golds
+
+
     def calculateFmeasureList(self, probabilityList):
         """
-        :param probabilityList: A list of tuples with probability as first value and gold value as second value
+        :param probabilityList: A list of tuples with probability as first value and gold value as second value, or a ScoreSink
         :return: The list of all fmeasure calculated
         """
+        probabilities, golds = self.probabilitiesAndGolds(probabilityList)
+        goldList = golds.tolist()
+
         currentThreshold = self.thresholdStart
         fmeasureList = []
         while currentThreshold <= self.thresholdEnd:
             fmeasure = Fmeasure("List")
-            predictionList = []
-            goldList = []
-            for prob, gold in probabilityList:
-                if float(prob) >= currentThreshold:
-                    predictionList.append(self.positiveValue)
-                else:
-                    predictionList.append(self.negativeValue)
-
-                goldList.append(gold)
+            predictionList = np.where(probabilities >= currentThreshold, self.positiveValue, self.negativeValue).tolist()
 
             fmeasure.metricsCalculation(predictionList, goldList, self.positiveValue)
             fmeasureList.append(fmeasure)
@@ -202,40 +240,92 @@ class Graphs:
 
         return fmeasureList
 
+    def calculateCurveSort(self, probabilityList):
+        """
+        Calculate the points of the curves with one sort and cumulative sums of positive and negative cases.
+        First point predicts all lines as positive. Then, for each distinct probability p (increasing order),
+        there is a point predicting as positive the lines with a probability strictly greater than p
+        :param probabilityList: A list of tuples with probability as first value and gold value as second value, or a ScoreSink
+        :return: Dictionary of numpy arrays with one value per point : thresholds (positive if probability > threshold),
+                 truePositive, falsePositive, falseNegative, trueNegative, precision, recall, falsePositiveRate (NaN if not calculable).
+                 And the areas under the curves : precisionRecallAuc, rocAuc (trapezoidal rule)
+        """
+        probabilities, golds = self.probabilitiesAndGolds(probabilityList)
+
+        # Sort by increasing probability
+        sortOrder = np.argsort(probabilities, kind="stable")
+        sortedProbabilities = probabilities[sortOrder]
+        sortedPositives = golds[sortOrder] == self.positiveValue
+
+        positiveCount = int(np.count_nonzero(sortedPositives))
+        negativeCount = sortedPositives.shape[0] - positiveCount
+
+        # Index of the last line of each distinct probability
+        lastIdx = np.flatnonzero(sortedProbabilities[1:] != sortedProbabilities[:-1])
+        if sortedProbabilities.shape[0] > 0:
+            lastIdx = np.append(lastIdx, sortedProbabilities.shape[0] - 1)
+
+        # Lines until lastIdx (included) are predicted negative
+        negativePredictedPositives = np.cumsum(sortedPositives, dtype=np.int64)[lastIdx]
+        negativePredictedNegatives = lastIdx + 1 - negativePredictedPositives
+
+        truePositive = np.concatenate(([positiveCount], positiveCount - negativePredictedPositives))
+        falsePositive = np.concatenate(([negativeCount], negativeCount - negativePredictedNegatives))
+        falseNegative = positiveCount - truePositive
+        trueNegative = negativeCount - falsePositive
+        thresholds = np.concatenate(([-np.inf], sortedProbabilities[lastIdx].astype(np.float64)))
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            precision = truePositive / (truePositive + falsePositive)
+            recall = truePositive / np.float64(positiveCount)
+            falsePositiveRate = falsePositive / np.float64(negativeCount)
+
+        curve = {"thresholds": thresholds, "truePositive": truePositive, "falsePositive": falsePositive,
+                 "falseNegative": falseNegative, "trueNegative": trueNegative,
+                 "precision": precision, "recall": recall, "falsePositiveRate": falsePositiveRate}
+
+        # Not calculable values are 0 for areas, as in the drawn curves
+        sortedRecall, sortedPrecision = self.sortPoints(np.nan_to_num(recall, nan=0.0), np.nan_to_num(precision, nan=0.0))
+        curve["precisionRecallAuc"] = self.trapezoidArea(sortedPrecision, sortedRecall)
+        sortedFPRate, sortedRecall = self.sortPoints(np.nan_to_num(falsePositiveRate, nan=0.0), np.nan_to_num(recall, nan=0.0))
+        curve["rocAuc"] = self.trapezoidArea(sortedRecall, sortedFPRate)
+
+        return curve
+
+
+    def fmeasureListFromCurve(self, curve):
+        """
+        :param curve: Dictionary returned by calculateCurveSort
+        :return: The list of fmeasure of each point of the curve
+        """
+        fmeasureList = []
+        for truePositive, falsePositive, falseNegative, trueNegative in zip(curve["truePositive"].tolist(), curve["falsePositive"].tolist(),
+                                                                            curve["falseNegative"].tolist(), curve["trueNegative"].tolist()):
+            fmeasure = Fmeasure("List")
+            fmeasure.metricsFromCounts(truePositive, falsePositive, falseNegative, trueNegative)
+            fmeasureList.append(fmeasure)
+        return fmeasureList
+
+
     def calculateFmeasureListSort(self, probabilityList):
         """
-        :param probabilityList: A list of tuples with probability as first value and gold value as second value
+        :param probabilityList: A list of tuples with probability as first value and gold value as second value, or a ScoreSink
         :return: The list of all fmeasure calculated
         """
+        return self.fmeasureListFromCurve(self.calculateCurveSort(probabilityList))
 
-        # Sort input list by increasing probability
-        probabilityList.sort(key=lambda elem: elem[0])
 
-        # Calculate gold value list
-        if self.onGC:
-            goldList = torch.tensor([currentGold for currentProb, currentGold in probabilityList], device=torch.device('cuda:0'))
-            predictionList = torch.tensor([self.positiveValue] * len(probabilityList), device=torch.device('cuda:0'))
-            fmeasureMode = "Tensor"
-        else:
-            goldList = [currentGold for currentProb, currentGold in probabilityList]
-            predictionList = [self.positiveValue] * len(probabilityList)
-            fmeasureMode = "List"
+    def _getFmeasureList(self):
+        if self._fmeasureList is None:
+            self._fmeasureList = self.fmeasureListFromCurve(self.curve)
+        return self._fmeasureList
 
-        fmeasureList = []
-        fmeasure = Fmeasure(fmeasureMode)
-        fmeasure.metricsCalculation(predictionList, goldList, self.positiveValue)
-        fmeasureList.append(fmeasure)
-        currentIdx = 0
-        while currentIdx < len(probabilityList):
-            fmeasure = Fmeasure(fmeasureMode)
-            saveProbValue = probabilityList[currentIdx][0]
-            while probabilityList[currentIdx][0] == saveProbValue:
-                predictionList[currentIdx] = self.negativeValue
-                currentIdx += 1
-                if currentIdx >= len(probabilityList):
-                    break
+    def _setFmeasureList(self, fmeasureList):
+        self._fmeasureList = fmeasureList
 
-            fmeasure.metricsCalculation(predictionList, goldList, self.positiveValue)
-            fmeasureList.append(fmeasure)
 
-        return fmeasureList
+    """ -------------------------------
+                Properties definition
+        -------------------------------
+    """
+    fmeasureList = property(_getFmeasureList, _setFmeasureList)
@@ -0,0 +1,282 @@
+# -*- coding: utf8 -*-
+
+import bisect
+import functools
+import json
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from src.tools.Timer import Timer
+
+
+# Upper bounds (seconds) of the buckets of the span histograms : 8 buckets per power of 10, from 1 microsecond to 10000 seconds
+BUCKET_BOUNDS = [10 ** (exponent / 8) for exponent in range(-48, 33)]
+
+
+class SpanTimer(Timer):
+    """
+    Timer of a named span, registered in an Instrumentation. Each measured duration is also counted in a histogram with fixed
+    logarithmic buckets, so percentiles are known with a relative error lower than the bucket width (about 33 %) at constant cost.
+    Can be used as a Timer (start / stop) or through Instrumentation.span
+    """
+
+    def __init__(self, name):
+        super(SpanTimer, self).__init__()
+        self.name = name
+        self.count = 0
+        self.minElapsedTime = math.inf
+        self.maxElapsedTime = 0
+        self.bucketCounts = [0] * (len(BUCKET_BOUNDS) + 1) # Last bucket : longer than the last bound
+        self._lock = threading.Lock()
+
+
+    def stop(self):
+        super(SpanTimer, self).stop()
+        self._add(self.lastElapsedTime, False)
+
+
+    def add(self, elapsedTime):
+        """
+        Record a duration measured outside the timer (e.g. by a span, to allow concurrent uses of the same span)
+        :param elapsedTime: Duration in seconds
+        """
+        self._add(elapsedTime, True)
+
+
+    def _add(self, elapsedTime, updateTotals):
+        with self._lock:
+            if updateTotals:
+                self.lastElapsedTime = elapsedTime
+                self.totalElapsedTime += elapsedTime
+            self.count += 1
+            if elapsedTime < self.minElapsedTime:
+                self.minElapsedTime = elapsedTime
+            if elapsedTime > self.maxElapsedTime:
+                self.maxElapsedTime = elapsedTime
+            self.bucketCounts[bisect.bisect_left(BUCKET_BOUNDS, elapsedTime)] += 1
+
+
+    def percentile(self, quantile):
+        """
+        :param quantile: Between 0 and 1
+        :return: Estimation of the quantile of the durations (interpolated in its bucket on a logarithmic scale, bounded by min and max). 0 if no duration
+        """
+        if self.count == 0:
+            return 0.0
+        rank = quantile * self.count
+        cumulativeCount = 0
+        for bucketIdx, bucketCount in enumerate(self.bucketCounts):
+            cumulativeCount += bucketCount
+            if cumulativeCount >= rank and bucketCount > 0:
+                break
+
+        # Bounds of the bucket, narrowed by min and max
+        lowerBound = max(BUCKET_BOUNDS[bucketIdx - 1] if bucketIdx > 0 else 0.0, self.minElapsedTime)
+        upperBound = min(BUCKET_BOUNDS[bucketIdx] if bucketIdx < len(BUCKET_BOUNDS) else math.inf, self.maxElapsedTime)
+        if lowerBound <= 0 or upperBound <= lowerBound:
+            return upperBound
+        fraction = (rank - (cumulativeCount - bucketCount)) / bucketCount
+        return lowerBound * (upperBound / lowerBound) ** fraction
+
+
+    def summary(self):
+        """
+        :return: Dictionary with the count, the total, last, min and max durations and the p50, p95 and p99 percentiles (seconds)
+        """
+        return {"count": self.count, "total": self.totalElapsedTime, "last": self.lastElapsedTime,
+                "min": self.minElapsedTime if self.count > 0 else 0.0, "max": self.maxElapsedTime,
+                "p50": self.percentile(0.5), "p95": self.percentile(0.95), "p99": self.percentile(0.99)}
+
+
+class _Span:
+
+    def __init__(self, instrumentation, name):
+        self.instrumentation = instrumentation
+        self.name = name
+        self.spanTimer = None
+        self._startTime = 0
+
+    def __enter__(self):
+        stack = self.instrumentation._spanStack()
+        fullName = stack[-1] + "/" + self.name if len(stack) > 0 else self.name
+        stack.append(fullName)
+        self.spanTimer = self.instrumentation.timer(fullName)
+        self._startTime = time.perf_counter()
+        return self.spanTimer
+
+    def __exit__(self, excType, excValue, traceback):
+        self.spanTimer.add(time.perf_counter() - self._startTime)
+        self.instrumentation._spanStack().pop()
+        self.instrumentation.maybeExport()
+        return False
+
+
+class Instrumentation:
+    """
+    Registry of the named span timers and counters of a program.
+    Spans are nested : a span opened inside another span of the same thread is named "parent/child".
+    Timers can also be used directly with start / stop and an explicit hierarchical name.
+    Values are exported periodically (when a span ends or maybeExport is called) to a JSON lines file and to a Prometheus text file
+    """
+
+    def __init__(self, jsonLinesPath="", prometheusPath="", exportInterval=60, metricPrefix="log_anomaly_detection"):
+        """
+        :param jsonLinesPath: If not empty, a snapshot of all values is appended to this file at each export
+        :param prometheusPath: If not empty, this file is replaced at each export by the values in Prometheus text format
+                               (e.g. for the textfile collector of node_exporter)
+        :param exportInterval: Minimum time in seconds between two periodic exports
+        :param metricPrefix: Prefix of the Prometheus metric names
+        """
+        self.jsonLinesPath = jsonLinesPath
+        self.prometheusPath = prometheusPath
+        self.exportInterval = exportInterval
+        self.metricPrefix = metricPrefix
+
+        self.timers = OrderedDict() # Key = span name ; value = SpanTimer
+        self.counters = OrderedDict() # Key = counter name ; value = count
+        self._lock = threading.Lock()
+        self._exportLock = threading.Lock()
+        self._local = threading.local()
+        self._startTime = time.time()
+        self._lastExportTime = time.perf_counter()
+
+
+    def _spanStack(self):
+        if not hasattr(self._local, "stack"):
+            self._local.stack = []
+        return self._local.stack
+
+
+    def timer(self, name):
+        """
+        :param name: Full name of the span ("/" separates the levels)
+        :return: SpanTimer of this name, created if needed
+        """
+        spanTimer = self.timers.get(name)
+        if spanTimer is None:
+            with self._lock:
+                spanTimer = self.timers.setdefault(name, SpanTimer(name))
+        return spanTimer
+
+
+    def span(self, name):
+        """
+        :param name: Name of the span, relative to the enclosing span
+        :return: Context manager measuring its block. It returns the SpanTimer of the span
+        """
+        return _Span(self, name)
+
+
+    def timed(self, name):
+        """
+        :param name: Name of the span, relative to the enclosing span
+        :return: Decorator measuring each call of the function in a span
+        """
+        def decorator(function):
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                with self.span(name):
+                    return function(*args, **kwargs)
+            return wrapper
+        return decorator
+
+
+    def count(self, name, value=1):
+        """
+        :param name: Name of the counter (e.g. "test/lines", "test/bytes")
+        :param value: Value added to the counter
+        """
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+
+    def getCount(self, name):
+        return self.counters.get(name, 0)
+
+
+    def snapshot(self):
+        """
+        :return: Dictionary with the time, the elapsed time since the creation, the summary of each span and the counters
+        """
+        return {"time": time.time(), "elapsed": time.time() - self._startTime,
+                "spans": {name: spanTimer.summary() for name, spanTimer in list(self.timers.items())},
+                "counters": dict(self.counters)}
+
+
+    def maybeExport(self):
+        """
+        Export if the last export is older than exportInterval
+        """
+        if (self.jsonLinesPath != "" or self.prometheusPath != "") and time.perf_counter() - self._lastExportTime >= self.exportInterval:
+            self.export()
+
+
+    def export(self):
+        """
+        Append a snapshot to the JSON lines file and replace the Prometheus file
+        """
+        with self._exportLock:
+            self._lastExportTime = time.perf_counter()
+            if self.jsonLinesPath != "":
+                with open(self.jsonLinesPath, "a") as jsonLinesFile:
+                    jsonLinesFile.write(json.dumps(self.snapshot()) + "\n")
+            if self.prometheusPath != "":
+                # Written in a temporary file then renamed, so the file is never read half written
+                temporaryPath = self.prometheusPath + "." + str(os.getpid()) + ".tmp"
+                with open(temporaryPath, "w") as prometheusFile:
+                    prometheusFile.write(self.prometheusText())
+                os.replace(temporaryPath, self.prometheusPath)
+
+
+    def prometheusText(self):
+        """
+        :return: str: Spans as histograms (seconds) and counters in Prometheus text format
+        """
+        lines = []
+        spanMetric = self.metricPrefix + "_span_seconds"
+        lines.append("# HELP " + spanMetric + " Duration of the spans")
+        lines.append("# TYPE " + spanMetric + " histogram")
+        for name, spanTimer in list(self.timers.items()):
+            label = 'span="' + name + '"'
+            cumulativeCount = 0
+            for bound, bucketCount in zip(BUCKET_BOUNDS, spanTimer.bucketCounts):
+                cumulativeCount += bucketCount
+                lines.append(spanMetric + "_bucket{" + label + ',le="' + "{:.6g}".format(bound) + '"} ' + str(cumulativeCount))
+            lines.append(spanMetric + "_bucket{" + label + ',le="+Inf"} ' + str(spanTimer.count))
+            lines.append(spanMetric + "_sum{" + label + "} " + repr(spanTimer.totalElapsedTime))
+            lines.append(spanMetric + "_count{" + label + "} " + str(spanTimer.count))
+
+        counterMetric = self.metricPrefix + "_count_total"
+        lines.append("# HELP " + counterMetric + " Counters (lines, bytes, batches...)")
+        lines.append("# TYPE " + counterMetric + " counter")
+        for name, value in list(self.counters.items()):
+            lines.append(counterMetric + '{counter="' + name + '"} ' + str(value))
+        return "\n".join(lines) + "\n"
+
+
+    def printReport(self):
+        """
+        Print the spans as a tree (last and total durations in seconds, percentiles in milliseconds) and the counters
+        """
+        print("===== Timers =====")
+        printedNames = set()
+        for name, spanTimer in list(self.timers.items()):
+            # Parents without timer are printed as headers
+            nameParts = name.split("/")
+            for depth in range(1, len(nameParts)):
+                parentName = "/".join(nameParts[:depth])
+                if parentName not in self.timers and parentName not in printedNames:
+                    print("  " * (depth - 1) + "- " + nameParts[depth - 1])
+                    printedNames.add(parentName)
+
+            summary = spanTimer.summary()
+            print("  " * name.count("/") + "- " + name.rsplit("/", 1)[-1] + " : last " + str(summary["last"]) + " / total " + str(summary["total"]) +
+                  " / count " + str(summary["count"]) + " / p50 " + str(round(summary["p50"] * 1000, 3)) + " ms / p95 " + str(round(summary["p95"] * 1000, 3)) +
+                  " ms / p99 " + str(round(summary["p99"] * 1000, 3)) + " ms")
+        if len(self.counters) > 0:
+            print("===== Counters =====")
+            for name, value in list(self.counters.items()):
+                print("  - " + name + " : " + str(value))
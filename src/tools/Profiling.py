@@ -0,0 +1,197 @@
+# -*- coding: utf8 -*-
+
+import contextlib
+import os
+import tracemalloc
+
+import torch
+
+
+# Returned by StageProfiler.region when profiling is disabled
+_NULL_CONTEXT = contextlib.nullcontext()
+
+# Allocations of tracemalloc and of the profiler itself are not shown in the memory summary
+_TRACEMALLOC_FILTERS = (tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, "*/torch/autograd/profiler*"),
+                        tracemalloc.Filter(False, "*/torch/profiler/*"))
+
+
+def residentMemoryMb():
+    """
+    :return: Current and peak resident memory of the process in MB (0, 0 if /proc is not available)
+    """
+    rssMb = 0.0
+    peakRssMb = 0.0
+    if os.path.isfile("/proc/self/status"):
+        with open("/proc/self/status", "r") as statusFile:
+            for statusLine in statusFile:
+                if statusLine.startswith("VmRSS:"):
+                    rssMb = int(statusLine.split()[1]) / 1024
+                elif statusLine.startswith("VmHWM:"):
+                    peakRssMb = int(statusLine.split()[1]) / 1024
+    return rssMb, peakRssMb
+
+
+class StageProfiler:
+    """
+    Profiling mode of a stage of the pipeline (training, calibration, test). Disabled if outputPath is empty : then all methods
+    return immediately and nothing is started or written.
+    When enabled :
+      - a window of batches (after skipBatches + warmupBatches batches) is recorded by torch.profiler with CPU time and allocations of
+        each operator. The trace is written in outputPath/stageName, it can be opened in chrome://tracing, Perfetto or TensorBoard
+      - at each stage boundary, resident memory is recorded and, if traceMemory, a tracemalloc snapshot is compared with the previous one
+      - stop prints a short hotspot summary, also written in outputPath/stageName/hotspots.txt
+    Use : start() before the batch loop, step() at the end of each batch, region(name) around parts to see in the trace
+    (e.g. each of the 8 models), stopBatches() after the batch loop, boundary(name) between steps of the stage, stop() at the end
+    """
+
+    def __init__(self, outputPath="", stageName="stage", skipBatches=10, warmupBatches=2, profiledBatches=20, traceMemory=True, topCount=10):
+        """
+        :param outputPath: Directory of the profiling results. If empty, profiling is disabled
+        :param stageName: Name of the stage, used as sub directory and in the summary
+        :param skipBatches: Batches not recorded at the beginning (first batches are slower : allocations, caches)
+        :param warmupBatches: Batches where the profiler runs without recording, to remove its own start-up cost
+        :param profiledBatches: Batches recorded
+        :param traceMemory: If True, Python allocations are traced with tracemalloc between boundaries (slows Python code down)
+        :param topCount: Number of operators and of allocation sites in the summary
+        """
+        self.enabled = outputPath != ""
+        self.stageName = stageName
+        self.stagePath = os.path.join(outputPath, stageName)
+        self.skipBatches = skipBatches
+        self.warmupBatches = warmupBatches
+        self.profiledBatches = profiledBatches
+        self.traceMemory = traceMemory
+        self.topCount = topCount
+
+        self.hotspots = [] # Lines of the operator summary, filled when the recorded window ends
+        self.regionSummary = [] # Lines of the region summary (total CPU time of each region, children included)
+        self._regionNames = set()
+        self.memoryBoundaries = [] # Tuples (boundary name, RSS MB, peak RSS MB, traced MB, traced peak MB, top allocation growths)
+        self._profiler = None
+        self._lastSnapshot = None
+        self._startedTracemalloc = False
+
+        if self.enabled:
+            os.makedirs(self.stagePath, exist_ok=True)
+            if traceMemory and not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self._startedTracemalloc = True
+            self.boundary("start")
+
+
+    def start(self):
+        """
+        Start torch.profiler. Batches are counted from this call
+        """
+        if not self.enabled:
+            return
+        activities = [torch.profiler.ProfilerActivity.CPU]
+        if torch.cuda.is_available():
+            activities.append(torch.profiler.ProfilerActivity.CUDA)
+        self._profiler = torch.profiler.profile(activities=activities,
+                                                schedule=torch.profiler.schedule(wait=self.skipBatches, warmup=self.warmupBatches,
+                                                                                 active=self.profiledBatches, repeat=1),
+                                                on_trace_ready=self._traceReady, record_shapes=True, profile_memory=True)
+        self._profiler.start()
+
+
+    def step(self):
+        """
+        Signal the end of a batch
+        """
+        if self._profiler is not None:
+            self._profiler.step()
+
+
+    def region(self, name):
+        """
+        :param name: Name of the region in the trace and in the summary
+        :return: Context manager labelling its block in the trace
+        """
+        if self._profiler is None:
+            return _NULL_CONTEXT
+        self._regionNames.add(name)
+        return torch.profiler.record_function(name)
+
+
+    def boundary(self, name):
+        """
+        Record resident memory and Python allocations since the previous boundary
+        :param name: Name of the boundary (e.g. "vocabulary", "model", "train")
+        """
+        if not self.enabled:
+            return
+        rssMb, peakRssMb = residentMemoryMb()
+        tracedMb, tracedPeakMb = 0.0, 0.0
+        topGrowths = []
+        if tracemalloc.is_tracing():
+            tracedBytes, tracedPeakBytes = tracemalloc.get_traced_memory()
+            tracedMb, tracedPeakMb = tracedBytes / (1024 * 1024), tracedPeakBytes / (1024 * 1024)
+            snapshot = tracemalloc.take_snapshot().filter_traces(_TRACEMALLOC_FILTERS)
+            if self._lastSnapshot is not None:
+                statistics = snapshot.compare_to(self._lastSnapshot, "lineno")
+                topGrowths = [str(statistic) for statistic in statistics[:self.topCount] if statistic.size_diff > 0]
+            self._lastSnapshot = snapshot
+        self.memoryBoundaries.append((name, rssMb, peakRssMb, tracedMb, tracedPeakMb, topGrowths))
+
+
+    def _traceReady(self, profiler):
+        profiler.export_chrome_trace(os.path.join(self.stagePath, self.stageName + ".pt.trace.json"))
+
+        # Operators with the most CPU time spent in themselves (not in their children)
+        keyAverages = profiler.key_averages()
+        events = sorted((event for event in keyAverages if event.key not in self._regionNames), key=lambda event: event.self_cpu_time_total, reverse=True)
+        totalCpuTime = sum(event.self_cpu_time_total for event in events)
+        self.hotspots = []
+        for event in events[:self.topCount]:
+            self.hotspots.append(event.key + " : self CPU " + str(round(event.self_cpu_time_total / 1000, 3)) + " ms (" +
+                                 str(round(100 * event.self_cpu_time_total / max(totalCpuTime, 1), 1)) + " %) / calls " + str(event.count) +
+                                 " / self memory " + str(round(event.self_cpu_memory_usage / (1024 * 1024), 3)) + " MB")
+
+        # Regions (e.g. each position model) with the CPU time and memory of all their operators
+        self.regionSummary = []
+        for event in sorted((event for event in keyAverages if event.key in self._regionNames), key=lambda event: event.key):
+            self.regionSummary.append(event.key + " : CPU " + str(round(event.cpu_time_total / 1000, 3)) + " ms / calls " + str(event.count) +
+                                      " / memory " + str(round(event.cpu_memory_usage / (1024 * 1024), 3)) + " MB")
+
+        with open(os.path.join(self.stagePath, "operators.txt"), "w") as operatorsFile:
+            operatorsFile.write(keyAverages.table(sort_by="self_cpu_time_total", row_limit=-1))
+
+
+    def stopBatches(self):
+        """
+        Stop torch.profiler at the end of the batch loop. The trace is written even if the window was not complete
+        """
+        if self._profiler is not None:
+            self._profiler.stop()
+            self._profiler = None
+
+
+    def stop(self):
+        """
+        Stop the profiler if needed, record the last boundary, print and save the summary
+        """
+        if not self.enabled:
+            return
+        self.stopBatches()
+        self.boundary("end")
+        if self._startedTracemalloc:
+            tracemalloc.stop()
+            self._startedTracemalloc = False
+
+        summaryLines = ["===== Profile " + self.stageName + " : hotspots (" + str(self.profiledBatches) + " batches) ====="]
+        summaryLines += ["  - " + hotspot for hotspot in self.hotspots]
+        if len(self.regionSummary) > 0:
+            summaryLines.append("===== Profile " + self.stageName + " : regions =====")
+            summaryLines += ["  - " + regionLine for regionLine in self.regionSummary]
+        summaryLines.append("===== Profile " + self.stageName + " : memory =====")
+        for name, rssMb, peakRssMb, tracedMb, tracedPeakMb, topGrowths in self.memoryBoundaries:
+            summaryLines.append("  - " + name + " : RSS " + str(round(rssMb)) + " MB / peak RSS " + str(round(peakRssMb)) + " MB / Python " +
+                                str(round(tracedMb, 1)) + " MB / Python peak " + str(round(tracedPeakMb, 1)) + " MB")
+            summaryLines += ["      " + topGrowth for topGrowth in topGrowths]
+        summaryLines.append("Trace and details in " + self.stagePath)
+
+        with open(os.path.join(self.stagePath, "hotspots.txt"), "w") as summaryFile:
+            summaryFile.write("\n".join(summaryLines) + "\n")
+        for summaryLine in summaryLines:
+            print(summaryLine)
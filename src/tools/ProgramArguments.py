@@ -32,6 +32,7 @@ class ProgramArguments:
 
         # Optional argument for all programs
         parser.add_argument("cuda_device", help="Cuda device to use. 0 is default device.", nargs='?', default="0")
+        parser.add_argument("--profile", help="Directory of the profiling results. Profiling is disabled if not given", default="")
 
         args = parser.parse_args()
 
@@ -55,6 +56,7 @@ class ProgramArguments:
 
         # Optional argument for all programs
         self._cudaDevice = args.cuda_device
+        self._profilePath = args.profile
 
 
 
@@ -79,6 +81,9 @@ class ProgramArguments:
     def _getCudaDevice(self):
         return self._cudaDevice
 
+    def _getProfilePath(self):
+        return self._profilePath
+
     """ -------------------------------
                 Properties definition
             -------------------------------
@@ -87,4 +92,5 @@ class ProgramArguments:
     pathData = property(_getPathData)
     modelFile = property(_getModelFile)
     inputFile = property(_getInputFile)
-    cudaDevice = property(_getCudaDevice)
\ No newline at end of file
+    cudaDevice = property(_getCudaDevice)
+    profilePath = property(_getProfilePath)
\ No newline at end of file
@@ -0,0 +1,115 @@
+# -*- coding: utf8 -*-
+
+import os
+import pickle
+from collections import OrderedDict
+
+import numpy as np
+
+
+class ScoreCache:
+    """
+    Least recently used cache of the scores of encoded lines. Key = bytes of the encoded line ; value = numpy array of scores
+    In eval mode, the score of a line only depends on its encoded words and on the model. The cache is tied to a model fingerprint
+    and is emptied when the fingerprint changes
+    """
+
+    def __init__(self, maxEntries=1000000, fingerprint=None):
+        """
+        :param maxEntries: Maximum count of lines kept. Least recently used lines are removed first
+        :param fingerprint: str identifying the model producing the scores
+        """
+        self.maxEntries = maxEntries
+        self.fingerprint = fingerprint
+        self.entries = OrderedDict()
+
+        # Statistics
+        self.hitCount = 0
+        self.missCount = 0
+
+
+    def checkFingerprint(self, fingerprint):
+        """
+        Empty the cache if scores were calculated with another model
+        :param fingerprint: str identifying the model producing the scores
+        """
+        if fingerprint != self.fingerprint:
+            self.clear()
+            self.fingerprint = fingerprint
+
+
+    def clear(self):
+        self.entries.clear()
+
+
+    def lookup(self, keys):
+        """
+        :param keys: list(bytes): Keys of the lines
+        :return: list with the cached scores of each line, None for lines not in the cache
+        """
+        entries = self.entries
+        values = []
+        for key in keys:
+            value = entries.get(key)
+            if value is not None:
+                entries.move_to_end(key)
+                self.hitCount += 1
+            else:
+                self.missCount += 1
+            values.append(value)
+        return values
+
+
+    def store(self, keys, values):
+        """
+        :param keys: list(bytes): Keys of the lines
+        :param values: numpy array with the scores of each line in its first dimension
+        """
+        # Values are copied so that the cache doesn't keep the whole batch array alive
+        for key, value in zip(keys, values):
+            self.entries[key] = np.array(value)
+        while len(self.entries) > self.maxEntries:
+            self.entries.popitem(last=False)
+
+
+    def getHitRate(self):
+        """
+        :return: Ratio of lookups found in the cache since its creation
+        """
+        try:
+            return round(self.hitCount / (self.hitCount + self.missCount), 6)
+        except ZeroDivisionError:
+            return 0
+
+
+    def save(self, cachePath):
+        """
+        Save the cache content and its fingerprint on the disk
+        :param cachePath: Path of the cache file
+        """
+        keys = list(self.entries.keys())
+        values = np.stack(list(self.entries.values())) if len(keys) > 0 else np.empty(0, dtype=np.float32)
+        with open(cachePath, "wb") as cacheFile:
+            pickle.dump({"fingerprint": self.fingerprint, "keys": keys, "values": values}, cacheFile)
+
+
+    @staticmethod
+    def load(cachePath, fingerprint, maxEntries=1000000):
+        """
+        Load a cache saved on the disk. An empty cache is returned if the file doesn't exist or was saved for another model
+        :param cachePath: Path of the cache file
+        :param fingerprint: str identifying the model producing the scores
+        :param maxEntries: Maximum count of lines kept
+        :return: ScoreCache
+        """
+        scoreCache = ScoreCache(maxEntries, fingerprint)
+        if os.path.isfile(cachePath):
+            with open(cachePath, "rb") as cacheFile:
+                savedCache = pickle.load(cacheFile)
+            if savedCache["fingerprint"] == fingerprint:
+                scoreCache.store(savedCache["keys"], savedCache["values"])
+        return scoreCache
+
+
+    def __len__(self):
+        return len(self.entries)
@@ -1,12 +1,13 @@
 # -*- coding: utf8 -*-
 import contextlib
 import gzip
+import itertools
 import logging
 import os
 import random
 
 
-def files_iterator(path, shuffle=False, type_filter="", recursive=False):
+def files_iterator(path, shuffle=False, type_filter="", recursive=False, rng=None):
     """
     Iterate files found in the path.
     If the path is a file return only this one, if the path is a directory iterate files inside (and in its sub-folders
@@ -17,6 +18,7 @@ def files_iterator(path, shuffle=False, type_filter="", recursive=False):
     :param type_filter: str : The type of file to iterate. Silently ignore file which doesn't match with the type
     filter. Empty filter means no type filter
     :param recursive: If true explore sub-folder recursively, otherwise only explore the current path
+    :param rng: random.Random : Random generator used to shuffle files. If None, the random module is used
     :return: Generator[str] : A generator of file path
     """
     if not os.path.exists(path):
@@ -36,12 +38,15 @@ def files_iterator(path, shuffle=False, type_filter="", recursive=False):
     elif os.path.isdir(path):
         listDir = os.listdir(path)
         if shuffle:
-            random.shuffle(listDir)
+            if rng is None:
+                random.shuffle(listDir)
+            else:
+                rng.shuffle(listDir)
         for item in listDir:
             item_path = os.path.join(path, item)
             if os.path.isdir(item_path) and recursive:
                 # Replace with "yield from" with python 3
-                for sub_files in files_iterator(item_path, shuffle, type_filter, recursive):
+                for sub_files in files_iterator(item_path, shuffle, type_filter, recursive, rng):
                     yield sub_files
             elif os.path.isfile(item_path):
                 # No file type return any file
@@ -112,3 +117,107 @@ def lines_iterator_directory(path, shuffle=False, file_type="auto", type_filter=
     for file_path in files_iterator(path, shuffle, type_filter, recursive):
         for line in lines_iterator_file(file_path, file_type, default_file_type):
             yield line
+
+
+def lines_iterator_interleave(paths, interleave_count, file_type="auto", default_file_type="txt"):
+    """
+    Iterate lines of several files, reading interleave_count files at the same time.
+    One line of each open file is returned in turn. When a file is over, the next file of the list is opened.
+
+    :param paths: list[str] : The paths of the files
+    :param interleave_count: int : Count of files read at the same time
+    :param file_type: str : The file type, "txt" and "gz" are currently supported. "auto" guess the file type from the
+    file extension
+    :param default_file_type: str : The default file type if auto fail to guess it
+    :return: Generator[str] : A generator of line
+    """
+    paths_iterator = iter(paths)
+    open_iterators = [lines_iterator_file(path, file_type, default_file_type)
+                      for path in itertools.islice(paths_iterator, max(interleave_count, 1))]
+
+    while len(open_iterators) > 0:
+        for line_iterator in list(open_iterators):
+            try:
+                yield next(line_iterator)
+            except StopIteration:
+                open_iterators.remove(line_iterator)
+                next_path = next(paths_iterator, None)
+                if next_path is not None:
+                    open_iterators.append(lines_iterator_file(next_path, file_type, default_file_type))
+
+
+def shuffle_buffer_iterator(iterator, buffer_size, rng=None):
+    """
+    Shuffle items of an iterator using a buffer of limited size.
+    The buffer is first filled, then each new item replaces a random item of the buffer which is returned.
+    Items can only move by about buffer_size positions, so the buffer must be large compared to the correlation length of the input.
+
+    :param iterator: The iterator to shuffle
+    :param buffer_size: int : Maximum count of items kept in memory
+    :param rng: random.Random : Random generator. If None, the random module is used
+    :return: Generator of the shuffled items
+    """
+    if rng is None:
+        rng = random
+
+    buffer = []
+    for item in iterator:
+        if len(buffer) < buffer_size:
+            buffer.append(item)
+        else:
+            idx = rng.randrange(buffer_size)
+            yield buffer[idx]
+            buffer[idx] = item
+
+    rng.shuffle(buffer)
+    for item in buffer:
+        yield item
+
+
+def file_byte_ranges(path, range_size):
+    """
+    Split a file in byte ranges of about range_size bytes. Compressed files are not split.
+
+    :param path: str : The path to file location
+    :param range_size: int : Size of a range in bytes. If <= 0, the file is not split
+    :return: list[tuple(str, int, int)] : List of (path, start, end). end is None for the last range
+    """
+    file_size = os.path.getsize(path)
+    if range_size <= 0 or file_size <= range_size or os.path.splitext(path)[1][1:] == "gz":
+        return [(path, 0, None)]
+
+    ranges = []
+    for start in range(0, file_size, range_size):
+        end = start + range_size
+        ranges.append((path, start, end if end < file_size else None))
+    return ranges
+
+
+def lines_iterator_file_range(path, start=0, end=None, file_type="auto", default_file_type="txt"):
+    """
+    Iterate lines of a byte range of a text file. A line belongs to the range containing its first byte,
+    so consecutive ranges return each line of the file exactly once.
+
+    :param path: str : The path to file location
+    :param start: int : First byte of the range
+    :param end: int : Byte after the range. None means end of file
+    :param file_type: str : The file type. Only a whole compressed file can be read (start = 0 and end = None)
+    :param default_file_type: str : The default file type if auto fail to guess it
+    :return: Generator[str] : A generator of line
+    """
+    if start == 0 and end is None:
+        for line in lines_iterator_file(path, file_type, default_file_type):
+            yield line
+        return
+
+    logging.debug("Open file range: " + path + " [" + str(start) + ", " + str(end) + "[")
+    with open(path, 'rb') as f:
+        if start > 0:
+            # Skip the end of the line starting in the previous range
+            f.seek(start - 1)
+            f.readline()
+        while end is None or f.tell() < end:
+            line = f.readline()
+            if not line:
+                break
+            yield line.decode().replace("\r\n", "\n")
@@ -5,6 +5,9 @@ from src.tools.line.LineComponent import LineComponent
 
 class LANLLine(LineComponent):
 
+    # Names of the words of the preprocessed line, in the order of the positions
+    WORD_NAMES = ("sourceUser", "destUser", "sourceComputer", "destComputer", "authType", "logonType", "authOrientation", "authState")
+
     def __init__(self, inputStrLine, lineLength):
 
         # Words definitions in a LANL log line
@@ -64,4 +67,9 @@ class LANLLine(LineComponent):
         # Ensure that a line is not empty
         if len(lineToTest) == 0:
             self.keepLine = False
-            return
\ No newline at end of file
+            return
+
+        # Ensure that the line has all the words extracted
+        if len(lineToTest) < 9:
+            self.keepLine = False
+            return
@@ -1,8 +1,6 @@
 # -*- coding: utf8 -*-
 import re
 
-import torch
-
 
 class LineComponent:
     """
@@ -80,6 +78,8 @@ class LineComponent:
         :param device: Device where the tensor has to be stored
         :return: Tensor representing the encoded line
         """
+        # Torch is imported here : vocabulary tools use lines without it
+        import torch
         return torch.tensor(self.getEncodedLine(voc), dtype=dtype, device=device)
 
     def __eq__(self, lineToCompare):
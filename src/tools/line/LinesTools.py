@@ -1,6 +1,8 @@
 # -*- coding: utf8 -*-
 
 import os
+import random
+from collections import Counter
 
 import torch
 
@@ -31,12 +33,19 @@ class LinesTools:
         self.previousTs = None
         self.previousLine = None
 
+        # Deduplication statistics and global deduplication results (key = path)
+        self.dedupLinesCount = 0 # Lines represented by the returned unique lines
+        self.dedupUniqueCount = 0 # Unique lines returned
+        self.dedupGlobalCache = {}
 
-    def loadBatch(self, path, oneBatchOneFile, batchSize=0, linesCountInBatchUnit=0, slidingWindowRenewRate=0, useAllLinesInFile=True):
+
+    def loadBatch(self, path, oneBatchOneFile, batchSize=0, linesCountInBatchUnit=0, slidingWindowRenewRate=0, useAllLinesInFile=True,
+                  shuffleBufferSize=0, shuffleSeed=None, interleaveFiles=1):
         """
         Load a batch of lines from a list of files
         :param corpus: Name of the corpus from which the files originate
-        :param path: Path of the directory containing the files to load or the path of the single file to load in one single batch
+        :param path: Path of the directory containing the files to load or the path of the single file to load in one single batch,
+                     or a list of byte ranges (file, startByte, endByte) read in this order (see fa.file_byte_ranges)
         :param oneBatchOneFile: If True, each file corresponds to one batch (all lines of the file go to a single batch) and return only one batch each time (simplfy management of different line length)
                                 All other parameters are unused because batch parameters depend only of the file
                                 If False, using the other parameters to load the batch
@@ -46,25 +55,28 @@ class LinesTools:
                                       If = 0, no lines will be the same between two batch unit
         :param useAllLinesInFile: If True, last lines of a file will be returned separately in one batch with batch size = 1 if file length is not a multiple of linesCountInBatchUnit
                                   If False, all batch units will have the same length and last lines of the file will be skipped if not enough remaining (=lines from the last multiple of linesCountInBatchUnit)
+        :param shuffleBufferSize: If > 0, lines are shuffled with a buffer of this size (see _lineStreams)
+        :param shuffleSeed: Seed of the random generator used to shuffle files and lines. If None, the generator is not seeded
+        :param interleaveFiles: If > 1, count of files read at the same time (see _lineStreams)
         :return: A batch composed of a list of tuple (lineList, file)
         """
 
         # Set a flag to decide if duplicates have to be removed or not
         removeDuplicates = False
 
-        corpusIterator = fa.files_iterator(path, True)
+        corpusIterator = self._lineStreams(path, shuffleBufferSize, shuffleSeed, interleaveFiles)
         outputBatch = [] # List of tuple (lineList, file) where file is the line source file
         endDirectoryIterator = False
         while not endDirectoryIterator:
-            if os.path.isfile(path):
+            if isinstance(path, str) and os.path.isfile(path):
                 # We just process a single file
                 # First time we process the file, just use it and remember this first pass
-                file = path
+                file, fileIterator = next(corpusIterator)
                 endDirectoryIterator = True
             else:
                 # Iteration over directory containing all the files
                 try:
-                    file = next(corpusIterator)
+                    file, fileIterator = next(corpusIterator)
                 except StopIteration:
                     if len(outputBatch) > 0:
                         # No more file in the directory.
@@ -76,7 +88,6 @@ class LinesTools:
             # New file = reset all variables because we don't want to mix lines of different files
             lineList = LineList(removeDuplicates)
             self.previousTs = None
-            fileIterator = fa.lines_iterator_file(file)
             while True:
                 # Iteration over the current file
                 try:
@@ -125,6 +136,166 @@ class LinesTools:
                             outputBatch = []
 
 
+    def loadWindowBatch(self, path, batchSize, linesCountInBatchUnit, slidingWindowRenewRate, dtype, device, useAllLinesInFile=False, removeDuplicates=False,
+                        shuffleBufferSize=0, shuffleSeed=None, interleaveFiles=1):
+        """
+        Load batches of encoded batch units directly as tensors. Same batch units as loadBatch (oneBatchOneFile = False), without creating a LineList for each unit.
+        Each line is encoded only once in a buffer and batch units are a strided view over this buffer, so consecutive units share their common lines.
+        :param path: Path of the directory containing the files to load or the path of a single file
+        :param batchSize: Count of batch units in the returned batch
+        :param linesCountInBatchUnit: Lines count in each unit of the batch
+        :param slidingWindowRenewRate: If > 0, count of new lines between two batch units. If = 0, no lines will be the same between two batch units
+        :param useAllLinesInFile: If True, last lines of a file not filling a whole batch unit are returned separately in one batch with batch size = 1
+        :param removeDuplicates: If True, a line equal to the previous line of the file is skipped (same as LineList.addLine)
+        :param shuffleBufferSize: If > 0, lines are shuffled with a buffer of this size (see _lineStreams)
+        :param shuffleSeed: Seed of the random generator used to shuffle files and lines. If None, the generator is not seeded
+        :param interleaveFiles: If > 1, count of files read at the same time (see _lineStreams)
+        :return: Tensor with shape (batchSize, linesCountInBatchUnit, lineLength). Last batch of the path can be smaller
+        """
+        # Count of lines between the first lines of two consecutive units
+        if slidingWindowRenewRate > 0:
+            stride = min(slidingWindowRenewRate, linesCountInBatchUnit)
+        else:
+            stride = linesCountInBatchUnit
+        # Lines of the last returned unit kept in the next unit
+        keptLinesCount = linesCountInBatchUnit - stride
+
+        pendingUnitsList = [] # Units of previous files not yet returned (batches can contain units from different files)
+        pendingUnitsCount = 0
+        for file, fileIterator in self._lineStreams(path, shuffleBufferSize, shuffleSeed, interleaveFiles):
+            # New file = reset the buffer because we don't want to mix lines of different files
+            unitsNeeded = batchSize - pendingUnitsCount
+            buffer = torch.empty((linesCountInBatchUnit + (unitsNeeded - 1) * stride, self.lineLength), dtype=dtype)
+            bufferCount = 0 # Lines written in the buffer
+            bufferKeptCount = 0 # Lines at the beginning of the buffer coming from the last returned unit
+            encodedLines = [] # Encoded lines not yet written in the buffer
+            previousLine = None
+
+            for strLine in fileIterator:
+                line = LANLLine(strLine, self.lineLength)
+
+                # Same filter as LineList.addLine
+                if not line.keepLine:
+                    continue
+                if removeDuplicates and previousLine is not None and line == previousLine:
+                    continue
+                previousLine = line
+
+                encodedLines.append(line.getEncodedLine(self.voc))
+                if bufferCount + len(encodedLines) == buffer.size(0):
+                    buffer[bufferCount:] = torch.tensor(encodedLines, dtype=dtype)
+                    encodedLines = []
+
+                    # Buffer is full, units are a view over the buffer
+                    units = buffer.unfold(0, linesCountInBatchUnit, stride).transpose(1, 2)
+                    if pendingUnitsCount > 0:
+                        units = torch.cat(pendingUnitsList + [units], 0)
+                        pendingUnitsList = []
+                        pendingUnitsCount = 0
+                    yield units.to(device)
+
+                    # New buffer starting with the lines shared with the next unit
+                    unitsNeeded = batchSize
+                    newBuffer = torch.empty((linesCountInBatchUnit + (unitsNeeded - 1) * stride, self.lineLength), dtype=dtype)
+                    newBuffer[:keptLinesCount] = buffer[buffer.size(0) - keptLinesCount:]
+                    buffer = newBuffer
+                    bufferCount = keptLinesCount
+                    bufferKeptCount = keptLinesCount
+
+            # End of file. Write remaining lines and keep the complete units for the next batch
+            if len(encodedLines) > 0:
+                buffer[bufferCount:bufferCount + len(encodedLines)] = torch.tensor(encodedLines, dtype=dtype)
+                bufferCount += len(encodedLines)
+
+            unitsStart = 0
+            if bufferCount >= linesCountInBatchUnit:
+                units = buffer[:bufferCount].unfold(0, linesCountInBatchUnit, stride).transpose(1, 2)
+                pendingUnitsList.append(units)
+                pendingUnitsCount += units.size(0)
+                unitsStart = units.size(0) * stride
+                bufferKeptCount = keptLinesCount
+
+            # Last lines not filling a unit are returned only if at least one of them is not in the last unit
+            if useAllLinesInFile and bufferCount - unitsStart > bufferKeptCount and batchSize > 0:
+                yield buffer[unitsStart:bufferCount].unsqueeze(0).to(device)
+
+        if pendingUnitsCount > 0:
+            yield torch.cat(pendingUnitsList, 0).to(device)
+
+
+    def _lineStreams(self, path, shuffleBufferSize=0, shuffleSeed=None, interleaveFiles=1):
+        """
+        Open the line streams of a path. Files are shuffled and read one after the other.
+        If lines are shuffled or files interleaved, all lines of the path are mixed in one single stream :
+          - interleaveFiles files are read at the same time, taking one line of each file in turn
+          - lines are then shuffled with a buffer of shuffleBufferSize lines, so memory usage stays bounded
+        :param path: Path of the directory containing the files or the path of a single file,
+                     or a list of byte ranges (file, startByte, endByte) read in this order. Lines are not shuffled nor interleaved for byte ranges
+        :param shuffleBufferSize: If > 0, size of the buffer used to shuffle lines
+        :param shuffleSeed: Seed of the random generator used to shuffle files and lines. If None, the generator is not seeded
+        :param interleaveFiles: Count of files read at the same time
+        :return: Generator of tuples (file, line iterator). The file is the path itself when lines are mixed in one stream
+        """
+        rng = random.Random(shuffleSeed) if shuffleSeed is not None else None
+
+        if not isinstance(path, str):
+            for file, startByte, endByte in path:
+                yield file, fa.lines_iterator_file_range(file, startByte, endByte)
+        elif shuffleBufferSize <= 0 and interleaveFiles <= 1:
+            for file in fa.files_iterator(path, True, rng=rng):
+                yield file, fa.lines_iterator_file(file)
+        else:
+            lineIterator = fa.lines_iterator_interleave(list(fa.files_iterator(path, True, rng=rng)), interleaveFiles)
+            if shuffleBufferSize > 0:
+                lineIterator = fa.shuffle_buffer_iterator(lineIterator, shuffleBufferSize, rng)
+            yield path, lineIterator
+
+
+    def loadDedupBatch(self, path, batchSize, windowSize, dtype, device):
+        """
+        Load batches of unique encoded lines with their occurrence count. Batch units are single lines.
+        Identical encoded lines are collapsed inside a window of lines, or in the whole path
+        Unique lines of a window are returned in random order
+        :param path: Path of the directory containing the files to load or the path of a single file
+        :param batchSize: Maximum count of unique lines in the returned batch
+        :param windowSize: Count of lines read before deduplication. If 0, duplicates are removed in the whole path (result is kept in memory for next calls)
+        :return: Tuples (tensor of unique encoded lines with shape (n, lineLength), tensor of occurrence counts with shape (n))
+        """
+        if windowSize == 0:
+            if path not in self.dedupGlobalCache:
+                lineCounter = Counter()
+                for batch in self.loadBatch(path, False, 10000, 1, 0, False):
+                    for lineList, fileName in batch:
+                        for line in lineList:
+                            lineCounter[tuple(line.getEncodedLine(self.voc))] += 1
+                uniqueTensor = torch.tensor(list(lineCounter.keys()), dtype=dtype).view(-1, self.lineLength)
+                countTensor = torch.tensor(list(lineCounter.values()), dtype=torch.long)
+                self.dedupGlobalCache[path] = (uniqueTensor, countTensor)
+            windowIterator = iter([self.dedupGlobalCache[path]])
+        else:
+            windowIterator = (torch.unique(self.convertBatchIntoTensor(batch, dtype, "cpu").view(-1, self.lineLength), dim=0, return_counts=True)
+                              for batch in self.loadBatch(path, False, windowSize, 1, 0, False))
+
+        for uniqueTensor, countTensor in windowIterator:
+            permutation = torch.randperm(uniqueTensor.size(0))
+            for start in range(0, uniqueTensor.size(0), batchSize):
+                batchIdx = permutation[start:start + batchSize]
+                batchCountTensor = countTensor[batchIdx]
+                self.dedupUniqueCount += batchIdx.numel()
+                self.dedupLinesCount += int(batchCountTensor.sum())
+                yield uniqueTensor[batchIdx].to(device), batchCountTensor.to(device)
+
+
+    def getDedupCompressionRatio(self):
+        """
+        :return: Ratio between count of lines read and count of unique lines returned by loadDedupBatch
+        """
+        try:
+            return round(self.dedupLinesCount / self.dedupUniqueCount, 6)
+        except ZeroDivisionError:
+            return 0
+
+
     def convertBatchIntoTensor(self, batch, dtype, device):
         """
         Convert a batch containing multiple tuple (LineList, file) into a single tensor of the lines
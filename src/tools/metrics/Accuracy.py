@@ -47,10 +47,17 @@ class Accuracy:
         self.totalComparisonCount += self.comparisonCount
         self.totalOkComparison += self.okComparison
 
-    def calculateAccuracyTensors(self, targetTensor, predictedTensor):
-
-        self.comparisonCount = targetTensor.numel()
-        self.okComparison = torch.eq(targetTensor, predictedTensor).nonzero().size(0)
+    def calculateAccuracyTensors(self, targetTensor, predictedTensor, weightTensor=None):
+        """
+        :param weightTensor: Optional weight of each comparison (e.g. occurrence count of deduplicated lines). If None, each comparison counts for 1
+        """
+
+        if weightTensor is None:
+            self.comparisonCount = targetTensor.numel()
+            self.okComparison = int(torch.eq(targetTensor, predictedTensor).sum())
+        else:
+            self.comparisonCount = weightTensor.sum().item()
+            self.okComparison = weightTensor[torch.eq(targetTensor, predictedTensor)].sum().item()
 
         self.totalComparisonCount += self.comparisonCount
         self.totalOkComparison += self.okComparison
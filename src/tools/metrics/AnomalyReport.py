@@ -0,0 +1,154 @@
+# -*- coding: utf8 -*-
+
+import heapq
+from collections import OrderedDict
+
+import numpy as np
+
+
+class TopKAnomalies:
+    """
+    Keeps the k lines with the highest anomaly score seen so far in a bounded min-heap
+    Each kept line has its raw text, the file it comes from and the score of each word position
+    """
+
+    def __init__(self, k=1000):
+        """
+        :param k: Count of lines kept
+        """
+        self.k = k
+        self.heap = [] # Min-heap of (score, sequence, rawLine, fileName, positionScores)
+        self.linesCount = 0 # Count of lines seen. Also used to order lines with the same score
+
+
+    def update(self, scores, lines, positionScores, fileNames=None):
+        """
+        :param scores: numpy array with the score of each line
+        :param lines: list(LineComponent): Lines in the same order as scores
+        :param positionScores: numpy array (lines count, positions count) with the score of each word position of each line
+        :param fileNames: list(str): File of each line. If None, file is not reported
+        """
+        scores = np.asarray(scores).reshape(-1)
+
+        # Only lines better than the smallest kept score can enter a full heap
+        if len(self.heap) >= self.k:
+            candidateIdx = np.nonzero(scores > self.heap[0][0])[0]
+        else:
+            candidateIdx = np.arange(scores.shape[0])
+        if candidateIdx.shape[0] > self.k:
+            candidateIdx = candidateIdx[np.argpartition(scores[candidateIdx], -self.k)[-self.k:]]
+
+        for idx in candidateIdx.tolist():
+            entry = (float(scores[idx]), self.linesCount + idx, lines[idx].inputRawStrLine.rstrip("\n"),
+                     str(fileNames[idx]) if fileNames is not None else "", positionScores[idx].tolist())
+            if len(self.heap) < self.k:
+                heapq.heappush(self.heap, entry)
+            else:
+                heapq.heappushpop(self.heap, entry)
+
+        self.linesCount += scores.shape[0]
+
+
+    def sortedAnomalies(self):
+        """
+        :return: list of (score, rawLine, fileName, positionScores) by decreasing score
+        """
+        return [(score, rawLine, fileName, positionScores) for score, sequence, rawLine, fileName, positionScores in sorted(self.heap, reverse=True)]
+
+
+    def writeReport(self, outputFile):
+        """
+        :param outputFile: Opened file where the report is written
+        """
+        outputFile.write("Top " + str(len(self.heap)) + " anomalies among " + str(self.linesCount) + " lines\n")
+        outputFile.write("score\tline\tfile\tpositionScores\n")
+        for score, rawLine, fileName, positionScores in self.sortedAnomalies():
+            outputFile.write(str(round(score, 6)) + "\t" + rawLine + "\t" + fileName + "\t"
+                             + ",".join(str(round(positionScore, 6)) for positionScore in positionScores) + "\n")
+
+
+    def __len__(self):
+        return len(self.heap)
+
+
+class EntityRollup:
+    """
+    Running aggregates (count, sum and max of the line score) per entity of the lines (e.g. source user and source computer)
+    The count of entities kept is bounded. When full, the least recently seen entity is forgotten
+    """
+
+    def __init__(self, entityAttributes=("sourceUser", "sourceComputer"), maxEntities=1000000):
+        """
+        :param entityAttributes: Attributes of the lines defining an entity. Each attribute is aggregated separately
+        :param maxEntities: Maximum count of entities kept, all attributes included
+        """
+        self.entityAttributes = entityAttributes
+        self.maxEntities = maxEntities
+
+        self.aggregates = OrderedDict() # Key = (attribute, value) ; value = [count, sum, max]
+        self.evictedCount = 0
+
+
+    def update(self, scores, lines):
+        """
+        :param scores: numpy array with the score of each line
+        :param lines: list(LineComponent): Lines in the same order as scores
+        """
+        aggregates = self.aggregates
+        for score, line in zip(np.asarray(scores).reshape(-1).tolist(), lines):
+            for attribute in self.entityAttributes:
+                key = (attribute, getattr(line, attribute))
+                aggregate = aggregates.get(key)
+                if aggregate is None:
+                    aggregates[key] = [1, score, score]
+                else:
+                    aggregates.move_to_end(key)
+                    aggregate[0] += 1
+                    aggregate[1] += score
+                    if score > aggregate[2]:
+                        aggregate[2] = score
+
+        while len(aggregates) > self.maxEntities:
+            aggregates.popitem(last=False)
+            self.evictedCount += 1
+
+
+    def topEntities(self, attribute, count):
+        """
+        :param attribute: Attribute of the entities
+        :param count: Count of entities returned
+        :return: list of (value, count, sum, max) of the entities with the highest max score
+        """
+        entities = [(key[1], aggregate[0], aggregate[1], aggregate[2]) for key, aggregate in self.aggregates.items() if key[0] == attribute]
+        return heapq.nlargest(count, entities, key=lambda entity: entity[3])
+
+
+    def writeReport(self, outputFile, count=100):
+        """
+        :param outputFile: Opened file where the report is written
+        :param count: Count of entities written for each attribute
+        """
+        for attribute in self.entityAttributes:
+            outputFile.write("Top " + str(count) + " " + attribute + " by max score (" + str(self.evictedCount) + " entities evicted)\n")
+            outputFile.write(attribute + "\tcount\tsum\tmean\tmax\n")
+            for value, entityCount, entitySum, entityMax in self.topEntities(attribute, count):
+                outputFile.write(value + "\t" + str(entityCount) + "\t" + str(round(entitySum, 6)) + "\t"
+                                 + str(round(entitySum / entityCount, 6)) + "\t" + str(round(entityMax, 6)) + "\n")
+
+
+    def __len__(self):
+        return len(self.aggregates)
+
+
+def writeAnomalyReport(reportPath, topAnomalies, entityRollup, entityCount=100):
+    """
+    Write (or replace) the report with the top anomalies and the entity aggregates
+    :param reportPath: Path of the report file
+    :param topAnomalies: TopKAnomalies
+    :param entityRollup: EntityRollup
+    :param entityCount: Count of entities written for each attribute
+    """
+    with open(reportPath, "w") as outputFile:
+        topAnomalies.writeReport(outputFile)
+        outputFile.write("\n")
+        entityRollup.writeReport(outputFile, entityCount)
@@ -43,6 +43,23 @@ class Fmeasure():
         self.calculateMetricsFromData()
 
 
+    def metricsFromCounts(self, truePositive, falsePositive, falseNegative, trueNegative):
+        """
+        Calculate all relevant metrics from model prediction data already counted
+        :param truePositive: Count of true positive
+        :param falsePositive: Count of false positive
+        :param falseNegative: Count of false negative
+        :param trueNegative: Count of true negative
+        """
+        self.truePositive = int(truePositive)
+        self.falsePositive = int(falsePositive)
+        self.falseNegative = int(falseNegative)
+        self.trueNegative = int(trueNegative)
+
+        # Calculate all metrics
+        self.calculateMetricsFromData()
+
+
     def retrievePredictionData(self, prediction, gold, positiveValue):
         """
         Retrieve all model prediction data used to calculate metrics
@@ -62,17 +79,13 @@ class Fmeasure():
         if predictionTensor.numel() != goldTensor.numel():
             raise ValueError("Prediction and gold tensor have different size. Pred : ", predictionTensor.numel(), " / Gold : ", goldTensor.numel())
 
-        goldPositiveMask = torch.eq(goldTensor, positiveValue)
-        predictionPositiveMask = torch.eq(predictionTensor, positiveValue)
-
-        # True positive calculation
-        self.truePositive = (torch.masked_select(goldTensor, goldPositiveMask) == torch.masked_select(predictionTensor, goldPositiveMask)).nonzero().numel()
-
-        # False negative calculation
-        self.falseNegative = goldPositiveMask.nonzero().size(0) - self.truePositive
+        goldPositiveMask = torch.eq(goldTensor, positiveValue).reshape(-1)
+        predictionPositiveMask = torch.eq(predictionTensor, positiveValue).reshape(-1)
 
-        # False positive calculation
-        self.falsePositive = (torch.masked_select(goldTensor, predictionPositiveMask) != torch.masked_select(predictionTensor, predictionPositiveMask)).nonzero().numel()
+        # Counts are calculated on the device and copied to the host together (one synchronization)
+        truePositiveTensor = torch.logical_and(goldPositiveMask, predictionPositiveMask).sum()
+        counts = torch.stack((truePositiveTensor, goldPositiveMask.sum() - truePositiveTensor, predictionPositiveMask.sum() - truePositiveTensor)).tolist()
+        self.truePositive, self.falseNegative, self.falsePositive = counts
 
         #  True negative calculation
         self.trueNegative = predictionTensor.numel() - (self.truePositive + self.falseNegative + self.falsePositive)
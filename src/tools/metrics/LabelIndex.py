@@ -0,0 +1,172 @@
+# -*- coding: utf8 -*-
+
+import re
+from collections import OrderedDict
+
+import numpy as np
+
+
+class LabelIndex:
+    """
+    Ground truth events (e.g. LANL redteam file) indexed in a hashed set for constant time lookup
+    Each event is a line "ts,sourceUser,sourceComputer,destComputer" and is matched with LANL lines having the same 4 words
+    """
+
+    def __init__(self, labelFilePath=None):
+        """
+        :param labelFilePath: Path of the file with one event per line. If None, the index is empty
+        """
+        self.labelSet = set()
+        if labelFilePath is not None:
+            with open(labelFilePath, "r") as labelFile:
+                for labelLine in labelFile:
+                    key = self.parseLabelLine(labelLine)
+                    if key is not None:
+                        self.labelSet.add(key)
+
+
+    @staticmethod
+    def parseLabelLine(labelLine):
+        """
+        :param labelLine: str: Line of the label file
+        :return: Key (ts, sourceUser, sourceComputer, destComputer) of the event. None for an empty line
+        """
+        normalizedLine = re.sub('\n', '', labelLine).lower()
+        if normalizedLine == "":
+            return None
+        return tuple(normalizedLine.split(","))
+
+
+    @staticmethod
+    def lineKey(line):
+        """
+        :param line: LANLLine: The line to label
+        :return: Key (ts, sourceUser, sourceComputer, destComputer) of the line
+        """
+        return line.ts, line.sourceUser, line.sourceComputer, line.destComputer
+
+
+    def isLabelled(self, line):
+        """
+        :param line: LANLLine: The line to label
+        :return: True if the line is a ground truth event
+        """
+        return self.lineKey(line) in self.labelSet
+
+
+    def labelLines(self, lines):
+        """
+        :param lines: list(LANLLine): Lines to label
+        :return: numpy array (int8) with 1 for lines that are ground truth events, 0 for others
+        """
+        labelSet = self.labelSet
+        lineKey = self.lineKey
+        return np.fromiter((lineKey(line) in labelSet for line in lines), dtype=np.int8, count=len(lines))
+
+
+    def labelBatch(self, batch):
+        """
+        :param batch: list((LineList, file)): Batch returned by LinesTools.loadBatch
+        :return: numpy array (int8) with the label of each line of the batch, in the same order as rows of LinesTools.convertBatchIntoTensor
+        """
+        return self.labelLines([line for lineList, fileName in batch for line in lineList])
+
+
+    def __len__(self):
+        return len(self.labelSet)
+
+    def __contains__(self, line):
+        return self.isLabelled(line)
+
+
+class SortedLabelIndex(LabelIndex):
+    """
+    Ground truth events read from a file sorted by timestamp and joined with lines with a sorted merge.
+    Events are stored in time buckets and only buckets around the timestamp of the current lines are kept in memory,
+    so label files larger than memory can be used.
+    Lines must come in increasing timestamp order. If the timestamp goes back (e.g. a new file is read), label file is read again from its start
+    """
+
+    def __init__(self, labelFilePath, bucketSize=3600, keptBuckets=1):
+        """
+        :param labelFilePath: Path of the file with one event per line, sorted by timestamp
+        :param bucketSize: Duration (in timestamp unit) of a time bucket
+        :param keptBuckets: Count of buckets before the current one kept in memory
+        """
+        super(SortedLabelIndex, self).__init__()
+
+        self.labelFilePath = labelFilePath
+        self.bucketSize = bucketSize
+        self.keptBuckets = keptBuckets
+
+        self.buckets = OrderedDict() # Key = bucket number ; value = set of event keys
+        self._labelFile = None
+        self._nextKey = None # Next event read in the file and not yet stored in a bucket
+        self._lastLoadedBucket = None # Every event until the end of this bucket is loaded
+        self.rewindCount = 0
+        self._rewind()
+
+
+    def _rewind(self):
+        """
+        Read the label file again from its start
+        """
+        if self._labelFile is not None:
+            self._labelFile.close()
+            self.rewindCount += 1
+        self._labelFile = open(self.labelFilePath, "r")
+        self.buckets.clear()
+        self._nextKey = None
+        self._lastLoadedBucket = None
+        self._readNextKey()
+
+
+    def _readNextKey(self):
+        previousTs = int(self._nextKey[0]) if self._nextKey is not None else None
+        self._nextKey = None
+        for labelLine in self._labelFile:
+            key = self.parseLabelLine(labelLine)
+            if key is not None:
+                if previousTs is not None and int(key[0]) < previousTs:
+                    raise ValueError("Label file must be sorted by timestamp : " + self.labelFilePath)
+                self._nextKey = key
+                return
+
+
+    def advanceTo(self, ts):
+        """
+        Load events until the end of the bucket of ts and remove buckets too old
+        :param ts: int: Timestamp of the current line
+        """
+        bucket = ts // self.bucketSize
+
+        # Timestamp goes back before the buckets kept in memory
+        if self._lastLoadedBucket is not None and bucket < self._lastLoadedBucket - self.keptBuckets:
+            self._rewind()
+
+        while self._nextKey is not None and int(self._nextKey[0]) // self.bucketSize <= bucket:
+            keyBucket = int(self._nextKey[0]) // self.bucketSize
+            if keyBucket >= bucket - self.keptBuckets:
+                self.buckets.setdefault(keyBucket, set()).add(self._nextKey)
+            self._readNextKey()
+        if self._lastLoadedBucket is None or bucket > self._lastLoadedBucket:
+            self._lastLoadedBucket = bucket
+
+        while len(self.buckets) > 0 and next(iter(self.buckets)) < self._lastLoadedBucket - self.keptBuckets:
+            self.buckets.popitem(last=False)
+
+
+    def isLabelled(self, line):
+        ts = int(line.ts)
+        if self._lastLoadedBucket is None or ts // self.bucketSize != self._lastLoadedBucket:
+            self.advanceTo(ts)
+        bucketSet = self.buckets.get(ts // self.bucketSize)
+        return bucketSet is not None and self.lineKey(line) in bucketSet
+
+
+    def labelLines(self, lines):
+        return np.fromiter((self.isLabelled(line) for line in lines), dtype=np.int8, count=len(lines))
+
+
+    def __len__(self):
+        return sum(len(bucketSet) for bucketSet in self.buckets.values())
@@ -0,0 +1,158 @@
+# -*- coding: utf8 -*-
+
+import torch
+
+from src.tools.metrics.Fmeasure import Fmeasure
+
+
+class AccuracyAccumulator:
+    """
+    Accuracy of all the positions of a line, counted in one tensor on the compute device.
+    Updates only launch operations on the device : counts are copied to the host once, when an accuracy is read.
+    positionList gives one object per position with the API of Accuracy (calculateAccuracyTensors, getAccuracy, getTotalAccuracy)
+    """
+
+    def __init__(self, positionCount, device=torch.device("cpu")):
+        # Rows : good comparisons and comparisons of the last update, good comparisons and comparisons since the last reset
+        self._counts = torch.zeros(4, positionCount, dtype=torch.float64, device=device)
+        self._hostCounts = None # Copy of the counts on the host, None if the counts changed since the last copy
+
+
+    def update(self, position, targetTensor, predictedTensor, weightTensor=None):
+        """
+        :param position: Index of the position
+        :param weightTensor: Optional weight of each comparison (e.g. occurrence count of deduplicated lines). If None, each comparison counts for 1
+        """
+        equalTensor = torch.eq(targetTensor, predictedTensor)
+        if weightTensor is None:
+            okCount = equalTensor.sum(dtype=torch.float64)
+            comparisonCount = equalTensor.numel()
+        else:
+            okCount = (weightTensor * equalTensor).sum(dtype=torch.float64)
+            comparisonCount = weightTensor.sum(dtype=torch.float64)
+        self._counts[0, position] = okCount
+        self._counts[1, position] = comparisonCount
+        self._counts[2, position] += okCount
+        self._counts[3, position] += comparisonCount
+        self._hostCounts = None
+
+
+    def reset(self):
+        self._counts.zero_()
+        self._hostCounts = None
+
+
+    def sync(self):
+        """
+        Copy the counts of all positions to the host (one synchronization)
+        """
+        if self._hostCounts is None:
+            self._hostCounts = self._counts.tolist()
+        return self._hostCounts
+
+
+    def getAccuracy(self, position):
+        """
+        :return: Accuracy of the last update of the position
+        """
+        counts = self.sync()
+        return round(counts[0][position] / counts[1][position], 6) if counts[1][position] > 0 else 0
+
+
+    def getTotalAccuracy(self, position):
+        """
+        :return: Accuracy of the position since the last reset
+        """
+        counts = self.sync()
+        return round(counts[2][position] / counts[3][position], 6) if counts[3][position] > 0 else 0
+
+
+    def positionList(self):
+        """
+        :return: List with one object per position, used as a list of Accuracy
+        """
+        return [_PositionAccuracy(self, position) for position in range(self._counts.size(1))]
+
+
+class _PositionAccuracy:
+
+    def __init__(self, accumulator, position):
+        self.accumulator = accumulator
+        self.position = position
+
+    def calculateAccuracyTensors(self, targetTensor, predictedTensor, weightTensor=None):
+        self.accumulator.update(self.position, targetTensor, predictedTensor, weightTensor)
+
+    def getAccuracy(self):
+        return self.accumulator.getAccuracy(self.position)
+
+    def getTotalAccuracy(self):
+        return self.accumulator.getTotalAccuracy(self.position)
+
+
+class FmeasureAccumulator:
+    """
+    True positive, false positive, false negative and total counts of a stream of predictions, counted in one tensor on the compute device.
+    Counts are copied to the host once, when the metrics are read
+    """
+
+    def __init__(self, positiveValue=1, device=torch.device("cpu")):
+        """
+        :param positiveValue: The value considered to be the positive value
+        """
+        self.positiveValue = positiveValue
+        self._counts = torch.zeros(4, dtype=torch.int64, device=device) # True positive, false positive, false negative, total
+
+
+    def update(self, predictionTensor, goldTensor):
+        """
+        :param predictionTensor: Predicted values (or bool tensor, True = positive value)
+        :param goldTensor: Target values (or bool tensor, True = positive value), same number of elements
+        """
+        if predictionTensor.numel() != goldTensor.numel():
+            raise ValueError("Prediction and gold tensor have different size. Pred : ", predictionTensor.numel(), " / Gold : ", goldTensor.numel())
+        predictionPositive = predictionTensor if predictionTensor.dtype == torch.bool else torch.eq(predictionTensor, self.positiveValue)
+        goldPositive = goldTensor if goldTensor.dtype == torch.bool else torch.eq(goldTensor, self.positiveValue)
+        predictionPositive = predictionPositive.reshape(-1)
+        goldPositive = goldPositive.reshape(-1)
+
+        truePositive = torch.logical_and(predictionPositive, goldPositive).sum()
+        self._counts[0] += truePositive
+        self._counts[1] += predictionPositive.sum() - truePositive
+        self._counts[2] += goldPositive.sum() - truePositive
+        self._counts[3] += predictionPositive.numel()
+
+
+    def reset(self):
+        self._counts.zero_()
+
+
+    def getCounts(self):
+        """
+        :return: True positive, false positive, false negative, true negative (one synchronization)
+        """
+        truePositive, falsePositive, falseNegative, totalCount = self._counts.tolist()
+        return truePositive, falsePositive, falseNegative, totalCount - truePositive - falsePositive - falseNegative
+
+
+    def getFmeasure(self):
+        """
+        :return: Fmeasure with the counts and the metrics (fmeasure, precision, recall, specificity)
+        """
+        fmeasure = Fmeasure("Tensor")
+        fmeasure.metricsFromCounts(*self.getCounts())
+        return fmeasure
+
+
+def scalarsToHost(tensorList):
+    """
+    Copy scalar tensors (e.g. the losses of the positions) to the host with one synchronization
+    :param tensorList: List of scalar tensors on the same device, or None
+    :return: List of floats, None where the tensor was None
+    """
+    values = [None] * len(tensorList)
+    indexes = [idx for idx, tensor in enumerate(tensorList) if tensor is not None]
+    if len(indexes) > 0:
+        for idx, value in zip(indexes, torch.stack([tensorList[idx].detach() for idx in indexes]).tolist()):
+            values[idx] = value
+    return values
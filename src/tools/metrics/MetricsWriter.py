@@ -0,0 +1,222 @@
+# -*- coding: utf8 -*-
+
+import csv
+import glob
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+
+class MetricsWriter:
+    """
+    Stream of metrics records (dictionaries with a "kind" : "train", "timers", "calibration", "test"...) written in files by a
+    background thread, so the training loop never waits for the disk.
+    Records are buffered and written every flushInterval seconds or when bufferSize records are waiting.
+    Files are rotated when they exceed maxFileBytes : path.00000.jsonl, path.00001.jsonl... in JSON lines format, or
+    path_<kind>.00000.csv... in CSV format (one file per kind, columns are the keys of the records of the kind : a record with new keys
+    starts a new file whose header has the columns of the previous file and the new keys).
+    Several writers (e.g. the stages of a run) can use the same path one after the other : each one starts a new file.
+    Disabled if path is empty : then write returns immediately. Use loadMetrics to read the records of a run
+    """
+
+    FORMATS = ("jsonl", "csv")
+
+    def __init__(self, path="", fileFormat="jsonl", bufferSize=1024, flushInterval=5, maxFileBytes=64 * 1024 * 1024, maxFiles=0):
+        """
+        :param path: Path of the files without extension (e.g. "runs/train_metrics"). If empty, the writer is disabled
+        :param fileFormat: "jsonl" or "csv"
+        :param bufferSize: Count of waiting records triggering a write
+        :param flushInterval: Maximum time in seconds between two writes of waiting records
+        :param maxFileBytes: Size above which a new file is started
+        :param maxFiles: If > 0, maximum count of files of each stream : oldest files are deleted
+        """
+        if fileFormat not in self.FORMATS:
+            raise ValueError("Metrics format ", fileFormat, " not supported")
+        self.enabled = path != ""
+        self.path = path
+        self.fileFormat = fileFormat
+        self.bufferSize = bufferSize
+        self.flushInterval = flushInterval
+        self.maxFileBytes = maxFileBytes
+        self.maxFiles = maxFiles
+        self.recordsCount = 0 # Count of records written in files
+
+        self._buffer = []
+        self._condition = threading.Condition()
+        self._running = self.enabled
+        self._streams = {} # Key = stream name (kind in CSV format, "" in JSON lines format) ; value = dictionary with file, segment, columns
+        self._thread = None
+        if self.enabled:
+            directory = os.path.dirname(path)
+            if directory != "":
+                os.makedirs(directory, exist_ok=True)
+            self._thread = threading.Thread(target=self._run, name="MetricsWriter", daemon=True)
+            self._thread.start()
+
+
+    def write(self, kind, **values):
+        """
+        Add a record. Only appends to the buffer : files are written by the background thread
+        :param kind: Kind of the record, e.g. "train"
+        :param values: Values of the record (numbers or strings)
+        """
+        if not self.enabled:
+            return
+        values["kind"] = kind
+        values["time"] = time.time()
+        with self._condition:
+            self._buffer.append(values)
+            if len(self._buffer) >= self.bufferSize:
+                self._condition.notify()
+
+
+    def writeTimers(self, instrumentation, stage):
+        """
+        Add a "timers" record for each span timer of an Instrumentation, and a "counters" record with its counters
+        :param stage: Name of the stage, added to the records
+        """
+        if not self.enabled:
+            return
+        for name, spanTimer in list(instrumentation.timers.items()):
+            self.write("timers", stage=stage, name=name, **spanTimer.summary())
+        if len(instrumentation.counters) > 0:
+            self.write("counters", stage=stage, **instrumentation.counters)
+
+
+    def _run(self):
+        while True:
+            with self._condition:
+                if self._running and len(self._buffer) < self.bufferSize:
+                    self._condition.wait(self.flushInterval)
+                records = self._buffer
+                self._buffer = []
+                running = self._running
+            if len(records) > 0:
+                self._writeRecords(records)
+            if not running:
+                return
+
+
+    def _writeRecords(self, records):
+        for record in records:
+            streamName = record["kind"] if self.fileFormat == "csv" else ""
+            stream = self._streams.get(streamName)
+            if stream is None:
+                # Files of previous runs or stages with the same path are kept : numbering continues after them
+                existingPaths = glob.glob(_segmentPattern(self.path, self.fileFormat, streamName))
+                lastSegment = max((int(existingPath.rsplit(".", 2)[1]) for existingPath in existingPaths), default=-1)
+                stream = {"file": None, "segment": lastSegment, "columns": None}
+                self._streams[streamName] = stream
+            newColumns = self.fileFormat == "csv" and stream["columns"] is not None and any(key not in stream["columns"] for key in record)
+            if stream["file"] is None or stream["file"].tell() >= self.maxFileBytes or newColumns:
+                self._nextFile(streamName, stream, record)
+
+            if self.fileFormat == "jsonl":
+                stream["file"].write(json.dumps(record) + "\n")
+            else:
+                missingColumns = [key for key in record if key not in stream["columns"]]
+                if len(missingColumns) > 0:
+                    raise ValueError("Values ", missingColumns, " of record ", streamName, " not in the columns of the file")
+                stream["writer"].writerow([record.get(column, "") for column in stream["columns"]])
+        for stream in self._streams.values():
+            stream["file"].flush()
+        self.recordsCount += len(records)
+
+
+    def _nextFile(self, streamName, stream, record):
+        if stream["file"] is not None:
+            stream["file"].close()
+        stream["segment"] += 1
+        stream["file"] = open(_segmentPath(self.path, self.fileFormat, streamName, stream["segment"]), "w", newline="")
+        if self.fileFormat == "csv":
+            # Columns of the previous file of the kind, then the new keys of the record
+            if stream["columns"] is None:
+                stream["columns"] = []
+            stream["columns"] = stream["columns"] + [key for key in record if key not in stream["columns"]]
+            stream["writer"] = csv.writer(stream["file"])
+            stream["writer"].writerow(stream["columns"])
+
+        if self.maxFiles > 0 and stream["segment"] >= self.maxFiles:
+            oldPath = _segmentPath(self.path, self.fileFormat, streamName, stream["segment"] - self.maxFiles)
+            if os.path.isfile(oldPath):
+                os.remove(oldPath)
+
+
+    def close(self):
+        """
+        Write the waiting records and stop the background thread
+        """
+        if not self.enabled:
+            return
+        with self._condition:
+            self._running = False
+            self._condition.notify_all()
+        self._thread.join()
+        for stream in self._streams.values():
+            stream["file"].close()
+        self.enabled = False
+
+
+def _segmentPath(path, fileFormat, streamName, segment):
+    if fileFormat == "csv":
+        return path + "_" + streamName + "." + "{:05d}".format(segment) + ".csv"
+    return path + "." + "{:05d}".format(segment) + ".jsonl"
+
+
+def _segmentPattern(path, fileFormat, streamName):
+    """
+    :return: Glob pattern of all the files of a stream
+    """
+    if fileFormat == "csv":
+        return glob.escape(path + "_" + streamName) + ".[0-9][0-9][0-9][0-9][0-9].csv"
+    return glob.escape(path) + ".[0-9][0-9][0-9][0-9][0-9].jsonl"
+
+
+def loadMetrics(path, kind):
+    """
+    Load the records of one kind written by a MetricsWriter (all rotated files, in order)
+    :param path: Path given to the MetricsWriter
+    :param kind: Kind of the records to load, e.g. "train"
+    :return: Dictionary : key = name of the value ; value = NumPy array with one element per record (float64, or object for strings).
+             Missing values are NaN (or None for strings)
+    """
+    records = []
+    jsonLinesPaths = sorted(glob.glob(_segmentPattern(path, "jsonl", "")))
+    csvPaths = sorted(glob.glob(_segmentPattern(path, "csv", kind)))
+    for jsonLinesPath in jsonLinesPaths:
+        with open(jsonLinesPath, "r") as jsonLinesFile:
+            for jsonLine in jsonLinesFile:
+                record = json.loads(jsonLine)
+                if record.get("kind") == kind:
+                    records.append(record)
+    for csvPath in csvPaths:
+        with open(csvPath, "r", newline="") as csvFile:
+            for record in csv.DictReader(csvFile):
+                records.append({key: _csvValue(value) for key, value in record.items()})
+
+    columns = []
+    for record in records:
+        for key in record:
+            if key not in columns:
+                columns.append(key)
+    metrics = {}
+    for column in columns:
+        values = [record.get(column) for record in records]
+        numeric = all(value is None or isinstance(value, (int, float, bool)) for value in values)
+        if numeric:
+            metrics[column] = np.asarray([np.nan if value is None else value for value in values], dtype=np.float64)
+        else:
+            metrics[column] = np.asarray(values, dtype=object)
+    return metrics
+
+
+def _csvValue(value):
+    if value == "":
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return value
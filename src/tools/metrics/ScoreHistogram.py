@@ -0,0 +1,239 @@
+# -*- coding: utf8 -*-
+
+import numpy as np
+
+
+class ScoreHistogram:
+    """
+    Histograms of the scores of negative and positive lines on fixed bins. Histograms with the same bins can be merged,
+    so scores of several shards or days can be evaluated together without keeping the scores.
+    Points of the curves are calculated at bin edges, where they are exact. Inside a bin, the order of negative and positive lines is unknown,
+    which gives the bounds of the areas under the curves and of the best fmeasure
+    Bins are uniform on the scores (linear scale) or on sign(score) * log(1 + |score| / linearWidth) (symlog scale).
+    Scores lower than minScore or greater than maxScore are counted in two extra bins
+    """
+
+    SCALES = ("linear", "symlog")
+
+    def __init__(self, minScore=-1e7, maxScore=1e7, binCount=8192, scale="symlog", linearWidth=1.0, positiveValue=1):
+        """
+        :param minScore: Lower edge of the first bin
+        :param maxScore: Upper edge of the last bin
+        :param binCount: Count of bins between minScore and maxScore
+        :param scale: Scale of the bins. Must be in SCALES
+        :param linearWidth: Scores between -linearWidth and linearWidth are in the almost linear part of the symlog scale
+        :param positiveValue: The value considered as positive value for metrics calculation
+        """
+        if scale not in self.SCALES:
+            raise ValueError("Histogram scale ", scale, " not supported")
+        if not minScore < maxScore:
+            raise ValueError("minScore must be lower than maxScore")
+
+        self.minScore = float(minScore)
+        self.maxScore = float(maxScore)
+        self.binCount = int(binCount)
+        self.scale = scale
+        self.linearWidth = float(linearWidth)
+        self.positiveValue = positiveValue
+
+        # Line 0 : negative lines. Line 1 : positive lines. Column 0 : lower than minScore. Last column : greater or equal to maxScore
+        self.histogramCounts = np.zeros((2, self.binCount + 2), dtype=np.int64)
+
+
+    def _transform(self, scores):
+        if self.scale == "linear":
+            return scores
+        return np.sign(scores) * np.log1p(np.abs(scores) / self.linearWidth)
+
+
+    def _inverseTransform(self, values):
+        if self.scale == "linear":
+            return values
+        return np.sign(values) * np.expm1(np.abs(values)) * self.linearWidth
+
+
+    def binEdges(self):
+        """
+        :return: numpy array with the binCount + 1 edges between minScore and maxScore
+        """
+        transformedEdges = np.linspace(self._transform(np.float64(self.minScore)), self._transform(np.float64(self.maxScore)), self.binCount + 1)
+        edges = self._inverseTransform(transformedEdges)
+        edges[0] = self.minScore
+        edges[-1] = self.maxScore
+        return edges
+
+
+    def add(self, scores, labels):
+        """
+        :param scores: numpy array (or list, or tensor on CPU) with the score of each line
+        :param labels: Gold value of each line
+        """
+        scores = np.asarray(scores, dtype=np.float64).reshape(-1)
+        positives = (np.asarray(labels).reshape(-1) == self.positiveValue).astype(np.int64)
+
+        transformedMin = self._transform(np.float64(self.minScore))
+        transformedMax = self._transform(np.float64(self.maxScore))
+        binWidth = (transformedMax - transformedMin) / self.binCount
+        binIdx = np.floor((self._transform(scores) - transformedMin) / binWidth).astype(np.int64) + 1
+        binIdx = np.clip(binIdx, 0, self.binCount + 1)
+        # Rounding of the transformation must not move a score on the wrong side of the range limits
+        binIdx[scores < self.minScore] = 0
+        binIdx[scores >= self.maxScore] = self.binCount + 1
+        binIdx[(scores >= self.minScore) & (binIdx == 0)] = 1
+        binIdx[(scores < self.maxScore) & (binIdx == self.binCount + 1)] = self.binCount
+
+        np.add.at(self.histogramCounts, (positives, binIdx), 1)
+
+
+    def sameBins(self, other):
+        """
+        :return: True if other has the same bins. Only histograms with the same bins can be merged
+        """
+        return (self.minScore, self.maxScore, self.binCount, self.scale, self.linearWidth, self.positiveValue) == \
+               (other.minScore, other.maxScore, other.binCount, other.scale, other.linearWidth, other.positiveValue)
+
+
+    def merge(self, other):
+        """
+        Add the counts of another histogram to this histogram
+        :param other: ScoreHistogram with the same bins
+        :return: This histogram
+        """
+        if not self.sameBins(other):
+            raise ValueError("Histograms with different bins can't be merged")
+        self.histogramCounts += other.histogramCounts
+        return self
+
+
+    @staticmethod
+    def mergeFiles(histogramPaths):
+        """
+        :param histogramPaths: Paths of histograms saved with the same bins
+        :return: ScoreHistogram with the counts of all the histograms
+        """
+        mergedHistogram = None
+        for histogramPath in histogramPaths:
+            histogram = ScoreHistogram.load(histogramPath)
+            if mergedHistogram is None:
+                mergedHistogram = histogram
+            else:
+                mergedHistogram.merge(histogram)
+        return mergedHistogram
+
+
+    def save(self, histogramPath):
+        """
+        :param histogramPath: Path of the file (numpy .npz format)
+        """
+        with open(histogramPath, "wb") as histogramFile:
+            np.savez_compressed(histogramFile, histogramCounts=self.histogramCounts,
+                                parameters=np.array([self.minScore, self.maxScore, self.binCount, self.linearWidth, self.positiveValue], dtype=np.float64),
+                                scale=np.array(self.scale))
+
+
+    @staticmethod
+    def load(histogramPath):
+        """
+        :param histogramPath: Path of a file written by save
+        :return: ScoreHistogram
+        """
+        with np.load(histogramPath) as savedHistogram:
+            minScore, maxScore, binCount, linearWidth, positiveValue = savedHistogram["parameters"].tolist()
+            histogram = ScoreHistogram(minScore, maxScore, int(binCount), str(savedHistogram["scale"]), linearWidth, int(positiveValue))
+            histogram.histogramCounts = savedHistogram["histogramCounts"].astype(np.int64)
+        return histogram
+
+
+    def _curvePoints(self, negativeCounts, positiveCounts):
+        """
+        Points of the curves when the lines of each group of counts are predicted negative one group after the other
+        :return: truePositive, falsePositive, falseNegative, trueNegative, precision, recall, falsePositiveRate
+        """
+        positiveCount = int(np.sum(positiveCounts))
+        negativeCount = int(np.sum(negativeCounts))
+        truePositive = np.concatenate(([positiveCount], positiveCount - np.cumsum(positiveCounts)))
+        falsePositive = np.concatenate(([negativeCount], negativeCount - np.cumsum(negativeCounts)))
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            precision = truePositive / (truePositive + falsePositive)
+            recall = truePositive / np.float64(positiveCount)
+            falsePositiveRate = falsePositive / np.float64(negativeCount)
+
+        return truePositive, falsePositive, positiveCount - truePositive, negativeCount - falsePositive, precision, recall, falsePositiveRate
+
+
+    @staticmethod
+    def _area(pointsY, pointsX):
+        # Trapezoidal rule on points sorted by x (points with the same x keep their order). Not calculable values are 0
+        pointsX = np.nan_to_num(pointsX, nan=0.0)
+        pointsY = np.nan_to_num(pointsY, nan=0.0)
+        sortOrder = np.argsort(pointsX, kind="stable")
+        pointsX = pointsX[sortOrder]
+        pointsY = pointsY[sortOrder]
+        return float(np.sum(np.diff(pointsX) * (pointsY[1:] + pointsY[:-1]) / 2))
+
+
+    def _orderedCounts(self, positivesFirst):
+        """
+        Split each bin in two groups to get the extreme orders of the lines inside bins
+        :param positivesFirst: If True, positive lines of a bin have lower scores than negative lines (worst case)
+        """
+        negativeCounts, positiveCounts = self.histogramCounts
+        zeros = np.zeros_like(negativeCounts)
+        if positivesFirst:
+            return np.stack((zeros, negativeCounts), 1).reshape(-1), np.stack((positiveCounts, zeros), 1).reshape(-1)
+        return np.stack((negativeCounts, zeros), 1).reshape(-1), np.stack((zeros, positiveCounts), 1).reshape(-1)
+
+
+    def curve(self):
+        """
+        Calculate the points of the curves at bin edges. First point predicts all lines as positive. Then, for each bin,
+        there is a point predicting as positive the lines of the next bins
+        :return: Dictionary with the same keys as Graphs.calculateCurveSort (thresholds are bin edges, lines with a greater or equal score are positive)
+                 and the bounds of the areas : precisionRecallAucBounds, rocAucBounds (tuples (lower, upper))
+        """
+        negativeCounts, positiveCounts = self.histogramCounts
+        truePositive, falsePositive, falseNegative, trueNegative, precision, recall, falsePositiveRate = self._curvePoints(negativeCounts, positiveCounts)
+        thresholds = np.concatenate(([-np.inf], self.binEdges(), [np.inf]))
+
+        curve = {"thresholds": thresholds, "truePositive": truePositive, "falsePositive": falsePositive,
+                 "falseNegative": falseNegative, "trueNegative": trueNegative,
+                 "precision": precision, "recall": recall, "falsePositiveRate": falsePositiveRate}
+        curve["precisionRecallAuc"] = self._area(precision, recall)
+        curve["rocAuc"] = self._area(recall, falsePositiveRate)
+
+        # Bounds with the worst and the best order of the lines inside bins
+        precisionRecallAucBounds = []
+        rocAucBounds = []
+        for positivesFirst in (True, False):
+            orderedPoints = self._curvePoints(*self._orderedCounts(positivesFirst))
+            precisionRecallAucBounds.append(self._area(orderedPoints[4], orderedPoints[5]))
+            rocAucBounds.append(self._area(orderedPoints[5], orderedPoints[6]))
+        curve["precisionRecallAucBounds"] = tuple(precisionRecallAucBounds)
+        curve["rocAucBounds"] = tuple(rocAucBounds)
+
+        return curve
+
+
+    def bestFmeasure(self):
+        """
+        :return: Best fmeasure at a bin edge, threshold of this fmeasure (lines with a greater or equal score are positive),
+                 upper bound of the best fmeasure with any threshold, width of the bin after the threshold
+        """
+        curve = self.curve()
+        truePositive = curve["truePositive"]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            fmeasures = np.nan_to_num(2 * truePositive / (2 * truePositive + curve["falsePositive"] + curve["falseNegative"]), nan=0.0)
+        bestIdx = int(np.argmax(fmeasures))
+
+        orderedPoints = self._curvePoints(*self._orderedCounts(False))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            upperFmeasures = np.nan_to_num(2 * orderedPoints[0] / (2 * orderedPoints[0] + orderedPoints[1] + orderedPoints[2]), nan=0.0)
+
+        thresholds = curve["thresholds"]
+        binWidth = thresholds[bestIdx + 1] - thresholds[bestIdx] if bestIdx + 1 < thresholds.shape[0] else np.inf
+        return float(fmeasures[bestIdx]), float(thresholds[bestIdx]), float(np.max(upperFmeasures)), float(binWidth)
+
+
+    def __len__(self):
+        return int(np.sum(self.histogramCounts))
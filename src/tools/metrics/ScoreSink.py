@@ -0,0 +1,148 @@
+# -*- coding: utf8 -*-
+
+import os
+from collections import Counter
+
+import numpy as np
+
+
+class ScoreSink:
+    """
+    Stores the score, the gold label and an id of each scored line in compact NumPy buffers (float32, int8 and int64)
+    Buffers are kept in memory and grown when needed, or written in files read back as memory-mapped arrays
+    """
+
+    def __init__(self, initialCapacity=65536, spillDirectory=None, spillPrefix="scores"):
+        """
+        :param initialCapacity: Number of lines of the buffers before the first growth (in memory) or before writing them in files (spilling)
+        :param spillDirectory: If not None, directory where buffers are written. Memory used is then constant
+        :param spillPrefix: Prefix of the files written in spillDirectory
+        """
+        self.spillDirectory = spillDirectory
+        self.count = 0 # Count of lines stored
+
+        self._scores = np.empty(initialCapacity, dtype=np.float32)
+        self._labels = np.empty(initialCapacity, dtype=np.int8)
+        self._lineIds = np.empty(initialCapacity, dtype=np.int64)
+        self._bufferCount = 0 # Count of lines in the buffers (different from count when spilling)
+
+        self._spillFiles = None
+        self.spillPaths = None
+        if spillDirectory is not None:
+            self.spillPaths = {
+                "scores": os.path.join(spillDirectory, spillPrefix + "_scores.f32"),
+                "labels": os.path.join(spillDirectory, spillPrefix + "_labels.i8"),
+                "lineIds": os.path.join(spillDirectory, spillPrefix + "_lineIds.i64")
+            }
+            self._spillFiles = {name: open(path, "wb") for name, path in self.spillPaths.items()}
+
+
+    def append(self, scores, labels, lineIds=None):
+        """
+        Add scored lines
+        :param scores: Scores of the lines (numpy array, list or tensor on CPU)
+        :param labels: Gold labels of the lines
+        :param lineIds: Ids of the lines. If None, lines are numbered in their order of addition
+        """
+        scores = np.asarray(scores, dtype=np.float32).reshape(-1)
+        labels = np.asarray(labels, dtype=np.int8).reshape(-1)
+        if lineIds is None:
+            lineIds = np.arange(self.count, self.count + scores.shape[0], dtype=np.int64)
+        else:
+            lineIds = np.asarray(lineIds, dtype=np.int64).reshape(-1)
+
+        if not scores.shape[0] == labels.shape[0] == lineIds.shape[0]:
+            raise ValueError("Scores, labels and line ids have different sizes")
+
+        newCount = self._bufferCount + scores.shape[0]
+        if newCount > self._scores.shape[0]:
+            if self._spillFiles is not None:
+                self.flush()
+                newCount = scores.shape[0]
+            if newCount > self._scores.shape[0]:
+                self._grow(newCount)
+
+        self._scores[self._bufferCount:newCount] = scores
+        self._labels[self._bufferCount:newCount] = labels
+        self._lineIds[self._bufferCount:newCount] = lineIds
+        self._bufferCount = newCount
+        self.count += scores.shape[0]
+
+
+    def _grow(self, minCapacity):
+        capacity = max(minCapacity, 2 * self._scores.shape[0])
+        for name in ("_scores", "_labels", "_lineIds"):
+            oldBuffer = getattr(self, name)
+            newBuffer = np.empty(capacity, dtype=oldBuffer.dtype)
+            newBuffer[:self._bufferCount] = oldBuffer[:self._bufferCount]
+            setattr(self, name, newBuffer)
+
+
+    def flush(self):
+        """
+        Write the buffers in files when spilling. Nothing is done when buffers are in memory
+        """
+        if self._spillFiles is None:
+            return
+        self._scores[:self._bufferCount].tofile(self._spillFiles["scores"])
+        self._labels[:self._bufferCount].tofile(self._spillFiles["labels"])
+        self._lineIds[:self._bufferCount].tofile(self._spillFiles["lineIds"])
+        for spillFile in self._spillFiles.values():
+            spillFile.flush()
+        self._bufferCount = 0
+
+
+    def close(self):
+        """
+        Write remaining lines and close the files when spilling. Stored values can still be read
+        """
+        if self._spillFiles is not None:
+            self.flush()
+            for spillFile in self._spillFiles.values():
+                spillFile.close()
+            self._spillFiles = None
+
+
+    def _getArray(self, name, dtype):
+        if self.spillPaths is None:
+            return getattr(self, "_" + name)[:self.count]
+
+        self.flush()
+        if self.count == 0:
+            return np.empty(0, dtype=dtype)
+        return np.memmap(self.spillPaths[name], dtype=dtype, mode="r", shape=(self.count,))
+
+
+    def _getScores(self):
+        return self._getArray("scores", np.float32)
+
+    def _getLabels(self):
+        return self._getArray("labels", np.int8)
+
+    def _getLineIds(self):
+        return self._getArray("lineIds", np.int64)
+
+
+    def labelCounts(self):
+        """
+        :return: Counter with the count of lines of each label
+        """
+        values, counts = np.unique(self.labels, return_counts=True)
+        return Counter({int(value): int(count) for value, count in zip(values, counts)})
+
+
+    def __len__(self):
+        return self.count
+
+    def __getstate__(self):
+        # Pickled sink contains the values in memory only
+        return {"spillDirectory": None, "count": self.count, "_scores": np.array(self.scores), "_labels": np.array(self.labels),
+                "_lineIds": np.array(self.lineIds), "_bufferCount": self.count, "_spillFiles": None, "spillPaths": None}
+
+    """ -------------------------------
+                Properties definition
+        -------------------------------
+    """
+    scores = property(_getScores)
+    labels = property(_getLabels)
+    lineIds = property(_getLineIds)
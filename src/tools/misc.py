@@ -4,6 +4,8 @@ import logging
 import os
 import pickle
 
+import numpy as np
+
 from src.tools.WordDictionary import WordDictionary
 
 """
@@ -81,4 +83,31 @@ def loadVocabularyFromCache(cachePath, corpus):
     if not os.path.isfile(cachePath):
         raise FileNotFoundError("Vocabulary cache file doesn't exists : ", cachePath)
 
-    return loadVocabulary("", True, cachePath, corpus, False)
\ No newline at end of file
+    return loadVocabulary("", True, cachePath, corpus, False)
+
+"""
+******************************************
+                Statistics
+******************************************
+"""
+def weightedQuantile(values, counts, quantile):
+    """
+    Quantile of values where each value is repeated counts times.
+    Result is the same as numpy.quantile (linear interpolation) on the array with repeated values
+
+    :param values: (numpy.ndarray) Values
+    :param counts: (numpy.ndarray) Positive integer count of each value
+    :param quantile: (float) Quantile to compute, between 0 and 1
+    :return: (float) The quantile
+    """
+    order = np.argsort(values, kind="stable")
+    sortedValues = values[order]
+    cumulativeCounts = np.cumsum(counts[order])
+
+    # Position of the quantile in the repeated sorted values, then index of the values at the two surrounding positions
+    position = (cumulativeCounts[-1] - 1) * quantile
+    lowPosition = np.floor(position)
+    lowIdx = np.searchsorted(cumulativeCounts, lowPosition, side="right")
+    highIdx = np.searchsorted(cumulativeCounts, np.ceil(position), side="right")
+
+    return sortedValues[lowIdx] + (sortedValues[highIdx] - sortedValues[lowIdx]) * (position - lowPosition)
@@ -0,0 +1,79 @@
+# -*- coding: utf8 -*-
+
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+
+class LatencyStats:
+    """
+    Latencies of the last requests and throughput counters of a long-running service. Thread safe
+    """
+
+    def __init__(self, windowSize=10000):
+        """
+        :param windowSize: Count of last requests used to calculate the latency percentiles
+        """
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=windowSize)
+        self._batchSizes = deque(maxlen=windowSize)
+        self._startTime = time.perf_counter()
+
+        # Counters since the start of the service
+        self.requestCount = 0
+        self.lineCount = 0
+        self.batchCount = 0
+        self.shedRequestCount = 0
+        self.shedLineCount = 0
+
+
+    def addRequest(self, latency, lineCount):
+        """
+        :param latency: Time in seconds between the reception of the request and its result
+        :param lineCount: Count of lines in the request
+        """
+        with self._lock:
+            self._latencies.append(latency)
+            self.requestCount += 1
+            self.lineCount += lineCount
+
+
+    def addBatch(self, batchSize):
+        """
+        :param batchSize: Count of lines scored in one call of the model
+        """
+        with self._lock:
+            self._batchSizes.append(batchSize)
+            self.batchCount += 1
+
+
+    def addShed(self, lineCount):
+        """
+        :param lineCount: Count of lines of a request rejected because the queue is full
+        """
+        with self._lock:
+            self.shedRequestCount += 1
+            self.shedLineCount += lineCount
+
+
+    def summary(self):
+        """
+        :return: Dictionary with the counters, the throughputs (per second since the start) and the latency percentiles (in milliseconds)
+        """
+        with self._lock:
+            latencies = np.array(self._latencies, dtype=np.float64) * 1000
+            batchSizes = np.array(self._batchSizes, dtype=np.float64)
+            uptime = time.perf_counter() - self._startTime
+            summary = {"uptime": uptime, "requestCount": self.requestCount, "lineCount": self.lineCount, "batchCount": self.batchCount,
+                       "shedRequestCount": self.shedRequestCount, "shedLineCount": self.shedLineCount,
+                       "requestsPerSecond": self.requestCount / uptime, "linesPerSecond": self.lineCount / uptime}
+
+        if latencies.shape[0] > 0:
+            summary["latencyP50"], summary["latencyP99"] = (float(value) for value in np.percentile(latencies, [50, 99]))
+            summary["latencyMax"] = float(np.max(latencies))
+        else:
+            summary["latencyP50"] = summary["latencyP99"] = summary["latencyMax"] = 0.0
+        summary["meanBatchSize"] = float(np.mean(batchSizes)) if batchSizes.shape[0] > 0 else 0.0
+        return summary
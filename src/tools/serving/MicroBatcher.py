@@ -0,0 +1,128 @@
+# -*- coding: utf8 -*-
+
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+import torch
+
+
+class MicroBatcher:
+    """
+    Group the lines of concurrent requests in batches scored by one call of the model.
+    A batch is scored when it has maxBatchSize lines, or when its oldest request waited maxDelay seconds.
+    Requests are queued up to maxQueueLines lines : when the queue is full, new requests are rejected (load shedding)
+    instead of increasing the latency of all the requests
+    """
+
+    def __init__(self, scoreFunction, maxBatchSize=1024, maxDelay=0.005, maxQueueLines=65536, latencyStats=None):
+        """
+        :param scoreFunction: Function scoring a tensor of encoded lines (n, lineLength) and returning (tensor (lineLength, n), tensor (n)),
+                              like AnomalyScorer.score. Only called by the batching thread
+        :param maxBatchSize: Maximum count of lines scored in one call. A larger request is scored alone
+        :param maxDelay: Maximum time in seconds a request waits for other requests before its batch is scored
+        :param maxQueueLines: Maximum count of lines waiting to be scored
+        :param latencyStats: LatencyStats updated with each request and batch. If None, no statistics
+        """
+        self.scoreFunction = scoreFunction
+        self.maxBatchSize = maxBatchSize
+        self.maxDelay = maxDelay
+        self.maxQueueLines = maxQueueLines
+        self.latencyStats = latencyStats
+
+        self._condition = threading.Condition()
+        self._queue = deque() # Tuples (tensor of encoded lines, future, submit time)
+        self._queueLines = 0
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="MicroBatcher", daemon=True)
+        self._thread.start()
+
+
+    def submit(self, inputTensor):
+        """
+        Queue lines to score
+        :param inputTensor: Tensor of encoded lines with shape (n, lineLength)
+        :return: Future of the result (tensor (lineLength, n) with the score of each word, tensor (n) with the score of each line),
+                 or None if the queue is full and the request is rejected
+        """
+        lineCount = inputTensor.size(0)
+        with self._condition:
+            if not self._running:
+                raise RuntimeError("Micro batcher is closed")
+            if self._queueLines > 0 and self._queueLines + lineCount > self.maxQueueLines:
+                if self.latencyStats is not None:
+                    self.latencyStats.addShed(lineCount)
+                return None
+            future = Future()
+            self._queue.append((inputTensor, future, time.perf_counter()))
+            self._queueLines += lineCount
+            self._condition.notify()
+        return future
+
+
+    def _nextBatch(self):
+        """
+        Wait for the requests of the next batch
+        :return: List of requests, empty if the batcher is closed
+        """
+        with self._condition:
+            while self._running and len(self._queue) == 0:
+                self._condition.wait()
+            if len(self._queue) == 0:
+                return []
+
+            # Wait for other requests until the batch is full or the oldest request reached its deadline
+            deadline = self._queue[0][2] + self.maxDelay
+            while self._running and self._queueLines < self.maxBatchSize:
+                remainingTime = deadline - time.perf_counter()
+                if remainingTime <= 0:
+                    break
+                self._condition.wait(remainingTime)
+
+            requests = [self._queue.popleft()]
+            batchSize = requests[0][0].size(0)
+            while len(self._queue) > 0 and batchSize + self._queue[0][0].size(0) <= self.maxBatchSize:
+                requests.append(self._queue.popleft())
+                batchSize += requests[-1][0].size(0)
+            self._queueLines -= batchSize
+            return requests
+
+
+    def _run(self):
+        while True:
+            requests = self._nextBatch()
+            if len(requests) == 0:
+                return
+
+            try:
+                inputTensor = torch.cat([request[0] for request in requests], 0)
+                with torch.no_grad():
+                    scoresListTensor, scoresSum = self.scoreFunction(inputTensor)
+            except Exception as exception:
+                for _, future, _ in requests:
+                    future.set_exception(exception)
+                continue
+
+            if self.latencyStats is not None:
+                self.latencyStats.addBatch(inputTensor.size(0))
+
+            # Split the results of the batch between the requests
+            start = 0
+            stopTime = time.perf_counter()
+            for requestTensor, future, submitTime in requests:
+                end = start + requestTensor.size(0)
+                future.set_result((scoresListTensor[:, start:end], scoresSum[start:end]))
+                if self.latencyStats is not None:
+                    self.latencyStats.addRequest(stopTime - submitTime, end - start)
+                start = end
+
+
+    def close(self):
+        """
+        Score the queued requests and stop the batching thread
+        """
+        with self._condition:
+            self._running = False
+            self._condition.notify_all()
+        self._thread.join()
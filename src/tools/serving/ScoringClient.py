@@ -0,0 +1,55 @@
+# -*- coding: utf8 -*-
+
+import json
+import socket
+
+
+class ScoringClient:
+    """
+    Client of a scoring server
+    """
+
+    def __init__(self, socketPath="", host="127.0.0.1", port=0, timeout=None):
+        """
+        :param socketPath: Path of the Unix domain socket of the server. If empty, the server is reached with TCP
+        :param host: Host of the TCP server
+        :param port: Port of the TCP server
+        :param timeout: Timeout in seconds of the socket operations. If None, no timeout
+        """
+        if socketPath != "":
+            self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self._socket.settimeout(timeout)
+            self._socket.connect(socketPath)
+        else:
+            self._socket = socket.create_connection((host, port), timeout)
+        self._file = self._socket.makefile("rwb")
+
+
+    def request(self, request):
+        """
+        :param request: Dictionary sent as JSON
+        :return: Dictionary of the JSON response
+        """
+        self._file.write((json.dumps(request) + "\n").encode("utf8"))
+        self._file.flush()
+        return json.loads(self._file.readline())
+
+
+    def scoreLines(self, lines):
+        """
+        :param lines: List of raw LANL lines
+        :return: List of scores and list of anomaly flags (None for invalid lines). Raise RuntimeError if the server returned an error
+        """
+        response = self.request({"lines": lines})
+        if "error" in response:
+            raise RuntimeError("Scoring server error : " + response["error"])
+        return response["scores"], response["anomalies"]
+
+
+    def stats(self):
+        return self.request({"command": "stats"})
+
+
+    def close(self):
+        self._file.close()
+        self._socket.close()
@@ -0,0 +1,56 @@
+# -*- coding: utf8 -*-
+
+
+class EarlyStopping:
+    """
+    Watches the dev loss of one word model and decides when its training can be stopped
+    The state of the model giving the best dev loss is kept to be restored at the end of the training
+    """
+
+    def __init__(self, patience, minDelta=0.0):
+        """
+        :param patience: Number of dev evaluations without improvement before the model is considered converged. 0 disables stopping
+        :param minDelta: Minimum decrease of the dev loss to consider it as an improvement
+        """
+        self.patience = patience
+        self.minDelta = minDelta
+
+        self.bestLoss = float("inf")
+        self.bestEpoch = None
+        self.bestBatch = None
+        self.bestStateDict = None # Copy on CPU of the model parameters giving the best dev loss
+
+        self.evaluationsWithoutImprovement = 0
+        self.stopped = False # Indicates that the model has converged and must not be trained anymore
+
+
+    def update(self, devLoss, model, epoch, batchNum):
+        """
+        Update the state with a new dev loss
+        :param devLoss: float: Dev loss of the model
+        :param model: The model evaluated. Its parameters are saved if the dev loss is the best one
+        :param epoch: Current epoch number
+        :param batchNum: Current batch number
+        :return: True if the dev loss improved the best one, False otherwise
+        """
+        if devLoss < self.bestLoss - self.minDelta:
+            self.bestLoss = devLoss
+            self.bestEpoch = epoch
+            self.bestBatch = batchNum
+            self.bestStateDict = {name: tensor.detach().to("cpu", copy=True) for name, tensor in model.state_dict().items()}
+            self.evaluationsWithoutImprovement = 0
+            return True
+
+        self.evaluationsWithoutImprovement += 1
+        if self.patience > 0 and self.evaluationsWithoutImprovement >= self.patience:
+            self.stopped = True
+        return False
+
+
+    def restoreBest(self, model):
+        """
+        Load the best saved parameters in the model. Nothing is done if no dev loss has been given
+        :param model: The model to restore
+        """
+        if self.bestStateDict is not None:
+            model.load_state_dict(self.bestStateDict)
@@ -0,0 +1,106 @@
+# -*- coding: utf8 -*-
+
+from collections import OrderedDict
+
+import torch
+
+
+class ImportanceSampler:
+    """
+    Selects the lines of a training batch with a probability depending on their recent loss.
+    The loss of a line is estimated with the last losses observed for the same encoded line.
+    Each selected line must be weighted by the inverse of its selection probability to keep an unbiased gradient.
+    """
+
+    def __init__(self, minKeepProbability=0.1, lossSmoothing=0.5, meanLossSmoothing=0.99, maxEntries=5000000):
+        """
+        :param minKeepProbability: Minimum selection probability of a line, so that well predicted lines are still revisited
+        :param lossSmoothing: Weight of the previous estimate when a new loss is observed for a line (0 = keep only last loss)
+        :param meanLossSmoothing: Weight of the previous value of the mean loss when a new batch is observed
+        :param maxEntries: Maximum count of lines with a loss estimate. Least recently seen lines are forgotten first
+        """
+        if not 0 < minKeepProbability <= 1:
+            raise ValueError("minKeepProbability must be in ]0, 1]")
+
+        self.minKeepProbability = minKeepProbability
+        self.lossSmoothing = lossSmoothing
+        self.meanLossSmoothing = meanLossSmoothing
+        self.maxEntries = maxEntries
+
+        # Loss estimate of each encoded line. Key = bytes of the encoded line ; value = smoothed loss
+        self.lossEstimates = OrderedDict()
+        # Smoothed mean loss of the lines. Lines with an estimate greater than the mean are always selected
+        self.meanLoss = None
+
+        # Keys and weights of the lines returned by the last call to sample
+        self._selectedKeys = []
+        self._selectedWeights = []
+
+        # Statistics
+        self.linesCount = 0
+        self.selectedCount = 0
+
+
+    def sample(self, inputTensor):
+        """
+        Select lines of a batch. Lines never seen are always selected
+        :param inputTensor: Tensor of encoded lines with shape (batchSize, lineLength)
+        :return: Tensor with index of selected lines, tensor with weight (= 1 / selection probability) of selected lines
+        """
+        keys = [line.tobytes() for line in inputTensor.cpu().numpy()]
+
+        keepProbabilities = torch.ones(len(keys))
+        if self.meanLoss is not None and self.meanLoss > 0:
+            for idx, key in enumerate(keys):
+                estimate = self.lossEstimates.get(key)
+                if estimate is not None:
+                    keepProbabilities[idx] = estimate / self.meanLoss
+            keepProbabilities.clamp_(self.minKeepProbability, 1.0)
+
+        selectedMask = torch.rand(len(keys)) < keepProbabilities
+        selectedIdx = selectedMask.nonzero().view(-1)
+
+        self._selectedKeys = [keys[idx] for idx in selectedIdx.tolist()]
+        self.linesCount += len(keys)
+        self.selectedCount += len(self._selectedKeys)
+
+        weights = 1.0 / keepProbabilities[selectedIdx]
+        self._selectedWeights = weights.tolist()
+        return selectedIdx.to(inputTensor.device), weights.to(inputTensor.device)
+
+
+    def update(self, lineLossTensor):
+        """
+        Update loss estimates of the lines returned by the last call to sample
+        :param lineLossTensor: Tensor with the loss of each selected line (in the same order as returned by sample)
+        """
+        lineLosses = lineLossTensor.detach().cpu().tolist()
+        if len(lineLosses) == 0:
+            return
+
+        for key, loss in zip(self._selectedKeys, lineLosses):
+            estimate = self.lossEstimates.pop(key, None)
+            if estimate is None:
+                self.lossEstimates[key] = loss
+            else:
+                self.lossEstimates[key] = self.lossSmoothing * estimate + (1 - self.lossSmoothing) * loss
+
+        while len(self.lossEstimates) > self.maxEntries:
+            self.lossEstimates.popitem(last=False)
+
+        # Selected lines are weighted to estimate the mean loss of the whole batch
+        batchMeanLoss = sum(weight * loss for weight, loss in zip(self._selectedWeights, lineLosses)) / sum(self._selectedWeights)
+        if self.meanLoss is None:
+            self.meanLoss = batchMeanLoss
+        else:
+            self.meanLoss = self.meanLossSmoothing * self.meanLoss + (1 - self.meanLossSmoothing) * batchMeanLoss
+
+
+    def getSelectedRate(self):
+        """
+        :return: Ratio of lines selected since the creation of the sampler
+        """
+        try:
+            return round(self.selectedCount / self.linesCount, 6)
+        except ZeroDivisionError:
+            return 0
@@ -0,0 +1,104 @@
+# -*- coding: utf8 -*-
+
+import math
+
+
+class LearningRateScheduler:
+    """
+    Changes the learning rate of an optimizer during training
+    Available schedules :
+      - constant : learning rate is never changed
+      - warmup : learning rate grows linearly from 0 to its initial value during warmupSteps batches, then stays constant
+      - cosine : optional warmup, then learning rate decreases from its initial value to minLearningRate following a cosine during cycleSteps batches
+      - plateau : learning rate is multiplied by plateauFactor when the dev loss didn't improve during plateauPatience dev evaluations
+    """
+
+    SCHEDULES = ("constant", "warmup", "cosine", "plateau")
+
+    def __init__(self, optimizer, scheduleName="constant", warmupSteps=0, cycleSteps=0, minLearningRate=0.0, plateauFactor=0.5, plateauPatience=2):
+        """
+        :param optimizer: The optimizer whose learning rate is changed
+        :param scheduleName: Name of the schedule. Must be in SCHEDULES
+        :param warmupSteps: Number of batches of the warmup (warmup and cosine schedules)
+        :param cycleSteps: Number of batches of the cosine decrease, warmup excluded (cosine schedule)
+        :param minLearningRate: The learning rate is never lower than this value (cosine and plateau schedules)
+        :param plateauFactor: Factor applied to the learning rate when a plateau is detected (plateau schedule)
+        :param plateauPatience: Number of dev evaluations without improvement defining a plateau (plateau schedule)
+        """
+        if scheduleName not in self.SCHEDULES:
+            raise ValueError("Learning rate schedule ", scheduleName, " not supported")
+        if scheduleName == "cosine" and cycleSteps <= 0:
+            raise ValueError("Cosine schedule needs a positive cycleSteps")
+
+        self.optimizer = optimizer
+        self.scheduleName = scheduleName
+        self.warmupSteps = warmupSteps
+        self.cycleSteps = cycleSteps
+        self.minLearningRate = minLearningRate
+        self.plateauFactor = plateauFactor
+        self.plateauPatience = plateauPatience
+
+        self.baseLearningRates = [paramGroup["lr"] for paramGroup in self.optimizer.param_groups]
+        self.stepCount = 0
+
+        # Plateau detection
+        self.bestDevLoss = float("inf")
+        self.devEvaluationsWithoutImprovement = 0
+
+        # First batch of warmup must not use the full learning rate
+        if self.scheduleName in ("warmup", "cosine") and self.warmupSteps > 0:
+            self._setLearningRates([self._batchLearningRate(baseLr) for baseLr in self.baseLearningRates])
+
+
+    def stepBatch(self):
+        """
+        Update the learning rate after an optimizer step
+        """
+        if self.scheduleName in ("warmup", "cosine"):
+            self.stepCount += 1
+            self._setLearningRates([self._batchLearningRate(baseLr) for baseLr in self.baseLearningRates])
+
+
+    def stepDev(self, devLoss):
+        """
+        Update the learning rate after a dev evaluation
+        :param devLoss: float: Dev loss of the model
+        """
+        if self.scheduleName != "plateau":
+            return
+
+        if devLoss < self.bestDevLoss:
+            self.bestDevLoss = devLoss
+            self.devEvaluationsWithoutImprovement = 0
+        else:
+            self.devEvaluationsWithoutImprovement += 1
+            if self.devEvaluationsWithoutImprovement >= self.plateauPatience:
+                self._setLearningRates([max(paramGroup["lr"] * self.plateauFactor, self.minLearningRate) for paramGroup in self.optimizer.param_groups])
+                self.devEvaluationsWithoutImprovement = 0
+
+
+    def getLearningRate(self):
+        """
+        :return: The learning rate of the first parameter group of the optimizer
+        """
+        return self.optimizer.param_groups[0]["lr"]
+
+
+    def _batchLearningRate(self, baseLearningRate):
+        """
+        Calculate the learning rate for the current step of warmup and cosine schedules
+        """
+        if self.stepCount < self.warmupSteps:
+            return baseLearningRate * (self.stepCount + 1) / self.warmupSteps
+
+        if self.scheduleName == "warmup":
+            return baseLearningRate
+
+        # Cosine decrease after warmup. Learning rate stays at its minimum value once the cycle is over
+        progress = min((self.stepCount - self.warmupSteps) / self.cycleSteps, 1.0)
+        return self.minLearningRate + 0.5 * (baseLearningRate - self.minLearningRate) * (1 + math.cos(math.pi * progress))
+
+
+    def _setLearningRates(self, learningRates):
+        for paramGroup, learningRate in zip(self.optimizer.param_groups, learningRates):
+            paramGroup["lr"] = learningRate